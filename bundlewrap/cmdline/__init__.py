@@ -9,9 +9,10 @@ from traceback import format_exc
 
 
 from ..exceptions import NoSuchRepository, MissingRepoDependency
+from ..operations import log_session_stats
 from ..repo import Repository
 from ..utils.cmdline import suppress_broken_pipe_msg
-from ..utils.text import force_text, mark_for_translation as _, red
+from ..utils.text import force_text, mark_for_translation as _, red, yellow
 from ..utils.ui import io
 from .parser import build_parser_bw
 
@@ -44,6 +45,12 @@ def main(*args, **kwargs):
 
     environ.setdefault('BW_ADD_HOST_KEYS', "1" if pargs.add_ssh_host_keys else "0")
 
+    if environ.get('BW_SCP_ARGS', "").strip():
+        io.stderr(_(
+            "{x} BW_SCP_ARGS is no longer used since files are uploaded through ssh, "
+            "use BW_SSH_ARGS instead"
+        ).format(x=yellow("!")))
+
     if len(text_args) >= 1 and (
         text_args[0] == "--version" or
         (len(text_args) >= 2 and text_args[0] == "repo" and text_args[1] == "create") or
@@ -79,6 +86,7 @@ def main(*args, **kwargs):
     try:
         pargs.func(repo, text_pargs)
     finally:
+        log_session_stats()
         io.deactivate()
         if pargs.profile:
             profile.disable()
@@ -74,6 +74,7 @@ def bw_apply(repo, args):
                 'workers': args['item_workers'],
                 'add_lock_for_fixed_items': bool(args['expiry']),
                 'lock_expiry': args['expiry'],
+                'item_order': args['item_order'],
             },
         }
 
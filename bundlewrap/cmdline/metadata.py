@@ -1,9 +1,10 @@
 from contextlib import suppress
 from decimal import Decimal
+from json import dumps
 from sys import exit
 
 from ..exceptions import MetadataUnavailable
-from ..metadata import metadata_to_json
+from ..metadata import deepcopy_metadata, metadata_to_json
 from ..utils import Fault, list_starts_with
 from ..utils.cmdline import exit_on_keyboardinterrupt, get_target_nodes
 from ..utils.dicts import (
@@ -90,9 +91,60 @@ def _sort_dict_colorblind(old_dict):
     return new_dict
 
 
+PROFILE_COLUMNS = {
+    # column: (metagen attribute, format function)
+    'time': ('_reactor_durations', lambda value: "{:.3f}s".format(value)),
+    'runs': ('_reactor_runs', str),
+    'changes': ('_reactor_changes', str),
+    'unavailable': ('_reactor_keyerror_counts', str),
+    'bytes': ('_reactor_result_sizes', str),
+}
+
+
+def _bw_metadata_reactor_profile(repo, args, target_nodes):
+    repo._record_reactor_profile = True
+    repo._build_metadata_for_nodes(target_nodes)
+
+    profile = []
+    for node_name, reactor_name in repo._reactor_runs:
+        entry = {'node': node_name, 'reactor': reactor_name}
+        for column, attr_and_format in PROFILE_COLUMNS.items():
+            entry[column] = getattr(repo, attr_and_format[0])[(node_name, reactor_name)]
+        profile.append(entry)
+    # highest values first, ties ordered by node and reactor name
+    profile.sort(
+        key=lambda entry: (-entry[args['reactor_profile_sort']], entry['node'], entry['reactor']),
+    )
+
+    if args['reactor_profile_json']:
+        io.stdout(dumps(profile, indent=4))
+        return
+
+    table = [
+        [bold(_("node")), bold(_("reactor"))] +
+        [bold(column) for column in PROFILE_COLUMNS],
+        ROW_SEPARATOR,
+    ]
+    for entry in profile:
+        table.append(
+            [entry['node'], entry['reactor']] +
+            [
+                format_value(entry[column])
+                for column, (_attr, format_value) in PROFILE_COLUMNS.items()
+            ]
+        )
+    page_lines(render_table(
+        table,
+        alignments={index: 'right' for index in range(2, 2 + len(PROFILE_COLUMNS))},
+    ))
+
+
 @exit_on_keyboardinterrupt
 def bw_metadata(repo, args):
     target_nodes = get_target_nodes(repo, args['targets'])
+    if args['reactor_profile']:
+        _bw_metadata_reactor_profile(repo, args, target_nodes)
+        return
     key_paths = sorted([
         tuple(path.strip().split("/")) for path in args['keys'] if path
     ]) or [()]
@@ -140,7 +192,8 @@ def bw_metadata(repo, args):
         else:
             metadata = {}
             for key_path in key_paths:
-                set_key_at_path(metadata, key_path, node.metadata.get(key_path))
+                # we're going to modify this, so we need a mutable copy
+                set_key_at_path(metadata, key_path, deepcopy_metadata(node.metadata.get(key_path)))
 
             blame = list(node.metadata.blame.items())
             # sort descending by key path length since we will be replacing
@@ -3,6 +3,7 @@ from os import environ, getcwd
 from os.path import join
 
 from .. import VERSION_STRING
+from ..itemqueue import ITEM_ORDERS
 from ..utils.cmdline import (DEFAULT_item_workers, DEFAULT_node_workers,
                              DEFAULT_softlock_expiry, HELP_get_target_nodes,
                              HELP_item_workers, HELP_node_workers,
@@ -148,6 +149,20 @@ def build_parser_bw():
         dest='interactive',
         help=_("ask before applying each item"),
     )
+    parser_apply.add_argument(
+        "--item-order",
+        choices=ITEM_ORDERS,
+        default="arbitrary",
+        dest='item_order',
+        help=_("""order in which to start items that are ready to be applied:
+
+arbitrary  no particular order (default)
+depth      prefer items many other items depend on, directly or
+           indirectly, to get long dependency chains started early
+cost       like depth, but weight items by how long items of the
+           same type have taken so far in this run
+        """),
+    )
     parser_apply.add_argument(
         "-o",
         "--only",
@@ -745,6 +760,29 @@ will exit with code 47 if any matching items are locked
         dest='resolve_faults',
         help=_("resolve Faults; careful, might contain sensitive data"),
     )
+    parser_metadata.add_argument(
+        "--reactor-profile",
+        action='store_true',
+        dest='reactor_profile',
+        help=_(
+            "instead of metadata, show a table of all metadata reactors involved "
+            "with their cumulative run time, number of runs, number of changed "
+            "results, number of MetadataUnavailable exceptions and bytes returned"
+        ),
+    )
+    parser_metadata.add_argument(
+        "--reactor-profile-sort",
+        choices=('bytes', 'changes', 'runs', 'time', 'unavailable'),
+        default='time',
+        dest='reactor_profile_sort',
+        help=_("sort --reactor-profile output by this column (defaults to 'time')"),
+    )
+    parser_metadata.add_argument(
+        "--reactor-profile-json",
+        action='store_true',
+        dest='reactor_profile_json',
+        help=_("show --reactor-profile output as json instead of the usual table"),
+    )
 
     # bw nodes
     help_nodes = _("List nodes in this repository")
@@ -1,8 +1,10 @@
+from asyncio import get_running_loop
 from datetime import datetime
+from functools import partial
 from itertools import zip_longest
 from sys import exit
 
-from ..concurrency import WorkerPool
+from ..concurrency import AsyncWorkerPool
 from ..exceptions import SkipNode
 from ..utils import SkipList
 from ..utils.cmdline import get_target_nodes
@@ -20,7 +22,7 @@ from ..utils.text import (
 from ..utils.ui import io
 
 
-def run_on_node(node, command, skip_list):
+async def run_on_node(node, command, skip_list):
     if node.dummy:
         io.stdout(_("{x} {node}  is a dummy node").format(node=bold(node.name), x=yellow("»")))
         return None
@@ -29,12 +31,15 @@ def run_on_node(node, command, skip_list):
         io.stdout(_("{x} {node}  skipped by --resume-file").format(node=bold(node.name), x=yellow("»")))
         return None
 
+    # hooks might take a while, don't hold up other nodes
+    loop = get_running_loop()
     try:
-        node.repo.hooks.node_run_start(
+        await loop.run_in_executor(None, partial(
+            node.repo.hooks.node_run_start,
             repo=node.repo,
             node=node,
             command=command,
-        )
+        ))
     except SkipNode as exc:
         io.stdout(_("{x} {node}  skipped by hook ({reason})").format(
             node=bold(node.name),
@@ -44,13 +49,14 @@ def run_on_node(node, command, skip_list):
         return None
 
     with io.job(_("{}  running command...").format(bold(node.name))):
-        result = node.run(
+        result = await node.run_async(
             command,
             may_fail=True,
             log_output=True,
         )
 
-    node.repo.hooks.node_run_end(
+    await loop.run_in_executor(None, partial(
+        node.repo.hooks.node_run_end,
         repo=node.repo,
         node=node,
         command=command,
@@ -58,7 +64,7 @@ def run_on_node(node, command, skip_list):
         return_code=result.return_code,
         stdout=result.stdout,
         stderr=result.stderr,
-    )
+    ))
     return result
 
 
@@ -144,6 +150,11 @@ def bw_run(repo, args):
         results[task_id] = return_value
         if return_value is None or return_value.return_code == 0:
             skip_list.add(task_id)
+        if return_value is not None and not (
+            args['summary'] and (args['stdout_table'] or args['stderr_table'])
+        ):
+            # output won't be needed for the summary table
+            return_value.close()
 
     def handle_exception(task_id, exception, traceback):
         io.progress_advance()
@@ -153,7 +164,7 @@ def bw_run(repo, args):
         io.stderr("{} {}".format(red("!"), msg))
         errors.append(msg)
 
-    worker_pool = WorkerPool(
+    worker_pool = AsyncWorkerPool(
         tasks_available,
         next_task,
         handle_result=handle_result,
@@ -1,7 +1,10 @@
+from asyncio import new_event_loop, run_coroutine_threadsafe
 from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from inspect import iscoroutinefunction
 from random import randint
 from sys import exit
+from threading import Thread
 from traceback import format_tb
 
 from .utils.text import mark_for_translation as _
@@ -107,12 +110,15 @@ class WorkerPool:
             task=task_id,
             worker=worker_id,
         ))
-        self.pending_futures[self.executor.submit(target, *args, **kwargs)] = {
+        self.pending_futures[self._submit(target, args, kwargs)] = {
             'start_time': datetime.now(),
             'task_id': task_id,
             'worker_id': worker_id,
         }
 
+    def _submit(self, target, args, kwargs):
+        return self.executor.submit(target, *args, **kwargs)
+
     def run(self):
         io.debug(_("spinning up worker pool {pool}").format(pool=self.pool_id))
         processed_results = []
@@ -175,3 +181,29 @@ class WorkerPool:
     @property
     def workers_are_running(self):
         return bool(self.pending_futures)
+
+
+class AsyncWorkerPool(WorkerPool):
+    """
+    A WorkerPool that runs targets which are coroutine functions on a
+    single asyncio event loop instead of giving each of them a thread.
+    Since such tasks spend most of their time waiting for commands to
+    finish (see operations.run_async()), this allows for much higher
+    concurrency. Other targets are still run in threads.
+    """
+    def _submit(self, target, args, kwargs):
+        if iscoroutinefunction(target):
+            return run_coroutine_threadsafe(target(*args, **kwargs), self.loop)
+        else:
+            return super()._submit(target, args, kwargs)
+
+    def run(self):
+        self.loop = new_event_loop()
+        loop_thread = Thread(target=self.loop.run_forever)
+        loop_thread.start()
+        try:
+            return super().run()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            loop_thread.join()
+            self.loop.close()
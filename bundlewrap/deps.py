@@ -1,8 +1,7 @@
-from contextlib import suppress
-
 from .exceptions import BundleError, ItemDependencyError, NoSuchItem
 from .items import ALLOWED_ITEM_AUTO_ATTRIBUTES, Item
 from .items.actions import Action
+from .utils.pathindex import PathIndex
 from .utils.plot import explain_item_dependency_loop
 from .utils.text import bold, mark_for_translation as _
 from .utils.ui import io
@@ -31,10 +30,44 @@ class TagFillerItem(Item):
         return {}
 
 
+class ItemIndex:
+    """
+    Holds all items on a node along with lookup tables used to resolve
+    item selectors without looking at every single item. Iterating over
+    it yields all items.
+
+    The index is not updated automatically. Create a new one after
+    adding items or changing their tags.
+    """
+    def __init__(self, items):
+        self._items = items
+        self.by_id = {}
+        self.by_bundle = {}
+        self.by_tag = {}
+        self.by_type = {}
+        for item in items:
+            self.by_id.setdefault(item.id, item)
+            self.by_bundle.setdefault(item.bundle.name, []).append(item)
+            for tag in item.tags:
+                self.by_tag.setdefault(tag, []).append(item)
+            self.by_type.setdefault(item.ITEM_TYPE_NAME, []).append(item)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
 def resolve_selector(selector, items, originating_item_id=None, originating_tag=None):
     """
     Given an item selector (e.g. 'bundle:foo' or 'file:/bar'), return
     all items matching that selector from the given list of items.
+
+    Pass an ItemIndex instead of a list to avoid looking at every item.
     """
     if selector.startswith("!"):
         negate = lambda b: not b
@@ -46,6 +79,26 @@ def resolve_selector(selector, items, originating_item_id=None, originating_tag=
     except ValueError:
         raise ValueError(_("invalid item selector: {}").format(selector))
 
+    if isinstance(items, ItemIndex) and negate(True):
+        if selector_type == "bundle":
+            return filter(
+                lambda item: item.id != originating_item_id,
+                items.by_bundle.get(selector_name, ()),
+            )
+        elif selector_type == "tag":
+            if selector_name:  # "tag:" is handled below
+                return filter(
+                    lambda item: item.id != originating_item_id,
+                    items.by_tag.get(selector_name, ()),
+                )
+        elif not selector_name:  # "file:"
+            return filter(
+                lambda item: item.id != originating_item_id,
+                items.by_type.get(selector_type, ()),
+            )
+        else:  # single item
+            return [find_item(selector, items)]
+
     if selector_type == "bundle":
         return filter(
             lambda item:
@@ -81,11 +134,13 @@ def resolve_selector(selector, items, originating_item_id=None, originating_tag=
 def find_item(item_id, items):
     """
     Returns the first item with the given ID within the given list of
-    items.
+    items (or ItemIndex).
     """
-    try:
-        item = list(filter(lambda item: item.id == item_id, items))[0]
-    except IndexError:
+    if isinstance(items, ItemIndex):
+        item = items.by_id.get(item_id)
+    else:
+        item = next(filter(lambda item: item.id == item_id, items), None)
+    if item is None:
         raise NoSuchItem(_("item not found: {}").format(item_id))
     return item
 
@@ -137,8 +192,9 @@ def _add_incoming_needs(items):
 
 
 def _prepare_auto_attrs(items):
+    path_index = PathIndex(items)
     for item in items:
-        auto_attrs = item.get_auto_attrs(items)
+        auto_attrs = item.get_auto_attrs(path_index)
         for key, value in auto_attrs.items():
             if key not in ALLOWED_ITEM_AUTO_ATTRIBUTES:
                 raise ValueError(_("get_auto_attrs() on {item} returned illegal key {key}").format(
@@ -220,10 +276,14 @@ def _inject_tag_filler_items(items, bundles):
     if tag:B doesn't resolve to any items, that connection won't be
     made.
     """
+    used_tags = set()
+    for item in items:
+        used_tags.update(item.tags)
     for bundle in bundles:
         for tag, attrs in bundle.bundle_attrs.get('tags', {}).items():
-            if not tuple(resolve_selector(f"tag:{tag}", items)):
+            if tag not in used_tags:
                 items.add(TagFillerItem(bundle, tag, {'tags': {tag}}))
+                used_tags.add(tag)
 
 
 def _inject_reverse_dependencies(items):
@@ -428,13 +488,16 @@ def _add_inherited_tags(items, bundles):
     tags_added = True
     while tags_added:
         tags_added = False
+        # Items that get a new tag during this pass will be found by
+        # their new tag in the next one.
+        item_index = ItemIndex(items)
         for bundle in bundles:
             for tag, attrs in bundle.bundle_attrs.get('tags', {}).items():
                 inherited_tags = attrs.get('tags', set())
                 if not inherited_tags:
                     # just an optimization to avoid needlessly calling resolve_selector()
                     continue
-                for item in resolve_selector(f"tag:{tag}", items):
+                for item in resolve_selector(f"tag:{tag}", item_index):
                     len_before = len(item.tags)
                     item.tags.update(inherited_tags)
                     if len_before < len(item.tags):
@@ -453,65 +516,21 @@ def prepare_dependencies(node):
     _inject_canned_actions(items)
     _inject_tag_filler_items(items, node.bundles)
     _add_inherited_tags(items, node.bundles)
-    _inject_tag_attrs(items, node.bundles)
+    # from here on, neither items nor tags change anymore
+    item_index = ItemIndex(items)
+    _inject_tag_attrs(item_index, node.bundles)
     _prepare_auto_attrs(items)
-    _prepare_deps(items)
-    _inject_reverse_triggers(items)
-    _inject_reverse_dependencies(items)
-    _inject_trigger_dependencies(items)
-    _inject_preceded_by_dependencies(items)
+    _prepare_deps(item_index)
+    _inject_reverse_triggers(item_index)
+    _inject_reverse_dependencies(item_index)
+    _inject_trigger_dependencies(item_index)
+    _inject_preceded_by_dependencies(item_index)
     _flatten_dependencies(items)
     _add_incoming_needs(items)
 
     return items
 
 
-def remove_dep_from_items(items, dep):
-    """
-    Removes the given item id (dep) from the temporary list of
-    dependencies of all items in the given list.
-    """
-    for item in items:
-        with suppress(KeyError):
-            item._deps.remove(dep)
-    return items
-
-
-def remove_item_dependents(items, dep_item):
-    """
-    Removes the items depending on the given item from the list of items.
-    """
-    removed_items = set()
-    for item in items:
-        if dep_item in item._deps_needs | item._deps_needed_by:
-            removed_items.add(item)
-        with suppress(KeyError):
-            item._deps.remove(dep_item)
-
-    for item in removed_items:
-        items.remove(item)
-
-    if removed_items:
-        io.debug(
-            "skipped these items because they depend on {item}, which was "
-            "skipped previously: {skipped}".format(
-                item=dep_item.id,
-                skipped=", ".join([item.id for item in removed_items]),
-            )
-        )
-
-    all_recursively_removed_items = set()
-    for removed_item in removed_items:
-        if removed_item.cascade_skip:
-            items, recursively_removed_items = \
-                remove_item_dependents(items, removed_item)
-            all_recursively_removed_items.update(recursively_removed_items)
-        else:
-            items = remove_dep_from_items(items, removed_item)
-
-    return (items, removed_items | all_recursively_removed_items)
-
-
 def split_items_without_deps(items):
     """
     Takes a list of items and extracts the ones that don't have any
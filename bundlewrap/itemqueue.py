@@ -1,9 +1,10 @@
 from collections import defaultdict
+from heapq import heappop, heappush
+from threading import Lock
 
 from .deps import (
+    ItemIndex,
     prepare_dependencies,
-    remove_item_dependents,
-    remove_dep_from_items,
     resolve_selector,
     split_items_without_deps,
 )
@@ -11,29 +12,217 @@ from .exceptions import NoSuchItem, MetadataUnavailable
 from .utils.text import mark_for_translation as _
 from .utils.ui import io
 
+ITEM_ORDERS = ("arbitrary", "cost", "depth")
+
 
 class BaseQueue:
+    """
+    Keeps track of which items are ready to be processed.
+
+    Each item's remaining dependencies are kept in item._deps. Instead
+    of looking at all remaining items whenever an item is done, we
+    keep a reverse mapping from each item to the items depending on
+    it, so only those have to be looked at.
+    """
     def __init__(self, node):
-        self.items_with_deps = prepare_dependencies(node)
-        self.items_without_deps = set()
-        self._split()
+        items = prepare_dependencies(node)
+        self.item_index = ItemIndex(set(items))
+        self.dependents = {item: set() for item in items}
+        for item in items:
+            for dep in item._deps:
+                self.dependents.setdefault(dep, set()).add(item)
+        self.items_with_deps, self.items_without_deps = \
+            split_items_without_deps(items)
         self.pending_items = set()
 
-    def _split(self):
-        self.items_with_deps, self.items_without_deps = \
-            split_items_without_deps(self.all_items)
+    def _add_ready_item(self, item):
+        self.items_without_deps.add(item)
 
     @property
     def all_items(self):
         return self.items_with_deps | self.items_without_deps
 
+    def _remove_dep(self, dep):
+        """
+        Removes the given item from the remaining dependencies of all
+        items depending on it. Items without any remaining dependencies
+        become ready.
+        """
+        for item in self.dependents.pop(dep, ()):
+            item._deps.discard(dep)
+            if not item._deps and item in self.items_with_deps:
+                self.items_with_deps.remove(item)
+                self._add_ready_item(item)
+
+    def _remove_dependents(self, dep_item):
+        """
+        Removes all items that need the given item from the queue.
+        Returns the set of removed items.
+        """
+        removed_items = set()
+        for item in self.dependents.pop(dep_item, ()):
+            item._deps.discard(dep_item)
+            if item not in self.items_with_deps:
+                continue
+            if dep_item in item._deps_needs | item._deps_needed_by:
+                self.items_with_deps.remove(item)
+                removed_items.add(item)
+            elif not item._deps:
+                self.items_with_deps.remove(item)
+                self._add_ready_item(item)
+
+        if removed_items:
+            io.debug(
+                "skipped these items because they depend on {item}, which was "
+                "skipped previously: {skipped}".format(
+                    item=dep_item.id,
+                    skipped=", ".join([item.id for item in removed_items]),
+                )
+            )
+
+        all_recursively_removed_items = set()
+        for removed_item in removed_items:
+            if removed_item.cascade_skip:
+                all_recursively_removed_items.update(
+                    self._remove_dependents(removed_item)
+                )
+            else:
+                self._remove_dep(removed_item)
+
+        return removed_items | all_recursively_removed_items
+
 
 class ItemQueue(BaseQueue):
-    def __init__(self, node):
+    """
+    Ready items are kept in one wait queue per item type. Since
+    Item.block_concurrent() only depends on the item type and node OS,
+    either all or none of the items in such a queue are runnable.
+
+    Each wait queue is a heap ordered by item priority, as determined
+    by item_order:
+
+    arbitrary   all items have the same priority
+    depth       prefer items with the longest chain of items depending
+                on them
+    cost        like depth, but each item in the chain is weighted by
+                the average duration of its item type so far
+    """
+    # maps item types to the number of items applied and their total
+    # duration in seconds, shared across all nodes in this process
+    _item_type_durations = {}
+    _item_type_durations_lock = Lock()
+
+    def __init__(self, node, item_order="arbitrary"):
+        if item_order not in ITEM_ORDERS:
+            raise ValueError(_("unknown item order: {}").format(item_order))
+        self.items_without_deps_by_type = defaultdict(list)
+        self.blocking_item_types = {}
+        self.running_item_types = defaultdict(int)
         super().__init__(node)
 
+        if item_order == "cost":
+            self.priorities = self._downstream_costs(self._estimated_cost())
+        elif item_order == "depth":
+            self.priorities = self._downstream_costs(lambda item: 1)
+        else:
+            self.priorities = {}
+
+        for item in self.items_without_deps:
+            self._add_to_wait_queue(item)
+
         # Optional sanity check.
-        self.item_types_with_blockers = set()
+        #
+        # Keep track of item types that have blockers. We can later use
+        # this to do a sanity check: Was there a bug and did we
+        # accidentally run blocked items after all?
+        #
+        # Note that this does NOT catch all cases that are theoretically
+        # possible. It only catches things like pkg_apt where only one
+        # item of that exact type can be running.
+        self.item_types_with_blockers = {
+            item_type for item_type, blockers in self.blocking_item_types.items()
+            if blockers
+        }
+
+    @classmethod
+    def record_duration(cls, item, duration):
+        """
+        Remembers how long it took to apply the given item (timedelta)
+        for the "cost" item order.
+        """
+        with cls._item_type_durations_lock:
+            count, total = cls._item_type_durations.get(item.ITEM_TYPE_NAME, (0, 0.0))
+            cls._item_type_durations[item.ITEM_TYPE_NAME] = \
+                (count + 1, total + duration.total_seconds())
+
+    def _estimated_cost(self):
+        with self._item_type_durations_lock:
+            averages = {
+                item_type: total / count
+                for item_type, (count, total) in self._item_type_durations.items()
+            }
+        # item types we haven't seen yet are assumed to be average
+        default = sum(averages.values()) / len(averages) if averages else 1.0
+        return lambda item: averages.get(item.ITEM_TYPE_NAME, default)
+
+    def _downstream_costs(self, cost):
+        """
+        Returns a dict mapping each item to the sum of costs along the
+        most expensive chain of items depending on it (including the
+        item itself). Dependency loops are ignored.
+        """
+        result = {}
+        visiting = set()
+        for root in self.dependents:
+            stack = [(root, False)]
+            while stack:
+                item, dependents_done = stack.pop()
+                if dependents_done:
+                    visiting.remove(item)
+                    result[item] = cost(item) + max(
+                        [result.get(dependent, 0) for dependent in self.dependents[item]],
+                        default=0,
+                    )
+                elif item not in result and item not in visiting:
+                    visiting.add(item)
+                    stack.append((item, True))
+                    for dependent in self.dependents[item]:
+                        stack.append((dependent, False))
+        return result
+
+    def _add_ready_item(self, item):
+        super()._add_ready_item(item)
+        self._add_to_wait_queue(item)
+
+    def _add_to_wait_queue(self, item):
+        if item.ITEM_TYPE_NAME not in self.blocking_item_types:
+            self.blocking_item_types[item.ITEM_TYPE_NAME] = set(
+                item.block_concurrent(item.node.os, item.node.os_version)
+            )
+        heappush(
+            self.items_without_deps_by_type[item.ITEM_TYPE_NAME],
+            (-self.priorities.get(item, 0), item.id, item),
+        )
+
+    def _item_type_runnable(self, item_type):
+        for item_type_blocked_for in self.blocking_item_types[item_type]:
+            if self.running_item_types.get(item_type_blocked_for):
+                return False
+        return True
+
+    def _runnable_item_types(self):
+        for item_type in self.items_without_deps_by_type:
+            if self._item_type_runnable(item_type):
+                yield item_type
+
+    def _start_item(self, item):
+        self.items_without_deps.remove(item)
+        self.pending_items.add(item)
+        self.running_item_types[item.ITEM_TYPE_NAME] += 1
+
+    def _finish_item(self, item):
+        self.pending_items.remove(item)
+        self.running_item_types[item.ITEM_TYPE_NAME] -= 1
 
     def item_failed(self, item):
         """
@@ -54,104 +243,100 @@ class ItemQueue(BaseQueue):
         """
         Called when an item didn't need to be fixed.
         """
-        self.pending_items.remove(item)
+        self._finish_item(item)
         # if an item is applied successfully, all dependencies on it can
         # be removed from the remaining items
-        self.items_with_deps = remove_dep_from_items(
-            self.items_with_deps,
-            item,
-        )
-        self._split()
+        self._remove_dep(item)
 
     def item_skipped(self, item):
         """
         Called when an item has been skipped. Yields all items that have
         been skipped as a result by cascading.
         """
-        self.pending_items.remove(item)
+        self._finish_item(item)
         if item.cascade_skip:
             # if an item fails or is skipped, all items that depend on
             # it shall be removed from the queue
-            self.items_with_deps, skipped_items = remove_item_dependents(
-                self.items_with_deps,
-                item,
-            )
-            for skipped_item in skipped_items:
+            for skipped_item in self._remove_dependents(item):
                 yield skipped_item
         else:
-            self.items_with_deps = remove_dep_from_items(
-                self.items_with_deps,
-                item,
-            )
-        self._split()
+            self._remove_dep(item)
 
-    def items_without_deps_runnable(self):
-        runnable_items = set()
-        running_item_types = set([i.ITEM_TYPE_NAME for i in self.pending_items])
-
-        for item in self.items_without_deps:
-            add_this_item = True
-            for item_blocked_for in item.block_concurrent(item.node.os, item.node.os_version):
-                # Optional sanity check.
-                #
-                # Keep track of item types that have blockers. We can
-                # later use this to do a sanity check: Was there a bug
-                # and did we accidentally run blocked items after all?
-                #
-                # Note that this does NOT catch all cases that are
-                # theoretically possible. It only catches things like
-                # pkg_apt where only one item of that exact type can be
-                # running.
-                self.item_types_with_blockers.add(item.ITEM_TYPE_NAME)
-
-                if item_blocked_for in running_item_types:
-                    add_this_item = False
-                    break
-
-            if add_this_item:
-                runnable_items.add(item)
-
-        return runnable_items
+    def has_runnable_items(self):
+        for item_type in self._runnable_item_types():
+            return True
+        return False
 
     def pop(self):
         """
         Gets the next item available for processing and moves it into
-        self.pending_items. Will raise KeyError if no item is
-        available.
+        self.pending_items. Will raise MetadataUnavailable if no item
+        is available.
         """
-        runnable_items = self.items_without_deps_runnable()
-
-        if not runnable_items:
+        try:
+            item_type = min(
+                self._runnable_item_types(),
+                key=lambda item_type: self.items_without_deps_by_type[item_type][0],
+            )
+        except ValueError:
             raise MetadataUnavailable()
 
-        item = runnable_items.pop()
-        self.items_without_deps.remove(item)
-
-        self.pending_items.add(item)
+        items_of_type = self.items_without_deps_by_type[item_type]
+        item = heappop(items_of_type)[2]
+        if not items_of_type:
+            del self.items_without_deps_by_type[item_type]
+        self._start_item(item)
 
         # Optional sanity check.
-        item_types_running = defaultdict(int)
-        for i in self.pending_items:
-            item_types_running[i.ITEM_TYPE_NAME] += 1
         for it in self.item_types_with_blockers:
-            if item_types_running[it] > 1:
+            if self.running_item_types.get(it, 0) > 1:
                 raise Exception(f'BUG! More than one {it} running!')
 
         return item
 
+    def pop_all_of_type(self, item_type):
+        """
+        Like pop(), but gets all items of the given type that are
+        available for processing right now (might be none). Must not be
+        used for item types that block themselves.
+        """
+        if (
+            item_type not in self.items_without_deps_by_type or
+            not self._item_type_runnable(item_type)
+        ):
+            return []
+        items = [
+            item for _priority, _id, item in
+            sorted(self.items_without_deps_by_type.pop(item_type))
+        ]
+        for item in items:
+            self._start_item(item)
+        return items
+
     def _fire_triggers_for_item(self, item):
         for triggered_item_id in item.triggers:
             try:
-                for triggered_item in resolve_selector(triggered_item_id, self.all_items):
-                    triggered_item.has_been_triggered = True
+                for triggered_item in resolve_selector(triggered_item_id, self.item_index):
+                    # the index also knows about items that have been
+                    # skipped and removed from the queue
+                    if (
+                        triggered_item in self.items_with_deps or
+                        triggered_item in self.items_without_deps
+                    ):
+                        triggered_item.has_been_triggered = True
+                    else:
+                        self._log_unavailable_trigger(item, triggered_item.id)
             except (NoSuchItem, ValueError):
-                io.debug(_(
-                    "{item} tried to trigger {triggered_item}, "
-                    "but it wasn't available. It must have been skipped previously."
-                ).format(
-                    item=item.id,
-                    triggered_item=triggered_item_id,
-                ))
+                self._log_unavailable_trigger(item, triggered_item_id)
+
+    def _log_unavailable_trigger(self, item, triggered_item_id):
+        io.debug(_(
+            "{item} tried to trigger {triggered_item}, "
+            "but it wasn't available. It must have been skipped previously."
+        ).format(
+            item=item.id,
+            triggered_item=triggered_item_id,
+        ))
 
 
 class ItemTestQueue(BaseQueue):
@@ -161,6 +346,5 @@ class ItemTestQueue(BaseQueue):
     """
     def pop(self):
         item = self.items_without_deps.pop()
-        self.items_with_deps = remove_dep_from_items(self.items_with_deps, item)
-        self._split()
+        self._remove_dep(item)
         return item
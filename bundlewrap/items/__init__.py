@@ -17,6 +17,7 @@ from bundlewrap.exceptions import (
 from bundlewrap.operations import run_local
 from bundlewrap.utils import cached_property, Fault
 from bundlewrap.utils.dicts import dict_to_text, diff_dict, hash_state_dict, validate_state_dict
+from bundlewrap.utils.remote import forget_remote_state
 from bundlewrap.utils.text import blue, bold, green, italic, red, wrap_question
 from bundlewrap.utils.text import force_text, mark_for_translation as _
 from bundlewrap.utils.ui import io
@@ -190,7 +191,8 @@ class Item:
             self.validate_attributes(bundle, self.id, attributes)
 
         try:
-            attributes = self.patch_attributes(attributes)
+            # copy since attributes might come straight from (frozen) metadata
+            attributes = self.patch_attributes(dict(attributes))
         except FaultUnavailable:
             self._faults_missing_for_attributes.add(_("unknown"))
 
@@ -479,6 +481,92 @@ class Item:
         interactive_default=True,
         show_diff=True,
     ):
+        start_time = datetime.now()
+        status_code, details, status_before = self._apply_check(
+            autoskip_selector=autoskip_selector,
+            autoonly_selector=autoonly_selector,
+            my_soft_locks=my_soft_locks,
+            other_peoples_soft_locks=other_peoples_soft_locks,
+            interactive=interactive,
+            show_diff=show_diff,
+        )
+
+        if status_code is None:  # item not skipped or OK
+            # whatever we're about to do might change the state of
+            # other items as well
+            forget_remote_state(self.node)
+            if not interactive:
+                with io.job(_("{node}  {bundle}  {item}").format(
+                    bundle=bold(self.bundle.name),
+                    item=self.id,
+                    node=bold(self.node.name),
+                )):
+                    self.fix(status_before)
+            else:
+                if status_before.must_be_created:
+                    question_text = dict_to_text(details, value_color=green)
+                    prompt = _("Create {}?").format(bold(self.id))
+                elif status_before.must_be_deleted:
+                    question_text = dict_to_text(details, value_color=red)
+                    prompt = _("Delete {}?").format(bold(self.id))
+                else:
+                    display_expected_state, display_actual_state, display_keys_to_fix = details
+                    question_text = diff_dict(
+                        display_actual_state,
+                        display_expected_state,
+                        skip_missing_in_target=True,
+                    )
+                    prompt = _("Fix {}?").format(bold(self.id))
+                if self.comment:
+                    question_text += format_comment(self.comment)
+                question = wrap_question(
+                    self.id,
+                    question_text,
+                    prompt,
+                    prefix="{x} {node} ".format(
+                        node=bold(self.node.name),
+                        x=blue("?"),
+                    ),
+                )
+                answer = io.ask(
+                    question,
+                    interactive_default,
+                    epilogue="{x} {node}".format(
+                        node=bold(self.node.name),
+                        x=blue("?"),
+                    ),
+                )
+                if answer:
+                    with io.job(_("{node}  {bundle}  {item}").format(
+                        bundle=bold(self.bundle.name),
+                        item=self.id,
+                        node=bold(self.node.name),
+                    )):
+                        self.fix(status_before)
+                else:
+                    status_code = self.STATUS_SKIPPED
+                    details = self.SKIP_REASON_INTERACTIVE
+
+            # other items might have looked at the node while we were
+            # busy fixing it
+            forget_remote_state(self.node)
+
+        return self._apply_done(status_code, details, status_before, start_time)
+
+    def _apply_check(
+        self,
+        autoskip_selector=(),
+        autoonly_selector=(),
+        my_soft_locks=(),
+        other_peoples_soft_locks=(),
+        interactive=False,
+        show_diff=True,
+    ):
+        """
+        First half of apply(): figures out whether this item needs to be
+        fixed. Returns the status code (None if the item must be fixed),
+        details and status before fixing.
+        """
         self.node.repo.hooks.item_apply_start(
             repo=self.node.repo,
             node=self.node,
@@ -486,9 +574,7 @@ class Item:
         )
         status_code = None
         status_before = None
-        status_after = None
         details = None
-        start_time = datetime.now()
 
         for item in self._precedes_items:
             try:
@@ -594,59 +680,14 @@ class Item:
                             copy(status_before.keys_to_fix),
                         )
 
-        if status_code is None:  # item not skipped or OK
-            if not interactive:
-                with io.job(_("{node}  {bundle}  {item}").format(
-                    bundle=bold(self.bundle.name),
-                    item=self.id,
-                    node=bold(self.node.name),
-                )):
-                    self.fix(status_before)
-            else:
-                if status_before.must_be_created:
-                    question_text = dict_to_text(details, value_color=green)
-                    prompt = _("Create {}?").format(bold(self.id))
-                elif status_before.must_be_deleted:
-                    question_text = dict_to_text(details, value_color=red)
-                    prompt = _("Delete {}?").format(bold(self.id))
-                else:
-                    display_expected_state, display_actual_state, display_keys_to_fix = details
-                    question_text = diff_dict(
-                        display_actual_state,
-                        display_expected_state,
-                        skip_missing_in_target=True,
-                    )
-                    prompt = _("Fix {}?").format(bold(self.id))
-                if self.comment:
-                    question_text += format_comment(self.comment)
-                question = wrap_question(
-                    self.id,
-                    question_text,
-                    prompt,
-                    prefix="{x} {node} ".format(
-                        node=bold(self.node.name),
-                        x=blue("?"),
-                    ),
-                )
-                answer = io.ask(
-                    question,
-                    interactive_default,
-                    epilogue="{x} {node}".format(
-                        node=bold(self.node.name),
-                        x=blue("?"),
-                    ),
-                )
-                if answer:
-                    with io.job(_("{node}  {bundle}  {item}").format(
-                        bundle=bold(self.bundle.name),
-                        item=self.id,
-                        node=bold(self.node.name),
-                    )):
-                        self.fix(status_before)
-                else:
-                    status_code = self.STATUS_SKIPPED
-                    details = self.SKIP_REASON_INTERACTIVE
+        return status_code, details, status_before
 
+    def _apply_done(self, status_code, details, status_before, start_time):
+        """
+        Second half of apply(): verifies the result of fixing the item.
+        Returns the same tuple as apply().
+        """
+        status_after = None
         if status_code is None:  # item not skipped or OK
             status_after = self.get_status(cached=False)
             status_code = self.STATUS_FIXED if status_after.correct else self.STATUS_FAILED
@@ -683,6 +724,15 @@ class Item:
         })
         return result
 
+    def run_many(self, commands, **kwargs):
+        results = self.node.run_many(commands, **kwargs)
+        for command, result in zip(commands, results):
+            self._command_results.append({
+                'command': command,
+                'result': result,
+            })
+        return results
+
     @property
     def expected_state(self):
         """
@@ -762,9 +812,25 @@ class Item:
 
         Note that only attributes from ALLOWED_ITEM_AUTO_ATTRIBUTES are
         allowed.
+
+        items is a PathIndex of all items on the node. Besides iterating
+        over it, you can use it to look up items by type, name and the
+        paths they manage (see get_indexed_paths()).
+
+        MAY be overridden by subclasses.
         """
         return {}
 
+    def get_indexed_paths(self):
+        """
+        Return an iterable of absolute paths on the node managed by
+        this item. Other items can use these to find this item in the
+        PathIndex passed to get_auto_attrs().
+
+        MAY be overridden by subclasses.
+        """
+        return ()
+
     def get_canned_actions(self):
         """
         Return a dictionary of action definitions (mapping action names
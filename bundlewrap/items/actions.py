@@ -3,6 +3,7 @@ from datetime import datetime
 from bundlewrap.exceptions import BundleError, ItemSkipped
 from bundlewrap.items import format_comment, Item
 from bundlewrap.utils import Fault
+from bundlewrap.utils.remote import forget_remote_state
 from bundlewrap.utils.ui import io
 from bundlewrap.utils.text import mark_for_translation as _
 from bundlewrap.utils.text import blue, bold, wrap_question
@@ -189,6 +190,8 @@ class Action(Item):
         else:
             data_stdin = None
 
+        # the command might change the state of any other item
+        forget_remote_state(self.node)
         with io.job(_("{node}  {bundle}  {item}").format(
             bundle=bold(self.bundle.name),
             item=self.id,
@@ -199,6 +202,7 @@ class Action(Item):
                 data_stdin=data_stdin,
                 may_fail=True,
             )
+        forget_remote_state(self.node)
 
         failed_expectations = ({}, {}, [])
 
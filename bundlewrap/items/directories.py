@@ -5,7 +5,6 @@ from shlex import quote
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
 from bundlewrap.utils.remote import PathInfo
-from bundlewrap.utils.text import is_subdirectory
 from bundlewrap.utils.text import mark_for_translation as _
 from bundlewrap.utils.ui import io
 
@@ -191,18 +190,18 @@ class Directory(Item):
                 ))
                 yield line
 
+    def get_indexed_paths(self):
+        return (self.name,)
+
     def get_auto_attrs(self, items):
         deps = set()
-        for item in items:
+        for item in items.items_above(self.name) + items.items_at(self.name):
             if item == self:
                 continue
-            if ((
-                item.ITEM_TYPE_NAME == "file" and
-                is_subdirectory(item.name, self.name)
-            ) or (
-                item.ITEM_TYPE_NAME in ("file", "symlink") and
-                item.name == self.name
-            )):
+            if (
+                item.ITEM_TYPE_NAME == "file" or
+                (item.ITEM_TYPE_NAME == "symlink" and item.name == self.name)
+            ):
                 raise BundleError(_(
                     "{item1} (from bundle '{bundle1}') blocking path to "
                     "{item2} (from bundle '{bundle2}')"
@@ -212,39 +211,26 @@ class Directory(Item):
                     item2=self.id,
                     bundle2=self.bundle.name,
                 ))
-            elif item.ITEM_TYPE_NAME == "user" and item.name == self.attributes['owner']:
-                if item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
-            elif item.ITEM_TYPE_NAME == "group" and item.name == self.attributes['group']:
-                if item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
             elif item.ITEM_TYPE_NAME == "zfs_dataset":
-                if item.attributes.get('mountpoint') not in (None, "none"):
-                    if is_subdirectory(item.attributes['mountpoint'], self.name) or item.attributes['mountpoint'] == self.name:
-                        deps.add(item.id)
-            elif item.ITEM_TYPE_NAME in ("directory", "symlink"):
-                if is_subdirectory(item.name, self.name):
-                    deps.add(item.id)
+                deps.add(item.id)
+            elif item.ITEM_TYPE_NAME in ("directory", "symlink") and item.name != self.name:
+                deps.add(item.id)
+        for item_type, name in (('user', self.attributes['owner']), ('group', self.attributes['group'])):
+            item = items.get(item_type, name)
+            if item is None:
+                continue
+            elif item.attributes['delete']:
+                raise BundleError(_(
+                    "{item1} (from bundle '{bundle1}') depends on item "
+                    "{item2} (from bundle '{bundle2}') which is set to be deleted"
+                ).format(
+                    item1=self.id,
+                    bundle1=self.bundle.name,
+                    item2=item.id,
+                    bundle2=item.bundle.name,
+                ))
+            else:
+                deps.add(item.id)
         return {'needs': deps}
 
     @property
@@ -1,7 +1,7 @@
 from atexit import register as at_exit
 from base64 import b64decode
 from collections import defaultdict
-from contextlib import contextmanager, suppress
+from contextlib import contextmanager, ExitStack, suppress
 from datetime import datetime
 
 try:
@@ -9,6 +9,7 @@ try:
 except ImportError:  # Python 3.8
     cache = lambda f: f
 from hashlib import md5
+from io import BytesIO
 from os import getenv, getpid, makedirs, mkdir, rmdir
 from os.path import basename, dirname, exists, isfile, join, normpath
 from shlex import quote
@@ -17,20 +18,25 @@ from subprocess import check_output, CalledProcessError, STDOUT
 from sys import exc_info
 from tempfile import gettempdir
 from time import sleep
-from traceback import format_exception
+from traceback import format_exception, format_tb
 
 from jinja2 import Environment, FileSystemLoader
 from mako.lookup import TemplateLookup
 from mako.template import Template
 from requests import head
 
-from bundlewrap.exceptions import BundleError, FaultUnavailable, TemplateError
+from bundlewrap.exceptions import (
+    BundleError,
+    FaultUnavailable,
+    RemoteException,
+    TemplateError,
+    TransportException,
+)
 from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
 from bundlewrap.items.directories import validator_mode
 from bundlewrap.utils import cached_property, download, hash_local_file, sha256, tempfile
-from bundlewrap.utils.remote import PathInfo
+from bundlewrap.utils.remote import forget_remote_state, PathInfo, prefetch_path_info
 from bundlewrap.utils.text import bold, force_text, mark_for_translation as _
-from bundlewrap.utils.text import is_subdirectory
 from bundlewrap.utils.ui import io
 
 DIFF_MAX_FILE_SIZE = 1024 * 1024 * 5  # bytes
@@ -229,11 +235,9 @@ def get_remote_file_contents(node, path):
     """
     Returns the contents of the given path as a string.
     """
-    with tempfile() as tmp_file:
-        node.download(path, tmp_file)
-        with open(tmp_file, 'rb') as f:
-            content = f.read()
-        return content
+    content = BytesIO()
+    node.download(path, content, compress=True)
+    return content.getvalue()
 
 
 def validator_content_type(item_id, value):
@@ -351,6 +355,21 @@ class File(Item):
                         continue
                     getattr(self, "_fix_" + fix_type)(status)
 
+    def _fixed_by_upload(self, status):
+        """
+        Returns True if fixing this item only requires uploading its
+        content, which would also set mode and ownership.
+        """
+        return (
+            self.node.os in self.node.OS_FAMILY_LINUX and
+            self.name.startswith("/") and
+            not status.must_be_deleted and
+            (
+                status.must_be_created or
+                ('type' not in status.keys_to_fix and 'content_hash' in status.keys_to_fix)
+            )
+        )
+
     def _fix_content_hash(self, status):
         with self._write_local_file() as local_path:
             with io.job(_("{}  {}  uploading to node").format(
@@ -401,10 +420,13 @@ class File(Item):
             self.run("mkdir -p -- {}".format(quote(dirname(self.name))))
             self._fix_content_hash(status)
 
+    def get_indexed_paths(self):
+        return (self.name,)
+
     def get_auto_attrs(self, items):
         deps = set()
-        for item in items:
-            if item.ITEM_TYPE_NAME == 'file' and is_subdirectory(item.name, self.name):
+        for item in items.items_above(self.name):
+            if item.ITEM_TYPE_NAME == 'file':
                 raise BundleError(_(
                     "{item1} (from bundle '{bundle1}') blocking path to "
                     "{item2} (from bundle '{bundle2}')"
@@ -414,39 +436,24 @@ class File(Item):
                     item2=self.id,
                     bundle2=self.bundle.name,
                 ))
-            elif item.ITEM_TYPE_NAME == 'user' and item.name == self.attributes['owner']:
-                if item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
-            elif item.ITEM_TYPE_NAME == 'group' and item.name == self.attributes['group']:
-                if item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
-            elif item.ITEM_TYPE_NAME == "zfs_dataset":
-                if item.attributes.get('mountpoint') not in (None, "none"):
-                    if is_subdirectory(item.attributes['mountpoint'], self.name):
-                        deps.add(item.id)
-            elif item.ITEM_TYPE_NAME in ('directory', 'symlink'):
-                if is_subdirectory(item.name, self.name):
-                    deps.add(item.id)
+            elif item.ITEM_TYPE_NAME in ('directory', 'symlink', 'zfs_dataset'):
+                deps.add(item.id)
+        for item_type, name in (('user', self.attributes['owner']), ('group', self.attributes['group'])):
+            item = items.get(item_type, name)
+            if item is None:
+                continue
+            elif item.attributes['delete']:
+                raise BundleError(_(
+                    "{item1} (from bundle '{bundle1}') depends on item "
+                    "{item2} (from bundle '{bundle2}') which is set to be deleted"
+                ).format(
+                    item1=self.id,
+                    bundle1=self.bundle.name,
+                    item2=item.id,
+                    bundle2=item.bundle.name,
+                ))
+            else:
+                deps.add(item.id)
         return {
             'needs': deps,
         }
@@ -727,3 +734,133 @@ class File(Item):
                     ))
 
             yield local_path
+
+
+def apply_files(
+    items,
+    autoskip_selector=(),
+    autoonly_selector=(),
+    my_soft_locks=(),
+    other_peoples_soft_locks=(),
+    show_diff=True,
+):
+    """
+    Non-interactively applies the given file items, which must all
+    belong to the same node and must not depend on each other. Instead
+    of uploading them one by one, the contents of all files that need
+    them are shipped in a single archive.
+
+    Returns a list of (item, result, exception, traceback) tuples with
+    result being what Item.apply() would have returned or None if an
+    exception was raised for that item.
+    """
+    node = items[0].node
+    start_time = datetime.now()
+    results = []
+
+    def record_exception(item, exc):
+        results.append((item, None, exc, "".join(format_tb(exc.__traceback__))))
+
+    must_be_fixed = []
+    for item in items:
+        try:
+            status_code, details, status_before = item._apply_check(
+                autoskip_selector=autoskip_selector,
+                autoonly_selector=autoonly_selector,
+                my_soft_locks=my_soft_locks,
+                other_peoples_soft_locks=other_peoples_soft_locks,
+                show_diff=show_diff,
+            )
+            if status_code is None:
+                must_be_fixed.append((item, details, status_before))
+            else:
+                results.append((
+                    item,
+                    item._apply_done(status_code, details, status_before, start_time),
+                    None,
+                    None,
+                ))
+        except Exception as exc:
+            record_exception(item, exc)
+
+    if not must_be_fixed:
+        return results
+
+    # whatever we're about to do might change the state of other items
+    forget_remote_state(node)
+    fixed = []
+    with ExitStack() as stack:
+        uploads = []
+        for item, details, status_before in must_be_fixed:
+            try:
+                if item._fixed_by_upload(status_before):
+                    local_path = stack.enter_context(item._write_local_file())
+                    uploads.append((item, details, status_before, local_path))
+                else:
+                    with io.job(_("{node}  {bundle}  {item}").format(
+                        bundle=bold(item.bundle.name),
+                        item=item.id,
+                        node=bold(node.name),
+                    )):
+                        item.fix(status_before)
+                    fixed.append((item, details, status_before))
+            except Exception as exc:
+                record_exception(item, exc)
+
+        if uploads:
+            try:
+                with io.job(_("{node}  uploading {count} files").format(
+                    count=len(uploads),
+                    node=bold(node.name),
+                )):
+                    failed = node.upload_many([
+                        (
+                            local_path,
+                            item.name,
+                            item.attributes['mode'],
+                            item.attributes['owner'] or "",
+                            item.attributes['group'] or "",
+                        )
+                        for item, details, status_before, local_path in uploads
+                    ])
+            except Exception as exc:
+                for item, details, status_before, local_path in uploads:
+                    record_exception(item, exc)
+            else:
+                for item, details, status_before, local_path in uploads:
+                    if item.name in failed:
+                        record_exception(item, RemoteException(_(
+                            "unable to move uploaded file into place at {path} on {node}:\n\n{error}"
+                        ).format(
+                            error=failed[item.name],
+                            node=node.name,
+                            path=item.name,
+                        )))
+                    else:
+                        fixed.append((item, details, status_before))
+
+    # other items might have looked at the node while we were busy
+    # fixing it
+    forget_remote_state(node)
+    try:
+        # look at all the files we just fixed in one go
+        prefetch_path_info(node, [item.name for item, details, status_before in fixed])
+    except (RemoteException, TransportException) as exc:
+        io.debug(_("unable to prefetch path info on {node}: {exc}").format(
+            exc=exc,
+            node=node.name,
+        ))
+    try:
+        for item, details, status_before in fixed:
+            try:
+                results.append((
+                    item,
+                    item._apply_done(None, details, status_before, start_time),
+                    None,
+                    None,
+                ))
+            except Exception as exc:
+                record_exception(item, exc)
+    finally:
+        forget_remote_state(node)
+    return results
@@ -1,6 +1,6 @@
 from atexit import register as at_exit
 from hashlib import md5
-from os import environ, getenv, getpid, makedirs, mkdir, remove, rmdir, setpgrp
+from os import environ, getenv, getpid, makedirs, mkdir, remove, rmdir, setpgrp, stat
 from os.path import isfile, join
 from shlex import quote
 from shutil import rmtree
@@ -13,7 +13,7 @@ from bundlewrap.exceptions import BundleError, RepositoryError
 from bundlewrap.items import Item
 from bundlewrap.operations import RunResult
 from bundlewrap.utils import cached_property
-from bundlewrap.utils.text import is_subdirectory, mark_for_translation as _, randstr
+from bundlewrap.utils.text import mark_for_translation as _, randstr
 from bundlewrap.utils.ui import io
 
 
@@ -116,18 +116,18 @@ class GitDeploy(Item):
     def expected_state(self):
         return {'rev': self._expanded_rev}
 
+    def get_indexed_paths(self):
+        return (self.name,)
+
     def get_auto_attrs(self, items):
         deps = set()
-        for item in items:
+        for item in items.items_above(self.name) + items.items_at(self.name):
             if item == self:
                 continue
-            if ((
-                item.ITEM_TYPE_NAME == "file" and
-                is_subdirectory(item.name, self.name)
-            ) or (
-                item.ITEM_TYPE_NAME in ("file", "symlink") and
-                item.name == self.name
-            )):
+            if (
+                item.ITEM_TYPE_NAME == "file" or
+                (item.ITEM_TYPE_NAME == "symlink" and item.name == self.name)
+            ):
                 raise BundleError(_(
                     "{item1} (from bundle '{bundle1}') blocking path to "
                     "{item2} (from bundle '{bundle2}')"
@@ -162,12 +162,23 @@ class GitDeploy(Item):
             temp_filename = ".bundlewrap_tmp_git_deploy_" + randstr()
 
             try:
+                # Transfer the whole archive before touching the deployed
+                # tree, so a failed transfer leaves it intact.
                 self.node.upload(
                     archive_local.name,
                     temp_filename,
                 )
-                self.run("find {} -mindepth 1 -delete".format(quote(self.name)))
-                self.run("tar -xf {} -C {}".format(temp_filename, quote(self.name)))
+                self.run(
+                    "if [ $(wc -c < {archive}) -ne {size} ]; then "
+                    "echo 'incomplete upload of {archive}' >&2; exit 1; "
+                    "fi; "
+                    "find {path} -mindepth 1 -delete && "
+                    "tar -xf {archive} -C {path}".format(
+                        archive=temp_filename,
+                        path=quote(self.name),
+                        size=stat(archive_local.name).st_size,
+                    )
+                )
                 if self.attributes['use_xattrs']:
                     self.run("attr -q -s bw_git_deploy_rev -V {} {}".format(
                         self._expanded_rev,
@@ -1,6 +1,6 @@
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
-from bundlewrap.items.users import _USERNAME_VALID_CHARACTERS
+from bundlewrap.items.users import _user_database, _USERNAME_VALID_CHARACTERS
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -81,14 +81,11 @@ class Group(Item):
     @property
     def actual_state(self):
         # verify content of /etc/group
-        grep_result = self.run(
-            "grep -e '^{}:' /etc/group".format(self.name),
-            may_fail=True,
-        )
-        if grep_result.return_code != 0:
+        group_line = _user_database(self.node)['groups'].get(self.name)
+        if group_line is None:
             return None
         else:
-            return _parse_group_line(grep_result.stdout_text)
+            return _parse_group_line(group_line)
 
     def patch_attributes(self, attributes):
         if isinstance(attributes.get('gid'), int):
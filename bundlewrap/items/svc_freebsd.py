@@ -9,11 +9,6 @@ def svc_start(node, svcname):
     return node.run("/usr/sbin/service {} start".format(quote(svcname)), may_fail=True)
 
 
-def svc_running(node, svcname):
-    result = node.run("/usr/sbin/service {} status".format(quote(svcname)), may_fail=True)
-    return "is running as" in result.stdout_text
-
-
 def svc_stop(node, svcname):
     return node.run("/usr/sbin/service {} stop".format(quote(svcname)), may_fail=True)
 
@@ -22,11 +17,6 @@ def svc_enable(node, svcname):
     return node.run("/usr/sbin/service {} enable".format(quote(svcname)), may_fail=True)
 
 
-def svc_enabled(node, svcname):
-    result = node.run("/usr/sbin/service {} enabled".format(svcname), may_fail=True,)
-    return result.return_code == 0
-
-
 def svc_disable(node, svcname):
     return node.run("/usr/sbin/service {} disable".format(quote(svcname)), may_fail=True)
 
@@ -92,9 +82,16 @@ class SvcFreeBSD(Item):
 
     @property
     def actual_state(self):
+        enabled_result, status_result = self.node.run_many(
+            [
+                "/usr/sbin/service {} enabled".format(quote(self.name)),
+                "/usr/sbin/service {} status".format(quote(self.name)),
+            ],
+            may_fail=True,
+        )
         return {
-            'enabled': svc_enabled(self.node, self.name),
-            'running': svc_running(self.node, self.name),
+            'enabled': enabled_result.return_code == 0,
+            'running': "is running as" in status_result.stdout_text,
         }
 
     @classmethod
@@ -9,11 +9,6 @@ def svc_start(node, svcname):
     return node.run("rcctl start {}".format(quote(svcname)), may_fail=True)
 
 
-def svc_running(node, svcname):
-    result = node.run("rcctl check {}".format(quote(svcname)), may_fail=True)
-    return "ok" in result.stdout_text
-
-
 def svc_stop(node, svcname):
     return node.run("rcctl stop {}".format(quote(svcname)), may_fail=True)
 
@@ -22,11 +17,6 @@ def svc_enable(node, svcname):
     return node.run("rcctl set {} status on".format(quote(svcname)), may_fail=True)
 
 
-def svc_enabled(node, svcname):
-    result = node.run("rcctl get {} status".format(quote(svcname)), may_fail=True)
-    return result.return_code == 0
-
-
 def svc_disable(node, svcname):
     return node.run("rcctl set {} status off".format(quote(svcname)), may_fail=True)
 
@@ -91,9 +81,16 @@ class SvcOpenBSD(Item):
 
     @property
     def actual_state(self):
+        enabled_result, check_result = self.node.run_many(
+            [
+                "rcctl get {} status".format(quote(self.name)),
+                "rcctl check {}".format(quote(self.name)),
+            ],
+            may_fail=True,
+        )
         return {
-            'enabled': svc_enabled(self.node, self.name),
-            'running': svc_running(self.node, self.name),
+            'enabled': enabled_result.return_code == 0,
+            'running': "ok" in check_result.stdout_text,
         }
 
     @classmethod
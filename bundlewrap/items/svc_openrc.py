@@ -2,6 +2,7 @@ from shlex import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
+from bundlewrap.utils.remote import cached_remote_state
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -9,9 +10,8 @@ def svc_start(node, svcname):
     return node.run(f"rc-service {quote(svcname)} start", may_fail=True)
 
 
-def svc_running(node, svcname):
-    result = node.run(f"rc-service {quote(svcname)} status", may_fail=True)
-    return result.return_code == 0 and "started" in result.stdout_text
+def svc_running(status_result):
+    return status_result.return_code == 0 and "started" in status_result.stdout_text
 
 
 def svc_stop(node, svcname):
@@ -22,19 +22,42 @@ def svc_enable(node, svcname, runlevel):
     return node.run(f"rc-update add {quote(svcname)} {quote(runlevel)}", may_fail=True)
 
 
-def svc_enabled(node, svcname, runlevel):
-    result = node.run(
-        f"rc-update show {quote(runlevel)} | grep -w {quote(svcname)}", may_fail=True
-    )
-    return result.return_code == 0 and svcname in result.stdout_text
+def svc_enabled(show_result, svcname):
+    return show_result.return_code == 0 and svcname in show_result.stdout_text
+
+
+def svc_runlevel(show_all_result):
+    return show_all_result.stdout_text.strip() if show_all_result.return_code == 0 else None
 
 
-def svc_runlevel(node, svcname):
-    result = node.run(
-        f"rc-update show --all | grep -w {quote(svcname)} | cut -d \\| -f 2",
+def svc_all_states(node):
+    """
+    Returns a tuple of two dicts for all services on the node. The first
+    maps service names to the runlevels they are in (as printed by
+    `rc-update show`), the second maps service names to their state
+    (e.g. "started").
+    """
+    show_all_result, rc_status_result = node.run_many(
+        [
+            "rc-update show --all",
+            "rc-status --all --nocolor",
+        ],
         may_fail=True,
     )
-    return result.stdout_text.strip() if result.return_code == 0 else None
+    runlevels = {}
+    if show_all_result.return_code == 0:
+        for line in show_all_result.stdout_text.splitlines():
+            if "|" in line:
+                svcname, svc_runlevels = line.split("|", 1)
+                runlevels[svcname.strip()] = svc_runlevels.strip()
+    states = {}
+    if rc_status_result.return_code == 0:
+        for line in rc_status_result.stdout_text.splitlines():
+            if line.rstrip().endswith("]") and "[" in line:
+                svcname, state = line.rstrip()[:-1].split("[", 1)
+                if svcname.strip() and state.split():
+                    states[svcname.strip()] = state.split()[0]
+    return runlevels, states
 
 
 def svc_disable(node, svcname, runlevel):
@@ -102,10 +125,26 @@ class SvcOpenRC(Item):
 
     @property
     def actual_state(self):
+        runlevels, states = cached_remote_state(self.node, "svc_openrc", svc_all_states)
+        if self.name in runlevels and self.name in states:
+            return {
+                "enabled": self.attributes["runlevel"] in runlevels[self.name].split(),
+                "running": states[self.name] == "started",
+                "runlevel": runlevels[self.name],
+            }
+
+        show_result, status_result, show_all_result = self.node.run_many(
+            [
+                f"rc-update show {quote(self.attributes['runlevel'])} | grep -w {quote(self.name)}",
+                f"rc-service {quote(self.name)} status",
+                f"rc-update show --all | grep -w {quote(self.name)} | cut -d \\| -f 2",
+            ],
+            may_fail=True,
+        )
         return {
-            "enabled": svc_enabled(self.node, self.name, self.attributes["runlevel"]),
-            "running": svc_running(self.node, self.name),
-            "runlevel": svc_runlevel(self.node, self.name),
+            "enabled": svc_enabled(show_result, self.name),
+            "running": svc_running(status_result),
+            "runlevel": svc_runlevel(show_all_result),
         }
 
     @classmethod
@@ -2,6 +2,7 @@ from shlex import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
+from bundlewrap.utils.remote import cached_remote_state
 from bundlewrap.utils.text import force_text, mark_for_translation as _
 
 
@@ -9,14 +10,6 @@ def svc_start(node, svcname):
     return node.run("systemctl start -- {}".format(quote(svcname)), may_fail=True)
 
 
-def svc_running(node, svcname):
-    result = node.run(
-        "systemctl status -- {}".format(quote(svcname)),
-        may_fail=True,
-    )
-    return result.return_code == 0
-
-
 def svc_stop(node, svcname):
     return node.run("systemctl stop -- {}".format(quote(svcname)), may_fail=True)
 
@@ -25,14 +18,10 @@ def svc_enable(node, svcname):
     return node.run("systemctl enable -- {}".format(quote(svcname)), may_fail=True)
 
 
-def svc_enabled(node, svcname):
-    result = node.run(
-        "systemctl is-enabled -- {}".format(quote(svcname)),
-        may_fail=True,
-    )
+def svc_enabled(is_enabled_result):
     return (
-        result.return_code == 0 and
-        force_text(result.stdout).strip() != "enabled-runtime"
+        is_enabled_result.return_code == 0 and
+        force_text(is_enabled_result.stdout).strip() != "enabled-runtime"
     )
 
 
@@ -42,20 +31,81 @@ def svc_disable(node, svcname):
 def svc_mask(node, svcname):
     return node.run("systemctl mask -- {}".format(quote(svcname)), may_fail=True)
 
-def svc_masked(node, svcname):
-    result = node.run(
-        "systemctl is-enabled -- {}".format(quote(svcname)),
-        may_fail=True,
-    )
+def svc_masked(is_enabled_result):
     return (
-        result.return_code == 1 and
-        force_text(result.stdout).strip() == "masked"
+        is_enabled_result.return_code == 1 and
+        force_text(is_enabled_result.stdout).strip() == "masked"
     )
 
 def svc_unmask(node, svcname):
     return node.run("systemctl unmask -- {}".format(quote(svcname)), may_fail=True)
 
 
+# unit file states for which `systemctl is-enabled` returns 0
+ENABLED_UNIT_FILE_STATES = {
+    "alias",
+    "enabled",
+    "enabled-runtime",
+    "generated",
+    "indirect",
+    "static",
+    "transient",
+}
+
+# active states for which `systemctl status` returns 0
+RUNNING_ACTIVE_STATES = {"active", "reloading"}
+
+UNIT_TYPES = {
+    "automount",
+    "device",
+    "mount",
+    "path",
+    "scope",
+    "service",
+    "slice",
+    "socket",
+    "swap",
+    "target",
+    "timer",
+}
+
+
+def svc_unit_name(svcname):
+    """
+    Returns the full unit name systemctl will use for the given name.
+    """
+    if svcname.rsplit(".", 1)[-1] in UNIT_TYPES:
+        return svcname
+    return svcname + ".service"
+
+
+def svc_all_states(node):
+    """
+    Returns a tuple of two dicts mapping unit names to their unit file
+    state and active state, respectively, for all units on the node.
+    """
+    list_unit_files_result, list_units_result = node.run_many(
+        [
+            "systemctl list-unit-files --full --no-legend --no-pager",
+            "systemctl list-units --all --full --no-legend --no-pager --plain",
+        ],
+        may_fail=True,
+    )
+    unit_file_states = {}
+    if list_unit_files_result.return_code == 0:
+        for line in list_unit_files_result.stdout_text.splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                unit_file_states[fields[0]] = fields[1]
+    active_states = {}
+    if list_units_result.return_code == 0:
+        for line in list_units_result.stdout_text.splitlines():
+            fields = line.split()
+            if len(fields) >= 3:
+                active_states[fields[0]] = fields[2]
+    return unit_file_states, active_states
+
+
 class SvcSystemd(Item):
     """
     A service managed by systemd.
@@ -130,10 +180,36 @@ class SvcSystemd(Item):
 
     @property
     def actual_state(self):
+        unit_file_states, active_states = \
+            cached_remote_state(self.node, "svc_systemd", svc_all_states)
+        unit = svc_unit_name(self.name)
+        unit_file_state = unit_file_states.get(unit)
+        active_state = active_states.get(unit)
+        # Template instances don't show up in list-unit-files and units
+        # that aren't loaded don't show up in list-units. Aliases are
+        # listed under the name of the unit they point to. Ask systemd
+        # about these individually.
+        if unit_file_state not in (None, "alias") and active_state is not None:
+            return {
+                'enabled': (
+                    unit_file_state in ENABLED_UNIT_FILE_STATES and
+                    unit_file_state != "enabled-runtime"
+                ),
+                'running': active_state in RUNNING_ACTIVE_STATES,
+                'masked': unit_file_state == "masked",
+            }
+
+        status_result, is_enabled_result = self.node.run_many(
+            [
+                "systemctl status -- {}".format(quote(self.name)),
+                "systemctl is-enabled -- {}".format(quote(self.name)),
+            ],
+            may_fail=True,
+        )
         return {
-            'enabled': svc_enabled(self.node, self.name),
-            'running': svc_running(self.node, self.name),
-            'masked': svc_masked(self.node, self.name),
+            'enabled': svc_enabled(is_enabled_result),
+            'running': status_result.return_code == 0,
+            'masked': svc_masked(is_enabled_result),
         }
 
     @classmethod
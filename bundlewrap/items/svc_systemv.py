@@ -1,7 +1,9 @@
+from re import compile as re_compile
 from shlex import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
+from bundlewrap.utils.remote import cached_remote_state
 from bundlewrap.utils.text import mark_for_translation as _
 
 
@@ -21,6 +23,27 @@ def svc_stop(node, svcname):
     return node.run("/etc/init.d/{} stop".format(quote(svcname)), may_fail=True)
 
 
+# matches lines like " [ + ]  ssh" as printed by `service --status-all`
+# on Debian and derivatives
+STATUS_ALL_LINE = re_compile(r"^\s*\[ ([+-]) \]\s+(\S+)\s*$")
+
+
+def svc_all_running(node):
+    """
+    Returns a dict mapping service names to whether they are running
+    for all init scripts on the node that have a status command. The
+    dict is empty if the node doesn't support `service --status-all`.
+    """
+    result = node.run("service --status-all", may_fail=True)
+    running = {}
+    if result.return_code == 0:
+        for line in result.stdout_text.splitlines():
+            match = STATUS_ALL_LINE.match(line)
+            if match:
+                running[match.group(2)] = match.group(1) == "+"
+    return running
+
+
 class SvcSystemV(Item):
     """
     A service managed by traditional System V init scripts.
@@ -68,7 +91,11 @@ class SvcSystemV(Item):
 
     @property
     def actual_state(self):
-        return {'running': svc_running(self.node, self.name)}
+        try:
+            running = cached_remote_state(self.node, "svc_systemv", svc_all_running)[self.name]
+        except KeyError:
+            running = svc_running(self.node, self.name)
+        return {'running': running}
 
     @classmethod
     def validate_attributes(cls, bundle, item_id, attributes):
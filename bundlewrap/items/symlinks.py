@@ -6,7 +6,6 @@ from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item
 from bundlewrap.utils.remote import PathInfo
 from bundlewrap.utils.text import mark_for_translation as _
-from bundlewrap.utils.text import is_subdirectory
 
 
 ATTRIBUTE_VALIDATORS = defaultdict(lambda: lambda id, value: None)
@@ -101,15 +100,15 @@ class Symlink(Item):
         if self.attributes['owner'] or self.attributes['group']:
             self._fix_ownership(status)
 
+    def get_indexed_paths(self):
+        return (self.name,)
+
     def get_auto_attrs(self, items):
         deps = set()
-        for item in items:
+        for item in items.items_above(self.name) + items.items_at(self.name):
             if item == self:
                 continue
-            if item.ITEM_TYPE_NAME == "file" and (
-                is_subdirectory(item.name, self.name) or
-                item.name == self.name
-            ):
+            if item.ITEM_TYPE_NAME == "file":
                 raise BundleError(_(
                     "{item1} (from bundle '{bundle1}') blocking path to "
                     "{item2} (from bundle '{bundle2}')"
@@ -119,35 +118,24 @@ class Symlink(Item):
                     item2=self.id,
                     bundle2=self.bundle.name,
                 ))
-            elif item.ITEM_TYPE_NAME == "user" and item.name == self.attributes['owner']:
-                if item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
-            elif item.ITEM_TYPE_NAME == "group" and item.name == self.attributes['group']:
-                if item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
-            elif item.ITEM_TYPE_NAME in ("directory", "symlink"):
-                if is_subdirectory(item.name, self.name):
-                    deps.add(item.id)
+            elif item.ITEM_TYPE_NAME in ("directory", "symlink") and item.name != self.name:
+                deps.add(item.id)
+        for item_type, name in (('user', self.attributes['owner']), ('group', self.attributes['group'])):
+            item = items.get(item_type, name)
+            if item is None:
+                continue
+            elif item.attributes['delete']:
+                raise BundleError(_(
+                    "{item1} (from bundle '{bundle1}') depends on item "
+                    "{item2} (from bundle '{bundle2}') which is set to be deleted"
+                ).format(
+                    item1=self.id,
+                    bundle1=self.bundle.name,
+                    item2=item.id,
+                    bundle2=item.bundle.name,
+                ))
+            else:
+                deps.add(item.id)
         return {
             'needs': deps,
         }
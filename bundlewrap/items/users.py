@@ -1,9 +1,10 @@
 from shlex import quote
 from string import ascii_lowercase, digits
 
-from bundlewrap.exceptions import BundleError
+from bundlewrap.exceptions import BundleError, RemoteException
 from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item
 from bundlewrap.utils.crypto import bcrypt
+from bundlewrap.utils.remote import cached_remote_state
 from bundlewrap.utils.text import force_text, mark_for_translation as _
 
 _ATTRIBUTE_NAMES = {
@@ -28,27 +29,93 @@ _ATTRIBUTE_OPTIONS = {
 
 _USERNAME_VALID_CHARACTERS = ascii_lowercase + digits + "-_"
 
+# name service sources that only look at /etc/group (systemd only
+# adds dynamic users, which we don't manage)
+_LOCAL_NSS_SOURCES = {"files", "systemd"}
 
-def _group_name_for_gid(node, gid):
+
+def _lines_by_name(text):
     """
-    Returns the group name that matches the gid.
+    Returns a dict mapping the first field of each line in the given
+    /etc/passwd-like file content to the whole line.
     """
-    group_output = node.run("grep -e ':{}:[^:]*$' /etc/group".format(gid), may_fail=True)
-    if group_output.return_code != 0:
-        return None
+    lines = {}
+    for line in text.splitlines():
+        if not line or line.startswith(("#", "+", "-")):
+            continue
+        lines.setdefault(line.split(":", 1)[0], line)
+    return lines
+
+
+def _nss_uses_local_groups(nsswitch_conf):
+    for line in nsswitch_conf.splitlines():
+        if line.strip().startswith("group:"):
+            return set(line.split("#", 1)[0].split()[1:]) <= _LOCAL_NSS_SOURCES
+    return False
+
+
+def _fetch_user_database(node):
+    if node.os in node.OS_FAMILY_BSD:
+        commands = ["cat /etc/master.passwd", "cat /etc/group", "cat /etc/nsswitch.conf"]
     else:
-        return group_output.stdout_text.split(":")[0]
+        commands = ["cat /etc/passwd", "cat /etc/group", "cat /etc/nsswitch.conf", "cat /etc/shadow"]
+    results = node.run_many(commands, may_fail=True)
+    for result in results[:2]:
+        if result.return_code != 0:
+            raise RemoteException(_(
+                "unable to read user database on {node}:\n\n{output}"
+            ).format(
+                node=node.name,
+                output=result.stdout_text + result.stderr_text,
+            ))
+
+    groups = _lines_by_name(results[1].stdout_text)
+    group_names_by_gid = {}
+    group_ids_by_member = {}
+    for name, line in groups.items():
+        group = line.split(":")
+        if len(group) < 4:
+            continue
+        group_names_by_gid.setdefault(group[2], name)
+        for member in group[3].split(","):
+            group_ids_by_member.setdefault(member.strip(), set()).add(group[2])
+
+    return {
+        'group_ids_by_member': group_ids_by_member,
+        'group_names_by_gid': group_names_by_gid,
+        'groups': groups,
+        'local_groups_only': (
+            results[2].return_code == 0 and
+            _nss_uses_local_groups(results[2].stdout_text)
+        ),
+        'passwd': _lines_by_name(results[0].stdout_text),
+        'shadow': (
+            _lines_by_name(results[3].stdout_text)
+            if len(results) > 3 and results[3].return_code == 0
+            else {}
+        ),
+    }
+
+
+def _user_database(node):
+    """
+    Returns the contents of /etc/passwd, /etc/shadow and /etc/group on
+    the given node, read with a single command and cached until
+    forget_remote_state() is called.
+    """
+    return cached_remote_state(node, "user_database", _fetch_user_database)
 
 
-def _groups_for_user(node, username):
+def _groups_for_user(user_database, username, gid):
     """
-    Returns the list of group names for the given username on the given
-    node.
+    Returns the list of supplementary group names for the given
+    username, like `id -Gn` would (minus the primary group).
     """
-    groups = node.run("id -Gn {}".format(username)).stdout_text.strip().split(" ")
-    primary_group = node.run("id -gn {}".format(username)).stdout_text.strip()
-    groups.remove(primary_group)
-    return groups
+    return [
+        user_database['group_names_by_gid'][group_id]
+        for group_id in user_database['group_ids_by_member'].get(username, ())
+        if group_id != gid
+    ]
 
 
 def _parse_passwd_line(line, entries):
@@ -192,42 +259,36 @@ class User(Item):
     def get_auto_attrs(self, items):
         deps = set()
         groups = self.attributes['groups'] or []
-        for item in items:
-            if item.ITEM_TYPE_NAME == "group":
-                if not (item.name in groups or (
-                    self.attributes['gid'] in [item.attributes['gid'], item.name] and
-                    self.attributes['gid'] is not None
-                )):
-                    # we don't need to depend on this group
-                    continue
-                elif item.attributes['delete']:
-                    raise BundleError(_(
-                        "{item1} (from bundle '{bundle1}') depends on item "
-                        "{item2} (from bundle '{bundle2}') which is set to be deleted"
-                    ).format(
-                        item1=self.id,
-                        bundle1=self.bundle.name,
-                        item2=item.id,
-                        bundle2=item.bundle.name,
-                    ))
-                else:
-                    deps.add(item.id)
+        for item in items.items_of_type("group"):
+            if not (item.name in groups or (
+                self.attributes['gid'] in [item.attributes['gid'], item.name] and
+                self.attributes['gid'] is not None
+            )):
+                # we don't need to depend on this group
+                continue
+            elif item.attributes['delete']:
+                raise BundleError(_(
+                    "{item1} (from bundle '{bundle1}') depends on item "
+                    "{item2} (from bundle '{bundle2}') which is set to be deleted"
+                ).format(
+                    item1=self.id,
+                    bundle1=self.bundle.name,
+                    item2=item.id,
+                    bundle2=item.bundle.name,
+                ))
+            else:
+                deps.add(item.id)
         return {
             'needs': deps,
         }
 
     @property
     def actual_state(self):
+        user_database = _user_database(self.node)
+
         # verify content of /etc/passwd
-        if self.node.os in self.node.OS_FAMILY_BSD:
-            password_command = "grep -ae '^{}:' /etc/master.passwd"
-        else:
-            password_command = "grep -ae '^{}:' /etc/passwd"
-        passwd_grep_result = self.run(
-            password_command.format(self.name),
-            may_fail=True,
-        )
-        if passwd_grep_result.return_code != 0:
+        passwd_line = user_database['passwd'].get(self.name)
+        if passwd_line is None:
             return None
 
         if self.node.os in self.node.OS_FAMILY_BSD:
@@ -246,28 +307,36 @@ class User(Item):
         else:
             entries = ('username', 'passwd_hash', 'uid', 'gid', 'gecos', 'home', 'shell')
 
-        actual_state = _parse_passwd_line(passwd_grep_result.stdout_text, entries)
+        actual_state = _parse_passwd_line(passwd_line, entries)
+        gid = actual_state['gid']
 
         if self.attributes['gid'] is not None and not self.attributes['gid'].isdigit():
-            actual_state['gid'] = _group_name_for_gid(self.node, actual_state['gid'])
+            actual_state['gid'] = user_database['group_names_by_gid'].get(gid)
 
         if self.attributes['password_hash'] is not None:
             if self.attributes['use_shadow'] and self.node.os not in self.node.OS_FAMILY_BSD:
                 # verify content of /etc/shadow unless we are on OpenBSD
-                shadow_grep_result = self.run(
-                    "grep -e '^{}:' /etc/shadow".format(self.name),
-                    may_fail=True,
-                )
-                if shadow_grep_result.return_code != 0:
+                shadow_line = user_database['shadow'].get(self.name)
+                if shadow_line is None:
                     actual_state['password_hash'] = None
                 else:
-                    actual_state['password_hash'] = shadow_grep_result.stdout_text.split(":")[1]
+                    actual_state['password_hash'] = shadow_line.split(":")[1]
             else:
                 actual_state['password_hash'] = actual_state['passwd_hash']
         del actual_state['passwd_hash']
 
         # verify content of /etc/group
-        actual_state['groups'] = set(_groups_for_user(self.node, self.name))
+        if user_database['local_groups_only']:
+            actual_state['groups'] = set(_groups_for_user(user_database, self.name, gid))
+        else:
+            # groups might come from somewhere else, ask the system
+            groups_result, primary_group_result = self.run_many([
+                "id -Gn {}".format(self.name),
+                "id -gn {}".format(self.name),
+            ])
+            groups = groups_result.stdout_text.strip().split(" ")
+            groups.remove(primary_group_result.stdout_text.strip())
+            actual_state['groups'] = set(groups)
 
         return actual_state
 
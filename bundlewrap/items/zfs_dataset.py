@@ -88,12 +88,19 @@ class ZFSDataset(Item):
             for option in status.keys_to_fix:
                 self.__set_option(self.name, option, status.expected_state[option])
 
+    def get_indexed_paths(self):
+        mountpoint = self.attributes.get('mountpoint')
+        if mountpoint and mountpoint.startswith("/"):
+            return (mountpoint,)
+        else:
+            return ()
+
     def get_auto_attrs(self, items):
         pool = self.name.split("/")[0]
         pool_item = "zfs_pool:{}".format(pool)
         needs = set()
 
-        for item in items:
+        for item in items.items_of_type("zfs_pool") + items.items_of_type("zfs_dataset"):
             if item.ITEM_TYPE_NAME == "zfs_pool" and item.name == pool:
                 # Add dependency to the pool this dataset resides on.
                 needs.add(pool_item)
@@ -1,5 +1,6 @@
 from datetime import datetime
 from getpass import getuser
+from io import BytesIO
 import json
 from os import environ
 from shlex import quote
@@ -59,7 +60,7 @@ class NodeLock:
                 with io.job(_("{node}  checking hard lock status").format(node=bold(self.node.name))):
                     result = self.locking_node.run("mkdir " + quote(self._hard_lock_dir()), may_fail=True)
                     if result.return_code != 0:
-                        info = self._get_hard_lock_info(local_path)
+                        info = self._get_hard_lock_info()
                         expired = False
                         try:
                             d = info['date']
@@ -109,11 +110,11 @@ class NodeLock:
                 x=red("!"),
             ))
 
-    def _get_hard_lock_info(self, local_path):
+    def _get_hard_lock_info(self):
+        content = BytesIO()
         try:
-            self.locking_node.download(self._hard_lock_file(), local_path)
-            with open(local_path, 'r') as fp:
-                return json.load(fp)
+            self.locking_node.download(self._hard_lock_file(), content)
+            return json.loads(content.getvalue())
         except (RemoteException, TransportException, ValueError):
                 io.stderr(_(
                     "{x} {node_bold}  corrupted hard lock: "
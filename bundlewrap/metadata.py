@@ -4,7 +4,13 @@ from json import dumps, JSONEncoder
 
 from .exceptions import RepositoryError
 from .utils import Fault
-from .utils.dicts import ATOMIC_TYPES, map_dict_keys, merge_dict, value_at_key_path
+from .utils.dicts import (
+    _Atomic,
+    ATOMIC_TYPES,
+    map_dict_keys,
+    merge_dict,
+    value_at_key_path,
+)
 from .utils.text import force_text, mark_for_translation as _, yellow
 
 
@@ -44,8 +50,139 @@ def deepcopy_metadata(obj):
         assert False  # there should be no other types
 
     # Try to preserve the original type, even if its a superclass of
-    # dict, list, tuple or set.
-    return type(obj)(new_obj)
+    # dict, list, tuple or set. Frozen types are turned into their
+    # mutable counterparts.
+    return _THAWED_TYPES.get(type(obj), type(obj))(new_obj)
+
+
+def _frozen(*args, **kwargs):
+    raise TypeError(_(
+        "metadata returned by node.metadata.get() is read-only, "
+        "use .copy() to get a mutable copy"
+    ))
+
+
+class FrozenDict(dict):
+    """
+    A dict that cannot be modified. Copies are regular dicts.
+    """
+    __delitem__ = __ior__ = __setitem__ = _frozen
+    clear = pop = popitem = setdefault = update = _frozen
+
+    def __copy__(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    copy = __copy__
+
+
+class FrozenList(list):
+    """
+    A list that cannot be modified. Copies are regular lists.
+    """
+    __delitem__ = __iadd__ = __imul__ = __setitem__ = _frozen
+    append = clear = extend = insert = pop = remove = reverse = sort = _frozen
+
+    def __copy__(self):
+        return list(self)
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    copy = __copy__
+
+
+class FrozenSet(set):
+    """
+    A set that cannot be modified. Copies are regular sets.
+
+    Unlike frozenset, this is still a subclass of set and will be
+    treated as such when merging metadata.
+    """
+    __iand__ = __ior__ = __isub__ = __ixor__ = _frozen
+    add = clear = discard = pop = remove = update = _frozen
+    difference_update = intersection_update = symmetric_difference_update = _frozen
+
+    def __copy__(self):
+        return set(self)
+
+    def __reduce__(self):
+        return (type(self), (set(self),))
+
+    copy = __copy__
+
+
+class _FrozenAtomicDict(FrozenDict, _Atomic):
+    def __copy__(self):
+        return ATOMIC_TYPES[dict](self)
+
+    copy = __copy__
+
+
+class _FrozenAtomicList(FrozenList, _Atomic):
+    def __copy__(self):
+        return ATOMIC_TYPES[list](self)
+
+    copy = __copy__
+
+
+class _FrozenAtomicSet(FrozenSet, _Atomic):
+    def __copy__(self):
+        return ATOMIC_TYPES[set](self)
+
+    copy = __copy__
+
+
+_THAWED_TYPES = {
+    FrozenDict: dict,
+    FrozenList: list,
+    FrozenSet: set,
+    _FrozenAtomicDict: ATOMIC_TYPES[dict],
+    _FrozenAtomicList: ATOMIC_TYPES[list],
+    _FrozenAtomicSet: ATOMIC_TYPES[set],
+}
+
+
+def freeze_metadata(obj):
+    """
+    Like deepcopy_metadata(), but returns read-only versions of dicts,
+    lists and sets. The result can be handed out to any number of
+    callers without having to copy it again.
+
+    Values that are already frozen all the way down are returned as
+    they are, anything else is frozen recursively (that includes
+    mutable values nested in foreign frozen containers). Atomic values
+    are turned into read-only atomic values.
+    """
+    if isinstance(obj, METADATA_TYPES):
+        return obj
+    elif isinstance(obj, dict):
+        frozen_type = _FrozenAtomicDict if isinstance(obj, _Atomic) else FrozenDict
+        items = {key: freeze_metadata(value) for key, value in obj.items()}
+        if type(obj) is frozen_type and all(items[key] is value for key, value in obj.items()):
+            return obj
+        return frozen_type(items)
+    elif isinstance(obj, list):
+        frozen_type = _FrozenAtomicList if isinstance(obj, _Atomic) else FrozenList
+        values = [freeze_metadata(value) for value in obj]
+        if type(obj) is frozen_type and all(new is old for new, old in zip(values, obj)):
+            return obj
+        return frozen_type(values)
+    elif isinstance(obj, set):
+        # set members are hashable and thus immutable already
+        frozen_type = _FrozenAtomicSet if isinstance(obj, _Atomic) else FrozenSet
+        if type(obj) is frozen_type:
+            return obj
+        return frozen_type(obj)
+    elif isinstance(obj, tuple):
+        values = tuple(freeze_metadata(value) for value in obj)
+        if all(new is old for new, old in zip(values, obj)):
+            return obj
+        return type(obj)(values)
+    else:
+        assert False  # there should be no other types
 
 
 def validate_metadata(metadata, _top_level=True):
@@ -337,8 +474,49 @@ def metadata_to_json(metadata, resolve_faults=True, sort_keys=True):
     )
 
 
+def _value_to_json(value):
+    return dumps(
+        value,
+        cls=MetadataJSONEncoder,
+        indent=4,
+        sort_keys=True,
+    )
+
+
+def metadata_items_to_json(items, fragment_cache):
+    """
+    Returns the same JSON as metadata_to_json() for a dict made from
+    the given (key, value, static) tuples, which must be sorted by key.
+
+    JSON for static values (see Metastack.top_level_items()) is stored
+    in fragment_cache, so group metadata shared by many nodes only has
+    to be encoded once.
+    """
+    lines = []
+    for key, value, static in items:
+        if static and isinstance(value, (dict, list, set, tuple)):
+            try:
+                fragment = fragment_cache[id(value)][1]
+            except KeyError:
+                fragment = _value_to_json(value)
+                # keep a reference so the id can't be reused
+                fragment_cache[id(value)] = (value, fragment)
+        else:
+            fragment = _value_to_json(value)
+        # JSON strings can't contain literal newlines, so this is safe
+        lines.append("    {}: {}".format(dumps(key), fragment.replace("\n", "\n    ")))
+
+    if not lines:
+        return "{}"
+    return "{\n" + ",\n".join(lines) + "\n}"
+
+
 def hash_metadata(actual_state):
     """
     Returns a canonical sha256 hash to describe this dict.
     """
-    return sha256(metadata_to_json(actual_state).encode('utf-8')).hexdigest()
+    if actual_state.__class__.__name__ == 'NodeMetadataProxy':
+        json = actual_state._json_for_hashing()
+    else:
+        json = metadata_to_json(actual_state)
+    return sha256(json.encode('utf-8')).hexdigest()
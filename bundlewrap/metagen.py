@@ -1,14 +1,25 @@
 from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
+from heapq import heappop, heappush
+from itertools import count
+from json import dumps
 from os import environ
-from threading import RLock
+from threading import local, RLock
+from time import perf_counter
 from traceback import TracebackException
 
-from .exceptions import MetadataPersistentKeyError, MetadataUnavailable
-from .metadata import DoNotRunAgain
+from .exceptions import MetadataPersistentKeyError, MetadataUnavailable, NoSuchNode
+from .metadata import (
+    DoNotRunAgain,
+    metadata_items_to_json,
+    metadata_to_json,
+    validate_metadata,
+)
 from .node import _flatten_group_hierarchy
-from .utils import NO_DEFAULT, error_context, list_starts_with, randomize_order
+from .utils import NO_DEFAULT, error_context, randomize_order
 from .utils.dicts import extra_paths_in_dict
+from .utils.metacache import hash_for_cache, ReactorCache
 from .utils.metastack import Metastack
 from .utils.text import bold, mark_for_translation as _, red
 from .utils.ui import io, QUIT_EVENT
@@ -16,6 +27,94 @@ from .utils.ui import io, QUIT_EVENT
 MAX_METADATA_ITERATIONS = int(environ.get("BW_MAX_METADATA_ITERATIONS", "1000"))
 
 
+class _UNAVAILABLE: pass
+
+
+class _LeftNodeGroup(BaseException):
+    """
+    Raised when a reactor running concurrently with other groups of
+    reactors reads metadata of a node outside its own group. This is
+    a BaseException so reactors catching Exception won't swallow it.
+    """
+    pass
+
+
+class _ReactorContext(local):
+    """
+    Keeps track of the reactor the current thread is executing.
+    """
+    def __init__(self):
+        # are we currently executing a reactor?
+        self.in_a_reactor = False
+        # (node name, reactor name) of the current reactor
+        self.reactor = None
+        # paths the current reactor declared to provide
+        self.provides = ()
+        # all new paths not requested before by the current reactor
+        self.newly_requested_paths = set()
+        # reactors triggered by the most recent reactor run
+        self.triggered_by_last_run = set()
+        # names of the nodes reactors in this thread may read metadata
+        # from, None unless groups of reactors run concurrently
+        self.nodes = None
+
+
+def _topological_ranks(graph):
+    """
+    Takes a dict mapping vertices to sets of successors and returns a
+    dict mapping each vertex to a rank. Vertices in the same strongly
+    connected component share a rank and ranks increase along edges
+    between components.
+    """
+    # iterative version of Tarjan's algorithm to avoid hitting the
+    # recursion limit on large graphs
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            vertex, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                elif successor in on_stack:
+                    lowlink[vertex] = min(lowlink[vertex], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[vertex])
+                if lowlink[vertex] == index[vertex]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == vertex:
+                            break
+                    components.append(component)
+
+    # Tarjan finds components in reverse topological order
+    ranks = {}
+    for rank, component in enumerate(reversed(components)):
+        for vertex in component:
+            ranks[vertex] = rank
+    return ranks
+
+
 class ReactorTree:
     def __init__(self, path_location=None):
         self._path_location = path_location
@@ -46,6 +145,9 @@ class ReactorTree:
                 yield from child.reactors_for()
 
 
+class _PATH_END: pass
+
+
 class PathSet:
     """
     Collects metadata paths and stores only the highest levels ones.
@@ -55,11 +157,16 @@ class PathSet:
     >>> s.add(("foo",))
     >>> s
     {"foo"}
+
+    Paths are kept in a prefix tree, so add() and covers() only
+    depend on the length of the given path, not on how many paths
+    are already in the set.
     """
 
     def __init__(self, paths=()):
-        self._covers_cache = {}
         self._paths = set()
+        # nested dicts, _PATH_END marks the end of a stored path
+        self._tree = {}
         for path in paths:
             self.add(path)
 
@@ -74,12 +181,18 @@ class PathSet:
         return "<PathSet: {}>".format(repr(self._paths))
 
     def add(self, new_path):
-        if self.covers(new_path):
+        new_path = tuple(new_path)
+        node = self._tree
+        for key in new_path:
+            if _PATH_END in node:
+                return False
+            node = node.setdefault(key, {})
+        if _PATH_END in node:
             return False
-        for existing_path in self._paths.copy():
-            if list_starts_with(existing_path, new_path):
-                self._paths.remove(existing_path)
-        self._covers_cache = {}
+        # existing paths below the new one are now redundant
+        self._paths.difference_update(self._paths_below(node, new_path))
+        node.clear()
+        node[_PATH_END] = True
         self._paths.add(new_path)
         return True
 
@@ -87,16 +200,22 @@ class PathSet:
         """
         Returns True if the given path is already included.
         """
-        try:
-            return self._covers_cache[candidate_path]
-        except KeyError:
-            result = False
-            for existing_path in self._paths:
-                if list_starts_with(candidate_path, existing_path):
-                    result = True
-                    break
-            self._covers_cache[candidate_path] = result
-            return result
+        node = self._tree
+        for key in candidate_path:
+            if _PATH_END in node:
+                return True
+            try:
+                node = node[key]
+            except KeyError:
+                return False
+        return _PATH_END in node
+
+    def _paths_below(self, node, prefix):
+        for key, child in node.items():
+            if key is _PATH_END:
+                yield prefix
+            else:
+                yield from self._paths_below(child, prefix + (key,))
 
 
 class NodeMetadataProxy:
@@ -104,18 +223,28 @@ class NodeMetadataProxy:
         self._metagen = metagen
         self._node = node
         self._completed_paths = PathSet()
-        self._metastack = Metastack()
+        # guards _completed_paths, _metastack and _revising, allowing
+        # completed metadata to be read without holding
+        # _node_metadata_lock
+        self._lock = RLock()
+        # set while a metadata build is rerunning reactors for this
+        # node, completed paths might be revised until it has finished
+        self._revising = False
+        self._metastack = Metastack(
+            materialized=True,
+            frozen=environ.get("BW_FROZEN_METADATA", "0") == "1",
+        )
 
     @property
     def blame(self):
-        if self._metagen._in_a_reactor:
+        if self._metagen._reactor_context.in_a_reactor:
             raise RuntimeError("cannot call node.metadata.blame from a reactor")
         else:
             return self._metastack.as_blame()
 
     @property
     def stack(self):
-        if self._metagen._in_a_reactor:
+        if self._metagen._reactor_context.in_a_reactor:
             raise RuntimeError("cannot call node.metadata.stack from a reactor")
         else:
             return self._metastack
@@ -124,18 +253,52 @@ class NodeMetadataProxy:
         if not isinstance(path, (tuple, list)):
             path = tuple(path.split("/"))
 
-        if self._metagen._in_a_reactor and self._metagen._record_reactor_call_graph:
-            for provided_path in self._metagen._current_reactor_provides:
+        context = self._metagen._reactor_context
+
+        if context.in_a_reactor and self._metagen._record_reactor_call_graph:
+            for provided_path in context.provides:
                 self._metagen._reactor_call_graph.add((
-                    (self._metagen._current_reactor[0], provided_path),
+                    (context.reactor[0], provided_path),
                     (self._node.name, path),
-                    self._metagen._current_reactor,
+                    context.reactor,
                 ))
 
-        with self._metagen._node_metadata_lock:
+        if not context.in_a_reactor:
+            # Fast path for metadata that has already been generated.
+            # This way, reading completed metadata for one node doesn't
+            # have to wait until metadata generation for another node
+            # has finished. Completed paths and the metastack are only
+            # consistent with each other while no reactor is revising
+            # them, otherwise we take the slow path below and wait for
+            # the build to finish.
+            with self._lock:
+                if not self._revising and self._completed_paths.covers(path):
+                    try:
+                        return self._metastack.get(path)
+                    except MetadataUnavailable as exc:
+                        if default != NO_DEFAULT:
+                            return default
+                        else:
+                            raise exc
+
+        if context.nodes is None:
+            lock = self._metagen._node_metadata_lock
+        else:
+            # We are running concurrently with other groups of reactors
+            # while the thread that started the build is holding
+            # _node_metadata_lock. Those other groups never touch the
+            # nodes of our group, so we only have to protect shared
+            # bookkeeping. Reading any other node could race with
+            # them, so we back out and try again in the next iteration.
+            if self._node.name not in context.nodes:
+                self._metagen._join_node_groups(context.reactor[0], self._node.name)
+                raise _LeftNodeGroup(self._node.name)
+            lock = self._metagen._reactor_bookkeeping_lock
+
+        with lock:
             # The lock is required because there are several thread-unsafe things going on here:
             #
-            #   self._metagen._current_reactor_newly_requested_paths
+            #   self._metagen._reactors
             #   self._metagen._build_node_metadata
             #   self._metastack
             #
@@ -143,35 +306,66 @@ class NodeMetadataProxy:
             # called from _build_node_metadata (when reactors call node.metadata.get()).
             if self._node not in self._metagen._relevant_nodes:
                 self._metagen._initialize_node(self._node)
-            if self._metagen._in_a_reactor:
-                if self._metagen._reactors[self._metagen._current_reactor]['requested_paths'].add(
+            if context.in_a_reactor:
+                if self._metagen._reactors[context.reactor]['requested_paths'].add(
                     (self._node.name,) + path
                 ):
-                    self._metagen._current_reactor_newly_requested_paths.add(
-                        (self._node.name,) + path
-                    )
-            elif not self._completed_paths.covers(path):
-                io.debug(f"metagen triggered by request for {path} on {self._node.name}")
-                self._metagen._trigger_reactors_for_path(
-                    (self._node.name,) + path,
-                    f"initial request for {path}",
-                )
-                with io.job(_("building metadata...")):
-                    self._metagen._build_node_metadata(self._node)
-                self._completed_paths.add(path)
+                    context.newly_requested_paths.add((self._node.name,) + path)
+                    self._metagen._join_node_groups(context.reactor[0], self._node.name)
+            else:
+                self._build(path)
 
             try:
-                return self._metastack.get(path)
+                with self._lock:
+                    return self._metastack.get(path)
             except MetadataUnavailable as exc:
                 if default != NO_DEFAULT:
                     return default
                 else:
-                    if self._metagen._in_a_reactor:
-                        self._metagen._reactors_with_keyerrors[self._metagen._current_reactor] = \
+                    if context.in_a_reactor:
+                        self._metagen._reactors_with_keyerrors[context.reactor] = \
                             ((self._node.name, path), exc)
                     raise exc
 
 
+    def _build(self, path):
+        """
+        Makes sure metadata for the given path has been generated.
+        Caller must hold _node_metadata_lock.
+        """
+        with self._lock:
+            completed = self._completed_paths.covers(path)
+        if not completed:
+            io.debug(f"metagen triggered by request for {path} on {self._node.name}")
+            self._metagen._trigger_reactors_for_path(
+                (self._node.name,) + path,
+                f"initial request for {path}",
+            )
+            with io.job(_("building metadata...")):
+                self._metagen._build_node_metadata(self._node)
+            with self._lock:
+                self._completed_paths.add(path)
+
+    def _json_for_hashing(self):
+        """
+        Returns the same JSON as metadata_to_json(), but without
+        copying all metadata first and reusing JSON for metadata
+        shared with other nodes.
+        """
+        if self._metagen._reactor_context.in_a_reactor:
+            return metadata_to_json(self.get(()))
+
+        with self._metagen._node_metadata_lock:
+            if self._node not in self._metagen._relevant_nodes:
+                self._metagen._initialize_node(self._node)
+            self._build(())
+            with self._lock:
+                return metadata_items_to_json(
+                    self._metastack.top_level_items(),
+                    self._metagen._metadata_json_fragments,
+                )
+
+
 class MetadataGenerator:
     def __init__(self):
         # node.metadata calls these
@@ -195,23 +389,102 @@ class MetadataGenerator:
         # bw plot reactors
         self._reactor_call_graph = set()
         self._reactor_runs = defaultdict(int)
-        # are we currently executing a reactor?
-        self._in_a_reactor = False
-        # all new paths not requested before by the current reactor
-        self._current_reactor_newly_requested_paths = set()
+        # state of the reactor each thread is currently executing
+        self._reactor_context = _ReactorContext()
+        # guards bookkeeping shared by concurrently running reactors
+        self._reactor_bookkeeping_lock = RLock()
+        # run reactors not connected by any metadata access concurrently
+        self._metadata_workers = int(environ.get("BW_METADATA_WORKERS", "1"))
+        # maps node names to another node their reactors depend on or
+        # are depended on by, see __node_group()
+        self._node_groups = {}
         # should reactor return values be checked against their declared keys?
         self._verify_reactor_provides = False
         # should we collect information for `bw plot reactors`?
         self._record_reactor_call_graph = False
+        # should we collect information for `bw metadata --profile`?
+        self._record_reactor_profile = False
+        self._reactor_durations = defaultdict(float)
+        self._reactor_keyerror_counts = defaultdict(int)
+        self._reactor_result_sizes = defaultdict(int)
+        # optional persistent cache of reactor results
+        if environ.get("BW_METADATA_CACHE"):
+            self._reactor_cache = ReactorCache(environ["BW_METADATA_CACHE"])
+        else:
+            self._reactor_cache = None
+        # reactor dependency graph has changed since ranks were computed
+        self._reactor_graph_changed = False
+        # position of reactors in the dependency graph
+        self._reactor_ranks = {}
+        # reactors that were run in the same iteration that triggered them
+        self._reactors_run_early = 0
+        # reactors that were actually executed (not served from cache)
+        # and have not yet been written to the cache
+        self._reactors_executed = set()
+        # JSON for static metadata, used when hashing node metadata
+        self._metadata_json_fragments = {}
+        # merged group metadata by group order
+        self._merged_group_metadata = {}
+        # proxies of nodes whose reactors ran during the current build
+        self._revised_proxies = set()
+        # names of groups whose metadata has been validated
+        self._validated_group_metadata = set()
 
     def _metadata_proxy_for_node(self, node_name):
-        if node_name not in self._node_metadata_proxies:
-            self._node_metadata_proxies[node_name] = \
-                NodeMetadataProxy(self, self.get_node(node_name))
-        return self._node_metadata_proxies[node_name]
+        try:
+            return self._node_metadata_proxies[node_name]
+        except KeyError:
+            # setdefault() makes sure concurrent callers (e.g. reactors
+            # running in parallel) end up with the same proxy
+            return self._node_metadata_proxies.setdefault(
+                node_name,
+                NodeMetadataProxy(self, self.get_node(node_name)),
+            )
+
+    def _build_metadata_for_nodes(self, nodes):
+        """
+        Makes sure complete metadata for all given nodes has been
+        generated. Unlike requesting it node by node, this runs a
+        single build for all of them, allowing reactors of unrelated
+        nodes to run concurrently (see BW_METADATA_WORKERS).
+        """
+        with self._node_metadata_lock:
+            incomplete = []
+            for node in nodes:
+                proxy = node.metadata
+                if node not in self._relevant_nodes:
+                    self._initialize_node(node)
+                with proxy._lock:
+                    if proxy._completed_paths.covers(()):
+                        continue
+                self._trigger_reactors_for_path(
+                    (node.name,),
+                    f"initial request for {node.name}",
+                )
+                incomplete.append(proxy)
+
+            if not incomplete:
+                return
+
+            io.debug(f"metagen triggered by request for {len(incomplete)} nodes")
+            with io.job(_("building metadata...")):
+                self._build_node_metadata(None)
+            for proxy in incomplete:
+                with proxy._lock:
+                    proxy._completed_paths.add(())
 
     def _build_node_metadata(self, initial_node_name):
+        try:
+            self.__build_node_metadata()
+        finally:
+            for proxy in self._revised_proxies:
+                with proxy._lock:
+                    proxy._revising = False
+            self._revised_proxies.clear()
+
+    def __build_node_metadata(self):
         self.__iterations = 0
+        self._reactors_run_early = 0
 
         while True:
             self.__check_iteration_count()
@@ -243,7 +516,14 @@ class MetadataGenerator:
                     msg += "    " + line
             raise MetadataPersistentKeyError(msg)
 
-        io.debug("metadata generation finished")
+        if self._reactor_cache is not None:
+            self.__write_reactor_cache()
+
+        io.debug(
+            f"metadata generation finished after {self.__iterations} iterations, "
+            f"dependency ordering allowed {self._reactors_run_early} triggered "
+            f"reactors to run in the same iteration as their trigger"
+        )
 
     def _initialize_node(self, node):
         io.debug(f"initializing metadata for {node.name}")
@@ -258,20 +538,33 @@ class MetadataGenerator:
                 )
             node.metadata._metastack.cache_partition(2)
 
-            group_order = _flatten_group_hierarchy(node.groups)
+            group_order = tuple(_flatten_group_hierarchy(node.groups))
             for group_name in group_order:
+                group_metadata = self.get_group(group_name)._attributes.get('metadata', {})
+                if group_name not in self._validated_group_metadata:
+                    validate_metadata(group_metadata)
+                    self._validated_group_metadata.add(group_name)
                 node.metadata._metastack.set_layer(
                     0,
                     "group:{}".format(group_name),
-                    self.get_group(group_name)._attributes.get('metadata', {}),
+                    group_metadata,
+                    validate=False,
                 )
 
+            # nodes with the same groups share merged group metadata
+            if group_order not in self._merged_group_metadata:
+                self._merged_group_metadata[group_order] = \
+                    node.metadata._metastack.as_dict(partitions=[0])
+
             node.metadata._metastack.set_layer(
                 0,
                 "node:{}".format(node.name),
                 node._attributes.get('metadata', {}),
             )
-            node.metadata._metastack.cache_partition(0)
+            node.metadata._metastack.cache_partition(
+                0,
+                merged_prefix=self._merged_group_metadata[group_order],
+            )
 
         with io.job(_("{}  preparing metadata reactors").format(bold(node.name))):
             io.debug(f"adding {len(list(node.metadata_reactors))} reactors for {node.name}")
@@ -279,6 +572,7 @@ class MetadataGenerator:
                 # randomizing insertion order increases the chance of
                 # exposing weird reactors that depend on execution order
                 self._reactors[(node.name, reactor_name)] = {
+                    'has_result': False,
                     'raised_donotrunagain': False,
                     'reactor': reactor,
                     'requested_paths': PathSet(),
@@ -293,16 +587,31 @@ class MetadataGenerator:
         self._relevant_nodes.add(node)
 
     def _trigger_reactors_for_path(self, path, source):
+        """
+        Returns all reactors that might provide the given path and
+        triggers those among them that don't have a current result.
+        """
         result = set()
         for reactor in self._provides_tree.reactors_for(path):
             if self._reactors[reactor]['raised_donotrunagain']:
                 continue
             if reactor != source:  # we don't want to trigger ourselves
+                result.add(reactor)
+                if self.__reactor_is_current(reactor):
+                    # Rerunning it would give us the same result. If
+                    # its inputs change, it will be triggered anyway.
+                    continue
                 io.debug(f"{source} triggers {reactor}")
                 self._reactors_triggered[reactor].add(source)
-                result.add(reactor)
         return result
 
+    def __reactor_is_current(self, reactor_id):
+        return (
+            self._reactors[reactor_id]['has_result'] and
+            reactor_id not in self._reactors_triggered and
+            reactor_id not in self._reactors_with_keyerrors
+        )
+
     def __check_iteration_count(self):
         self.__iterations += 1
         if self.__iterations > MAX_METADATA_ITERATIONS:
@@ -337,60 +646,228 @@ class MetadataGenerator:
                 f"it previously raised MetadataUnavailable for: {path_exc[0]}"
             )
 
+    def __update_reactor_ranks(self):
+        if not self._reactor_graph_changed:
+            return
+        self._reactor_ranks = _topological_ranks({
+            reactor_id: reactor['trigger_on_change']
+            for reactor_id, reactor in self._reactors.items()
+        })
+        self._reactor_graph_changed = False
+
+    def __node_group(self, node_name):
+        """
+        Returns the name of the node representing the group the given
+        node belongs to. Reactors of nodes in different groups have
+        never read metadata from each other's groups.
+        Caller must hold _reactor_bookkeeping_lock.
+        """
+        while self._node_groups.get(node_name, node_name) != node_name:
+            parent = self._node_groups[node_name]
+            # path halving keeps lookups cheap
+            self._node_groups[node_name] = self._node_groups.get(parent, parent)
+            node_name = self._node_groups[node_name]
+        return node_name
+
+    def _join_node_groups(self, node_name, other_node_name):
+        with self._reactor_bookkeeping_lock:
+            group = self.__node_group(node_name)
+            other_group = self.__node_group(other_node_name)
+            if group != other_group:
+                self._node_groups[other_group] = group
+
     def __run_reactors(self):
+        """
+        Runs all reactors that are currently triggered.
+
+        Reactors are grouped by the nodes they have read metadata from
+        so far. With BW_METADATA_WORKERS > 1, groups that share no
+        nodes are run concurrently in threads, which helps with
+        reactors blocking on I/O. A reactor reading a node outside its
+        group is aborted and rerun in the next iteration, at which
+        point its group has been merged with the group of that node.
+        """
+        self.__update_reactor_ranks()
+        reactors = list(self.__reactors_to_run())
+
+        groups = defaultdict(list)
+        nodes_by_group = defaultdict(set)
+        if self._metadata_workers > 1:
+            with self._reactor_bookkeeping_lock:
+                for reactor_id, debug_msg in reactors:
+                    groups[self.__node_group(reactor_id[0])].append((reactor_id, debug_msg))
+                # nodes that were joined to a group, but not initialized
+                # yet, must be included so they can be initialized
+                for node_name in set(self._node_groups).union(
+                    node.name for node in self._relevant_nodes
+                ):
+                    nodes_by_group[self.__node_group(node_name)].add(node_name)
+
+        if len(groups) < 2:
+            return self.__run_reactor_queue(reactors)
+
+        io.debug(f"running {len(groups)} independent groups of reactors concurrently")
+        with ThreadPoolExecutor(max_workers=self._metadata_workers) as executor:
+            futures = [
+                executor.submit(
+                    self.__run_reactor_queue,
+                    group_reactors,
+                    frozenset(nodes_by_group[group]),
+                )
+                for group, group_reactors in groups.items()
+            ]
+
         reactors_run = set()
         only_keyerrors = True
+        for future in futures:
+            group_reactors_run, group_only_keyerrors = future.result()
+            reactors_run.update(group_reactors_run)
+            only_keyerrors = only_keyerrors and group_only_keyerrors
+        return reactors_run, only_keyerrors
 
-        for reactor_id, debug_msg in self.__reactors_to_run():
-            if QUIT_EVENT.is_set():
-                # It's important that we don't just `break` here and
-                # end up returning incomplete metadata.
-                raise KeyboardInterrupt
+    def __run_reactor_queue(self, reactors, nodes=None):
+        """
+        Runs the given reactors, ordered by their position in the
+        dependency graph we know so far. Reactors triggered along the
+        way are run in the same iteration unless they already ran in
+        it, so chains of reactors settle in a single iteration instead
+        of one iteration per link. Reactors without a rank (those we
+        know nothing about yet) go first.
 
-            reactors_run.add(reactor_id)
-            node_name, reactor_name = reactor_id
-            io.debug(debug_msg)
-            with io.job(_("building metadata ({} nodes, {} reactors, {} iterations)...").format(
-                len(self._relevant_nodes),
-                len(self._reactors),
-                self.__iterations,
-            )):
-                self.__run_reactor(
-                    self.get_node(node_name),
-                    reactor_name,
-                    self._reactors[reactor_id]['reactor'],
-                )
+        If nodes is given, the reactors may only read metadata of these
+        nodes.
+        """
+        reactors_run = set()
+        only_keyerrors = True
+
+        order = count()
+        queue = []
+        for reactor_id, debug_msg in reactors:
+            heappush(queue, (
+                self._reactor_ranks.get(reactor_id, -1),
+                next(order),
+                reactor_id,
+                debug_msg,
+            ))
+
+        self._reactor_context.nodes = nodes
+        try:
+            while queue:
+                _rank, _order, reactor_id, debug_msg = heappop(queue)
+                if reactor_id in reactors_run:
+                    continue
 
-            if (node_name, reactor_name) not in self._reactors_with_keyerrors:
-                only_keyerrors = False
+                if QUIT_EVENT.is_set():
+                    # It's important that we don't just `break` here and
+                    # end up returning incomplete metadata.
+                    raise KeyboardInterrupt
+
+                reactors_run.add(reactor_id)
+                node_name, reactor_name = reactor_id
+                io.debug(debug_msg)
+                with io.job(_("building metadata ({} nodes, {} reactors, {} iterations)...").format(
+                    len(self._relevant_nodes),
+                    len(self._reactors),
+                    self.__iterations,
+                )):
+                    # Readers of completed metadata must neither see the
+                    # metastack while the reactor's layer is popped nor
+                    # values only some reactors have revised so far. They
+                    # have to wait until this build has finished.
+                    proxy = self._metadata_proxy_for_node(node_name)
+                    with proxy._lock:
+                        proxy._revising = True
+                    with self._reactor_bookkeeping_lock:
+                        self._revised_proxies.add(proxy)
+                    self.__run_reactor(
+                        self.get_node(node_name),
+                        reactor_name,
+                        self._reactors[reactor_id]['reactor'],
+                    )
+
+                if (node_name, reactor_name) not in self._reactors_with_keyerrors:
+                    only_keyerrors = False
+
+                with self._reactor_bookkeeping_lock:
+                    for triggered_id in self._reactor_context.triggered_by_last_run:
+                        if (
+                            triggered_id in self._reactors_triggered and
+                            triggered_id not in reactors_run and
+                            (nodes is None or triggered_id[0] in nodes)
+                        ):
+                            # no need to wait for the next iteration, the queue
+                            # makes sure this runs after anything it depends on
+                            triggers = self._reactors_triggered.pop(triggered_id)
+                            self._reactors_run_early += 1
+                            heappush(queue, (
+                                self._reactor_ranks.get(triggered_id, -1),
+                                next(order),
+                                triggered_id,
+                                f"running reactor {triggered_id} because "
+                                f"it was triggered by: {triggers}",
+                            ))
+        finally:
+            self._reactor_context.nodes = None
 
         return reactors_run, only_keyerrors
 
     def __run_reactor(self, node, reactor_name, reactor):  # skipcq: PY-R1000
+        context = self._reactor_context
+        reactor_id = (node.name, reactor_name)
         # make sure the reactor doesn't react to its own output
-        old_metadata = node.metadata._metastack.pop_layer(1, reactor_name)
-        self._in_a_reactor = True
-        self._current_reactor = (node.name, reactor_name)
-        self._current_reactor_provides = getattr(reactor, '_provides', (("/",),))  # used in .get()
-        self._current_reactor_newly_requested_paths = set()
-        self._reactor_runs[self._current_reactor] += 1
+        with node.metadata._lock:
+            old_metadata = node.metadata._metastack.pop_layer(1, reactor_name)
+        had_result = self._reactors[reactor_id]['has_result']
+        self._reactors[reactor_id]['has_result'] = False
+        with self._reactor_bookkeeping_lock, suppress(KeyError):
+            del self._reactors_triggered[reactor_id]
+        context.in_a_reactor = True
+        context.reactor = reactor_id
+        context.provides = getattr(reactor, '_provides', (("/",),))  # used in .get()
+        context.newly_requested_paths = set()
+        context.triggered_by_last_run = set()
+        self._reactor_runs[reactor_id] += 1
+        start = perf_counter()
         try:
-            new_metadata = reactor(node.metadata)
+            new_metadata = self.__reactor_result_from_cache(node, reactor_name, reactor)
+            if new_metadata is None:
+                new_metadata = reactor(node.metadata)
+                self._reactors_executed.add(reactor_id)
+            else:
+                io.debug(f"{reactor_id} served from cache")
+        except _LeftNodeGroup as exc:
+            # pretend we never ran, the groups of both nodes have been
+            # merged and we will be run again in the next iteration
+            if had_result:
+                with node.metadata._lock:
+                    node.metadata._metastack.set_layer(
+                        1,
+                        reactor_name,
+                        old_metadata,
+                        validate=False,
+                    )
+            self._reactors[reactor_id]['has_result'] = had_result
+            with self._reactor_bookkeeping_lock:
+                self._reactors_triggered[reactor_id].add(f"access to {exc}")
+            io.debug(f"{reactor_id} left its group of nodes by accessing {exc}")
+            return False
         except MetadataUnavailable as exc:
-            if self._current_reactor not in self._reactors_with_keyerrors:
-                self._reactors_with_keyerrors[self._current_reactor] = (
+            if self._record_reactor_profile:
+                self._reactor_keyerror_counts[reactor_id] += 1
+            if reactor_id not in self._reactors_with_keyerrors:
+                self._reactors_with_keyerrors[reactor_id] = (
                     (node.name, exc.path),
                     exc,
                 )
-                io.debug(f"{self._current_reactor} raised MetadataUnavailable for {exc.path}")
+                io.debug(f"{reactor_id} raised MetadataUnavailable for {exc.path}")
             return False
         except DoNotRunAgain:
-            self._reactors[self._current_reactor]['raised_donotrunagain'] = True
+            self._reactors[reactor_id]['raised_donotrunagain'] = True
             # clear any previously stored exception
             with suppress(KeyError):
-                del self._reactors_with_keyerrors[self._current_reactor]
-            self._current_reactor_newly_requested_paths.clear()
-            io.debug(f"{self._current_reactor} raised DoNotRunAgain")
+                del self._reactors_with_keyerrors[reactor_id]
+            context.newly_requested_paths.clear()
+            io.debug(f"{reactor_id} raised DoNotRunAgain")
             return False
         except Exception as exc:
             io.stderr(_(
@@ -403,16 +880,21 @@ class MetadataGenerator:
             ))
             raise exc
         finally:
-            self._in_a_reactor = False
-            with suppress(KeyError):
-                del self._reactors_triggered[self._current_reactor]
-            for path in self._current_reactor_newly_requested_paths:
-                for needed_reactor in self._trigger_reactors_for_path(path, self._current_reactor):
-                    self._reactors[needed_reactor]['trigger_on_change'].add(self._current_reactor)
+            if self._record_reactor_profile:
+                self._reactor_durations[reactor_id] += perf_counter() - start
+            context.in_a_reactor = False
+            with self._reactor_bookkeeping_lock:
+                for path in context.newly_requested_paths:
+                    for needed_reactor in self._trigger_reactors_for_path(path, reactor_id):
+                        context.triggered_by_last_run.add(needed_reactor)
+                        trigger_on_change = self._reactors[needed_reactor]['trigger_on_change']
+                        if reactor_id not in trigger_on_change:
+                            trigger_on_change.add(reactor_id)
+                            self._reactor_graph_changed = True
 
         # reactor terminated normally, clear any previously stored exception
         with suppress(KeyError):
-            del self._reactors_with_keyerrors[self._current_reactor]
+            del self._reactors_with_keyerrors[reactor_id]
 
         if new_metadata is None:
             raise ValueError(_(
@@ -423,7 +905,7 @@ class MetadataGenerator:
                 reactor_name=reactor_name,
             ))
 
-        if len(self._reactors[self._current_reactor]['requested_paths']) == 0:
+        if len(self._reactors[reactor_id]['requested_paths']) == 0:
             raise ValueError(_(
                 "{reactor_name} on {node_name} did not request any "
                 "metadata, you might want to use defaults instead"
@@ -446,7 +928,7 @@ class MetadataGenerator:
                 ))
 
         try:
-            with error_context(reactor=reactor_name, node=node.name):
+            with error_context(reactor=reactor_name, node=node.name), node.metadata._lock:
                 node.metadata._metastack.set_layer(
                     1,
                     reactor_name,
@@ -464,11 +946,80 @@ class MetadataGenerator:
             ))
             raise exc
 
+        self._reactors[reactor_id]['has_result'] = True
+
+        if self._record_reactor_profile:
+            self._reactor_result_sizes[reactor_id] += len(
+                dumps(new_metadata, default=repr).encode('utf-8')
+            )
+
         if old_metadata != new_metadata:
-            io.debug(f"{self._current_reactor} returned changed result")
-            self._reactor_changes[self._current_reactor] += 1
-            for triggered_reactor in self._reactors[self._current_reactor]['trigger_on_change']:
-                io.debug(f"rerun of {triggered_reactor} triggered by {self._current_reactor}")
-                self._reactors_triggered[triggered_reactor].add(self._current_reactor)
+            io.debug(f"{reactor_id} returned changed result")
+            self._reactor_changes[reactor_id] += 1
+            with self._reactor_bookkeeping_lock:
+                for triggered_reactor in self._reactors[reactor_id]['trigger_on_change']:
+                    io.debug(f"rerun of {triggered_reactor} triggered by {reactor_id}")
+                    self._reactors_triggered[triggered_reactor].add(reactor_id)
+                    context.triggered_by_last_run.add(triggered_reactor)
         else:
-            io.debug(f"{self._current_reactor} returned same result")
+            io.debug(f"{reactor_id} returned same result")
+
+    def __reactor_result_from_cache(self, node, reactor_name, reactor):
+        """
+        Returns the cached result of the given reactor if all metadata
+        it requested last time is still the same, None otherwise.
+
+        Must be called in the context of the reactor so the paths we
+        look up here are recorded as if the reactor requested them.
+        """
+        if self._reactor_cache is None:
+            return None
+
+        entry = self._reactor_cache.get(node.name, reactor_name, reactor)
+        if entry is None:
+            return None
+
+        for path, value_hash in entry['inputs'].items():
+            try:
+                proxy = self._metadata_proxy_for_node(path[0])
+            except NoSuchNode:
+                return None
+            value = proxy.get(path[1:], _UNAVAILABLE)
+            if value is _UNAVAILABLE:
+                if value_hash is not None:
+                    return None
+            elif hash_for_cache(value) != value_hash:
+                return None
+
+        return entry['layer']
+
+    def __write_reactor_cache(self):
+        reactors_executed = self._reactors_executed
+        self._reactors_executed = set()
+
+        for reactor_id in reactors_executed:
+            node_name, reactor_name = reactor_id
+            if self._reactors[reactor_id]['raised_donotrunagain']:
+                continue
+            metastack = self._node_metadata_proxies[node_name]._metastack
+            try:
+                layer = metastack._partitions[1][reactor_name]
+            except KeyError:
+                continue
+
+            inputs = {}
+            for path in self._reactors[reactor_id]['requested_paths']:
+                try:
+                    value = self._node_metadata_proxies[path[0]]._metastack.get(path[1:])
+                except MetadataUnavailable:
+                    inputs[path] = None
+                else:
+                    inputs[path] = hash_for_cache(value)
+
+            self._reactor_cache.set(
+                node_name,
+                reactor_name,
+                self._reactors[reactor_id]['reactor'],
+                inputs,
+                layer,
+            )
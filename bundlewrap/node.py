@@ -1,5 +1,7 @@
+from asyncio import get_running_loop
 from contextlib import suppress
 from datetime import datetime, timedelta
+from functools import partial
 from hashlib import md5
 from os import environ, mkdir, rename
 from os.path import dirname, exists, join
@@ -26,6 +28,7 @@ from .exceptions import (
 from .group import GROUP_ATTR_DEFAULTS, GROUP_ATTR_TYPES, GROUP_ATTR_TYPES_ENFORCED
 from .itemqueue import ItemQueue
 from .items import Item
+from .items.files import apply_files
 from .lock import NodeLock, softlock_add
 from .metadata import hash_metadata
 from .utils import (
@@ -46,6 +49,7 @@ from .utils.dicts import (
     COLLECTION_OF_STRINGS,
 )
 from .utils.magic_strings import convert_magic_strings
+from .utils.remote import prefetch_path_info, RemoteStateCache
 from .utils.text import (
     blue,
     bold,
@@ -176,6 +180,34 @@ def handle_apply_result(
             io.stdout(formatted_result)
 
 
+def prefetch_item_paths(node, items, autoskip_selector, autoonly_selector, check_deps=True):
+    """
+    Looks up all paths managed by the given file, directory and symlink
+    items at once instead of once per item.
+    """
+    if node.os not in node.OS_FAMILY_UNIX:
+        return
+    paths = [
+        item.name for item in items
+        if item.ITEM_TYPE_NAME in ("directory", "file", "symlink") and
+        not item.skip and
+        not item.triggered and
+        item.covered_by_autoonly_selector(autoonly_selector, check_deps=check_deps) and
+        not item.covered_by_autoskip_selector(autoskip_selector)
+    ]
+    if not paths:
+        return
+    with io.job(_("{}  looking up managed paths").format(bold(node.name))):
+        try:
+            prefetch_path_info(node, paths)
+        except (RemoteException, TransportException) as exc:
+            # items will just have to look for themselves
+            io.debug(_("unable to prefetch path info on {node}: {exc}").format(
+                exc=exc,
+                node=node.name,
+            ))
+
+
 def apply_items(
     node,
     autoskip_selector="",
@@ -186,23 +218,47 @@ def apply_items(
     interactive=False,
     show_diff=True,
     show_skipped_items=True,
+    item_order="arbitrary",
 ):
-    item_queue = ItemQueue(node)
+    item_queue = ItemQueue(node, item_order=item_order)
     # the item queue might contain new generated items (canned actions)
     # adjust progress total accordingly
     extra_items = len(item_queue.all_items) - len(node.items)
     io.progress_increase_total(increment=extra_items)
 
     results = []
+    # maps task IDs to lists of items handled by that task
+    file_batches = {}
 
     def tasks_available():
         # Some item types are not allowed to run at the same time as
-        # some other item types. items_without_deps_runnable handles
-        # these cases.
-        return bool(item_queue.items_without_deps_runnable())
+        # some other item types. has_runnable_items handles these
+        # cases.
+        return item_queue.has_runnable_items()
 
     def next_task():
         item = item_queue.pop()
+        if (
+            item.ITEM_TYPE_NAME == "file" and
+            not interactive and
+            node.os in node.OS_FAMILY_LINUX
+        ):
+            items = [item] + item_queue.pop_all_of_type("file")
+            if len(items) > 1:
+                task_id = "{}:file_batch_{}".format(node.name, len(file_batches))
+                file_batches[task_id] = items
+                return {
+                    'task_id': task_id,
+                    'target': apply_files,
+                    'args': (items,),
+                    'kwargs': {
+                        'autoskip_selector': autoskip_selector,
+                        'autoonly_selector': autoonly_selector,
+                        'my_soft_locks': my_soft_locks,
+                        'other_peoples_soft_locks': other_peoples_soft_locks,
+                        'show_diff': show_diff,
+                    },
+                }
         return {
             'task_id': "{}:{}".format(node.name, item.id),
             'target': item.apply,
@@ -217,11 +273,27 @@ def apply_items(
         }
 
     def handle_result(task_id, return_value, duration):
-        item_id = task_id.split(":", 1)[1]
-        item = find_item(item_id, item_queue.pending_items)
+        if task_id in file_batches:
+            del file_batches[task_id]
+            for item, item_result, exc, traceback in return_value:
+                if exc is None:
+                    handle_item_result(item, item_result, duration / len(return_value))
+                else:
+                    handle_item_exception(item, exc, traceback)
+        else:
+            item_id = task_id.split(":", 1)[1]
+            handle_item_result(
+                find_item(item_id, item_queue.pending_items),
+                return_value,
+                duration,
+            )
 
+    def handle_item_result(item, return_value, duration):
         status_code, details, created, deleted = return_value
 
+        if status_code != Item.STATUS_SKIPPED:
+            item_queue.record_duration(item, duration)
+
         if status_code == Item.STATUS_FAILED:
             for skipped_item in item_queue.item_failed(item):
                 handle_apply_result(
@@ -277,9 +349,18 @@ def apply_items(
         results.append((item.id, status_code, duration))
 
     def handle_exception(task_id, exc, traceback):
-        item_id = task_id.split(":", 1)[1]
-        item = find_item(item_id, item_queue.pending_items)
+        if task_id in file_batches:
+            for item in file_batches.pop(task_id):
+                handle_item_exception(item, exc, traceback)
+        else:
+            item_id = task_id.split(":", 1)[1]
+            handle_item_exception(
+                find_item(item_id, item_queue.pending_items),
+                exc,
+                traceback,
+            )
 
+    def handle_item_exception(item, exc, traceback):
         for skipped_item in item_queue.item_failed(item):
             handle_apply_result(
                 node,
@@ -307,6 +388,13 @@ def apply_items(
         io.stderr(output)
         io.progress_advance()
 
+    prefetch_item_paths(
+        node,
+        item_queue.all_items,
+        autoskip_selector,
+        autoonly_selector,
+    )
+
     worker_pool = WorkerPool(
         tasks_available,
         next_task,
@@ -546,8 +634,14 @@ class Node:
         self._add_host_keys = environ.get('BW_ADD_HOST_KEYS', False) == "1"
         self._attributes = attributes
         self._dynamic_attribute_cache = {}
+        self._prefetched_path_info = {}
+        self._remote_state = RemoteStateCache()
         self._ssh_conn_established = False
         self._ssh_first_conn_lock = Lock()
+        # (loop, future) for each run_async() waiting for
+        # _ssh_first_conn_lock, guarded by _ssh_first_conn_waiters_lock
+        self._ssh_first_conn_waiters = []
+        self._ssh_first_conn_waiters_lock = Lock()
         self.file_path = attributes.get('file_path')
         self.hostname = attributes.get('hostname', name)
         self.name = name
@@ -742,6 +836,7 @@ class Node:
         workers=4,
         add_lock_for_fixed_items=False,
         lock_expiry="8h",
+        item_order="arbitrary",
     ):
         if not list(self.items):
             io.stdout(_("{x} {node}  has no items").format(
@@ -803,6 +898,7 @@ class Node:
                         interactive=interactive,
                         show_diff=show_diff,
                         show_skipped_items=show_skipped_items,
+                        item_order=item_order,
                     )
 
                     if add_lock_for_fixed_items:
@@ -860,12 +956,13 @@ class Node:
         else:
             return result
 
-    def download(self, remote_path, local_path):
+    def download(self, remote_path, local_path, compress=False):
         return operations.download(
             self.hostname,
             remote_path,
             local_path,
             add_host_keys=self._add_host_keys,
+            compress=compress,
             username=self.username,
             wrapper_inner=self.cmd_wrapper_inner,
             wrapper_outer=self.cmd_wrapper_outer,
@@ -912,9 +1009,7 @@ class Node:
         self.file_path = new_path
         self.name = new_name
 
-    def run(self, command, data_stdin=None, may_fail=False, log_output=False, user="root"):
-        assert self.os in self.OS_FAMILY_UNIX
-
+    def _log_function(self, log_output):
         if log_output:
             def log_function(msg):
                 io.stdout("{x} {node}  {msg}".format(
@@ -922,9 +1017,11 @@ class Node:
                     msg=force_text(msg).rstrip("\n"),
                     x=cyan("›"),
                 ))
+            return log_function
         else:
-            log_function = None
+            return None
 
+    def _establish_ssh_connection(self):
         if not self._ssh_conn_established:
             # Sometimes we're opening SSH connections to a node too fast
             # for OpenSSH to establish the ControlMaster socket for the
@@ -947,13 +1044,27 @@ class Node:
                         )
                     self._ssh_conn_established = True
                 finally:
-                    self._ssh_first_conn_lock.release()
+                    self._release_ssh_first_conn_lock()
             else:
                 # we didn't get the lock immediately, now we just wait
                 # until it is released before we proceed
                 with self._ssh_first_conn_lock:
                     pass
 
+    def _release_ssh_first_conn_lock(self):
+        with self._ssh_first_conn_waiters_lock:
+            self._ssh_first_conn_lock.release()
+            for loop, done in self._ssh_first_conn_waiters:
+                # loop might be closed already
+                with suppress(RuntimeError):
+                    loop.call_soon_threadsafe(operations._set_future_done, done)
+            self._ssh_first_conn_waiters.clear()
+
+    def run(self, command, data_stdin=None, may_fail=False, log_output=False, user="root"):
+        assert self.os in self.OS_FAMILY_UNIX
+        log_function = self._log_function(log_output)
+        self._establish_ssh_connection()
+
         return operations.run(
             self.hostname,
             command,
@@ -967,6 +1078,78 @@ class Node:
             user=user,
         )
 
+    def run_many(self, commands, may_fail=False, user="root"):
+        """
+        Runs the given commands using a single SSH session and returns
+        a list of RunResults in the same order. Only use this for
+        commands that don't need any input and don't depend on each
+        other, such as probing the current state of an item.
+        """
+        assert self.os in self.OS_FAMILY_UNIX
+        self._establish_ssh_connection()
+
+        return operations.run_many(
+            self.hostname,
+            commands,
+            add_host_keys=self._add_host_keys,
+            ignore_failure=may_fail,
+            username=self.username,
+            wrapper_inner=self.cmd_wrapper_inner,
+            wrapper_outer=self.cmd_wrapper_outer,
+            user=user,
+        )
+
+    async def run_async(self, command, data_stdin=None, may_fail=False, log_output=False, user="root"):
+        """
+        Like run(), but for use with AsyncWorkerPool.
+        """
+        assert self.os in self.OS_FAMILY_UNIX
+        log_function = self._log_function(log_output)
+
+        if not self._ssh_conn_established:
+            # see _establish_ssh_connection() for why this is necessary
+            if self._ssh_first_conn_lock.acquire(False):
+                try:
+                    # hooks might take a while, don't block the event loop
+                    await get_running_loop().run_in_executor(None, partial(
+                        self.repo.hooks.node_ssh_connect,
+                        repo=self.repo,
+                        node=self,
+                    ))
+                    with io.job(_("{}  establishing connection...").format(bold(self.name))):
+                        await operations.run_async(
+                            self.hostname,
+                            "true",
+                            add_host_keys=self._add_host_keys,
+                            username=self.username,
+                        )
+                    self._ssh_conn_established = True
+                finally:
+                    self._release_ssh_first_conn_lock()
+            else:
+                # must not block the event loop while waiting
+                loop = get_running_loop()
+                done = loop.create_future()
+                with self._ssh_first_conn_waiters_lock:
+                    if self._ssh_first_conn_lock.locked():
+                        self._ssh_first_conn_waiters.append((loop, done))
+                    else:
+                        done.set_result(None)
+                await done
+
+        return await operations.run_async(
+            self.hostname,
+            command,
+            add_host_keys=self._add_host_keys,
+            data_stdin=data_stdin,
+            ignore_failure=may_fail,
+            log_function=log_function,
+            username=self.username,
+            wrapper_inner=self.cmd_wrapper_inner,
+            wrapper_outer=self.cmd_wrapper_outer,
+            user=user,
+        )
+
     def run_ipmitool(self, command, log_output=False):
         if not (self.ipmi_hostname and self.ipmi_username and self.ipmi_password):
             raise ValueError(_("node {} has no or invalid ipmi configuration").format(self.name))
@@ -1044,6 +1227,23 @@ class Node:
             wrapper_outer=self.cmd_wrapper_outer,
         )
 
+    def upload_many(self, files):
+        """
+        Uploads several files at once. files is a list of (local_path,
+        remote_path, mode, owner, group) tuples. Returns a dict mapping
+        remote paths that could not be moved into place to the error
+        output.
+        """
+        assert self.os in self.OS_FAMILY_UNIX
+        return operations.upload_many(
+            self.hostname,
+            files,
+            add_host_keys=self._add_host_keys,
+            username=self.username,
+            wrapper_inner=self.cmd_wrapper_inner,
+            wrapper_outer=self.cmd_wrapper_outer,
+        )
+
     def verify(
         self,
         autoskip_selector=(),
@@ -1141,6 +1341,14 @@ def verify_items(
             io.progress_advance()
         return [None for item in items]
 
+    prefetch_item_paths(
+        node,
+        items,
+        autoskip_selector,
+        autoonly_selector,
+        check_deps=False,
+    )
+
     def tasks_available():
         return bool(items)
 
@@ -1,13 +1,23 @@
-from contextlib import suppress
+from asyncio import create_subprocess_exec, ensure_future, get_running_loop
+from atexit import register as at_exit
+from contextlib import nullcontext, suppress
 from datetime import datetime
 from fcntl import fcntl, F_GETFL, F_SETFL
+from functools import partial
 from shlex import quote
 from select import poll, POLLIN, POLLOUT, POLLERR, POLLHUP
 from shlex import split
-from subprocess import Popen
+from subprocess import check_output, CalledProcessError, DEVNULL, PIPE, Popen, TimeoutExpired
+from tarfile import open as tar_open
+from tempfile import SpooledTemporaryFile, TemporaryFile
 from sys import version_info
-from threading import Lock
-from os import close, environ, pipe, read, setpgrp, write, O_NONBLOCK
+from threading import Condition, Lock
+from time import monotonic
+from os import close, environ, pipe, read, remove, setpgrp, stat, write, O_NONBLOCK
+from os.path import dirname, join
+from re import DOTALL, finditer, split as re_split
+from stat import S_IMODE
+from zlib import decompressobj, MAX_WBITS
 
 from .exceptions import RemoteException, TransportException
 from .utils import cached_property
@@ -23,35 +33,143 @@ ROUTEROS_CONNECTIONS_LOCK = Lock()
 IPMITOOL_CONNECTIONS = {}
 IPMITOOL_CONNECTIONS_LOCK = Lock()
 
+PERSISTENT_SSH = environ.get("BW_SSH_PERSISTENT", "0") == "1"
+# maps SSH commands to idle PersistentShells
+PERSISTENT_SHELLS = {}
+PERSISTENT_SHELLS_LOCK = Lock()
+
+# command output beyond this many bytes is kept on disk
+OUTPUT_MEMORY_LIMIT = int(environ.get("BW_OUTPUT_MEMORY_LIMIT", str(1024 * 1024)))
+
+# maximum number of concurrent SSH sessions per host or jump host
+# (0 means unlimited)
+SSH_MAX_SESSIONS = int(environ.get("BW_SSH_MAX_SESSIONS", "0"))
+# maps hosts and jump hosts to SessionLimiters
+SESSION_LIMITERS = {}
+# maps (hostname, username) to keys of SESSION_LIMITERS
+SESSION_LIMITER_KEYS = {}
+SESSION_LIMITERS_LOCK = Lock()
+
+# number of files to put in a single archive in upload_many()
+# (all their paths end up on the command line)
+UPLOAD_BATCH_SIZE = 100
+
+
+# Prints a single byte telling the receiver what follows:
+#   "z" gzip-compressed file content follows
+#   "r" raw file content follows
+DOWNLOAD_SCRIPT = (
+    "if {compress} && command -v gzip >/dev/null 2>&1; then "
+    "printf z && gzip -c < {path}; "
+    "else "
+    "printf r && cat {path}; "  # See issue #39.
+    "fi"
+)
+
+
+class DownloadSink:
+    """
+    Receives the output of DOWNLOAD_SCRIPT and writes the file content
+    to the given file object as it arrives.
+    """
+    def __init__(self, f):
+        self.decompressor = None
+        self.file = f
+        self.mode = None
+
+    def write(self, chunk):
+        if self.mode is None:
+            if not chunk:
+                return
+            self.mode, chunk = chunk[:1], chunk[1:]
+            if self.mode == b"z":
+                self.decompressor = decompressobj(wbits=16 + MAX_WBITS)
+        if self.decompressor:
+            chunk = self.decompressor.decompress(chunk)
+        self.file.write(chunk)
+
+    def close(self):
+        if self.decompressor:
+            self.file.write(self.decompressor.flush())
+
 
 def download(
     hostname,
     remote_path,
     local_path,
     add_host_keys=False,
+    compress=False,
     username=None,
     wrapper_inner="{}",
     wrapper_outer="{}",
 ):
     """
     Download a file.
+
+    local_path can also be a binary file object. With compress=True,
+    the file is transferred gzip-compressed (if gzip is available on
+    the remote side).
     """
     io.debug(_("downloading {host}:{path} -> {target}").format(
         host=hostname, path=remote_path, target=local_path))
 
+    if hasattr(local_path, 'write'):
+        _download(
+            hostname,
+            remote_path,
+            local_path,
+            add_host_keys=add_host_keys,
+            compress=compress,
+            username=username,
+            wrapper_inner=wrapper_inner,
+            wrapper_outer=wrapper_outer,
+        )
+        return
+
+    # written to as the content arrives, not loaded into memory first
+    with open(local_path, "wb") as f:
+        try:
+            _download(
+                hostname,
+                remote_path,
+                f,
+                add_host_keys=add_host_keys,
+                compress=compress,
+                username=username,
+                wrapper_inner=wrapper_inner,
+                wrapper_outer=wrapper_outer,
+            )
+        except BaseException:
+            remove(local_path)
+            raise
+
+
+def _download(
+    hostname,
+    remote_path,
+    f,
+    add_host_keys=False,
+    compress=False,
+    username=None,
+    wrapper_inner="{}",
+    wrapper_outer="{}",
+):
+    sink = DownloadSink(f)
     result = run(
         hostname,
-        "cat {}".format(quote(remote_path)),  # See issue #39.
+        DOWNLOAD_SCRIPT.format(
+            compress="true" if compress else "false",
+            path=quote(remote_path),
+        ),
         add_host_keys=add_host_keys,
+        ignore_failure=True,
+        stdout_file=sink,
         username=username,
         wrapper_inner=wrapper_inner,
         wrapper_outer=wrapper_outer,
     )
 
-    if result.return_code == 0:
-        with open(local_path, "wb") as f:
-            f.write(result.stdout)
-    else:
+    if result.return_code != 0:
         raise RemoteException(_(
             "reading file '{path}' on {host} failed: {error}"
         ).format(
@@ -59,15 +177,51 @@ def download(
             host=hostname,
             path=remote_path,
         ))
+    result.close()
+    sink.close()
 
 
 class RunResult:
+    """
+    stdout and stderr are always returned as bytes, but might be kept
+    in (spooled) temporary files until they are first read.
+    """
     def __init__(self):
         self.duration = None
         self.return_code = None
         self.stderr = None
         self.stdout = None
 
+    def close(self):
+        """
+        Releases the files output is kept in. Use this when you are done
+        with a result you might not have read the output of. Output can
+        no longer be read afterwards.
+        """
+        for output in (self._stderr, self._stdout):
+            if hasattr(output, 'close'):
+                output.close()
+        self._stderr = None
+        self._stdout = None
+
+    @property
+    def stderr(self):
+        self._stderr = _read_output(self._stderr)
+        return self._stderr
+
+    @stderr.setter
+    def stderr(self, value):
+        self._stderr = value
+
+    @property
+    def stdout(self):
+        self._stdout = _read_output(self._stdout)
+        return self._stdout
+
+    @stdout.setter
+    def stdout(self, value):
+        self._stdout = value
+
     @cached_property
     def stderr_text(self):
         return force_text(self.stderr)
@@ -77,6 +231,27 @@ class RunResult:
         return force_text(self.stdout)
 
 
+def _output_spool():
+    """
+    Returns a file to record command output in. Output beyond
+    OUTPUT_MEMORY_LIMIT is moved to disk.
+    """
+    return SpooledTemporaryFile(max_size=OUTPUT_MEMORY_LIMIT)
+
+
+def _read_output(output):
+    """
+    Returns the contents of the given spool as bytes and closes it.
+    Anything else is returned as-is.
+    """
+    if hasattr(output, 'read'):
+        output.seek(0)
+        data = output.read()
+        output.close()
+        return data
+    return output
+
+
 class ManagedPoller:
     def __init__(self):
         self.poller = poll()
@@ -113,16 +288,20 @@ def run_local(
     data_stdin=None,
     log_function=None,
     shell=False,
+    stdout_file=None,
 ):
     """
     Runs a command on the local system.
+
+    If stdout_file is given, stdout is written to it as it arrives
+    instead of being returned as part of the RunResult.
     """
     # LineBuffer objects take care of always printing complete lines
     # which have been properly terminated by a newline. This is only
     # relevant when using `bw run`.
     # Does nothing when log_function is None.
-    stderr_lb = LineBuffer(log_function)
-    stdout_lb = LineBuffer(log_function)
+    stderr_lb = LineBuffer(log_function, record=_output_spool())
+    stdout_lb = LineBuffer(log_function, record=stdout_file or _output_spool())
 
     # Create pipes which will be used by the SSH child process. We do
     # not use subprocess.PIPE because we need to be able to continuously
@@ -148,6 +327,12 @@ def run_local(
     # if we do not send data to the child. Otherwise, SSH can steal user
     # input.
     stdin_fd_r, stdin_fd_w = pipe()
+    if hasattr(data_stdin, 'read'):
+        # stream from a file instead of keeping it all in memory
+        stdin_file = data_stdin
+        data_stdin = b''
+    else:
+        stdin_file = None
     if data_stdin is None:
         data_stdin = b''
         close_after_fork += [stdin_fd_r, stdin_fd_w]
@@ -225,12 +410,14 @@ def run_local(
 
             for fd, event in fdevents:
                 if event & POLLIN:
-                    chunk = read(fd, 8192)
+                    chunk = read(fd, 65536)
                     if chunk == b'':
                         fds_to_close.append(fd)
                     else:
                         lbs_for_fds[fd].write(chunk)
                 elif event & POLLOUT:
+                    if len(data_stdin) == 0 and stdin_file is not None:
+                        data_stdin = stdin_file.read(65536)
                     if len(data_stdin) > 0:
                         written = write(fd, data_stdin)
                         data_stdin = data_stdin[written:]
@@ -282,12 +469,541 @@ def run_local(
 
     result = RunResult()
     result.duration = datetime.utcnow() - start
-    result.stdout = stdout_lb.record.getvalue()
-    result.stderr = stderr_lb.record.getvalue()
+    result.stdout = b"" if stdout_file else stdout_lb.record
+    result.stderr = stderr_lb.record
+    result.return_code = child_process.returncode
+    return result
+
+
+class PersistentShell:
+    """
+    A long-lived shell process (usually `ssh host exec sh`) that runs
+    commands sent to its stdin one after another. This saves us from
+    spawning a new SSH process for each command.
+
+    The end of each command is recognized by a random marker which
+    the shell prints to stdout (along with the return code) and
+    stderr once the command has finished.
+
+    limiter is the SessionLimiter this shell's SSH session counts
+    against, if any.
+    """
+    def __init__(self, command, limiter=None):
+        self.command = command
+        self.limiter = limiter
+        io.debug("starting persistent shell: {}".format(" ".join(command)))
+        # see run_local() for why we need a new process group
+        if version_info < (3, 11):
+            self._process = Popen(
+                command,
+                preexec_fn=setpgrp,
+                stdin=PIPE,
+                stderr=PIPE,
+                stdout=PIPE,
+            )
+        else:
+            self._process = Popen(
+                command,
+                process_group=0,
+                stdin=PIPE,
+                stderr=PIPE,
+                stdout=PIPE,
+            )
+        io._child_pids.append(self._process.pid)
+
+    @property
+    def alive(self):
+        return self._process.poll() is None
+
+    def close(self):
+        with suppress(OSError):
+            self._process.stdin.close()
+        try:
+            self._process.wait(timeout=5)
+        except TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process.stdout.close()
+        self._process.stderr.close()
+        with suppress(ValueError):
+            io._child_pids.remove(self._process.pid)
+
+    def run(self, shell_command):
+        """
+        Runs the given command (as it would be passed to `sh -c`) and
+        returns a RunResult. Raises TransportException if the shell
+        terminates before the command has finished, in which case this
+        object must not be used anymore.
+        """
+        marker = randstr()
+        script = (
+            f"sh -c {quote(shell_command)} </dev/null; "
+            f"printf '%s %d\\n' {marker} $?; "
+            f"printf '%s\\n' {marker} >&2\n"
+        ).encode('utf-8')
+        marker = marker.encode('ascii')
+
+        cmd_id = randstr(length=4).upper()
+        io.debug("running command with ID {} in persistent shell: {}".format(
+            cmd_id,
+            shell_command,
+        ))
+        start = datetime.utcnow()
+
+        stdin_fd = self._process.stdin.fileno()
+        while script:
+            try:
+                written = write(stdin_fd, script)
+            except OSError as exc:
+                raise TransportException(_(
+                    "persistent shell '{command}' terminated unexpectedly: {exc}"
+                ).format(command=" ".join(self.command), exc=exc))
+            script = script[written:]
+
+        stdout_fd = self._process.stdout.fileno()
+        stderr_fd = self._process.stderr.fileno()
+        buffers = {stdout_fd: bytearray(), stderr_fd: bytearray()}
+        return_code = None
+        stderr_done = False
+
+        poller = poll()
+        poller.register(stdout_fd, POLLIN)
+        poller.register(stderr_fd, POLLIN)
+
+        while return_code is None or not stderr_done:
+            for fd, event in poller.poll():
+                chunk = read(fd, 65536)
+                if chunk == b'':
+                    raise TransportException(_(
+                        "persistent shell '{command}' terminated unexpectedly "
+                        "while running '{shell_command}'"
+                    ).format(
+                        command=" ".join(self.command),
+                        shell_command=shell_command,
+                    ))
+                buf = buffers[fd]
+                buf.extend(chunk)
+                if fd == stdout_fd:
+                    if not buf.endswith(b"\n"):
+                        continue
+                    # the marker line can only be at the very end, no
+                    # need to search large outputs over and over again
+                    pos = buf.rfind(marker + b" ", max(0, len(buf) - len(marker) - 16))
+                    if pos != -1 and buf[pos + len(marker) + 1:-1].isdigit():
+                        return_code = int(buf[pos + len(marker) + 1:-1])
+                        del buf[pos:]
+                elif buf.endswith(marker + b"\n"):
+                    stderr_done = True
+                    del buf[-len(marker) - 1:]
+
+        io.debug("command with ID {} finished with return code {}".format(
+            cmd_id,
+            return_code,
+        ))
+
+        result = RunResult()
+        result.duration = datetime.utcnow() - start
+        result.stdout = bytes(buffers[stdout_fd])
+        result.stderr = bytes(buffers[stderr_fd])
+        result.return_code = return_code
+        return result
+
+
+async def run_local_async(
+    command,
+    data_stdin=None,
+    log_function=None,
+    stdout_file=None,
+):
+    """
+    Like run_local(), but waits for the command on an asyncio event loop
+    instead of blocking a thread.
+    """
+    stderr_lb = LineBuffer(log_function, record=_output_spool())
+    stdout_lb = LineBuffer(log_function, record=stdout_file or _output_spool())
+
+    # stderr is read from our own pipe instead of one managed by
+    # asyncio, since asyncio would wait for its EOF before reporting
+    # the process as terminated (see the comment on ControlMaster
+    # processes in run_local())
+    loop = get_running_loop()
+    stderr_fd_r, stderr_fd_w = pipe()
+    fcntl(stderr_fd_r, F_SETFL, fcntl(stderr_fd_r, F_GETFL) | O_NONBLOCK)
+
+    def read_stderr():
+        try:
+            chunk = read(stderr_fd_r, 65536)
+        except BlockingIOError:
+            return False
+        if chunk == b'':
+            loop.remove_reader(stderr_fd_r)
+            return False
+        stderr_lb.write(chunk)
+        return True
+
+    cmd_id = randstr(length=4).upper()
+    io.debug("running command with ID {} asynchronously: {}".format(cmd_id, " ".join(command)))
+    start = datetime.utcnow()
+
+    # see run_local() for why we need a new process group
+    if version_info < (3, 11):
+        process_group_kwargs = {'preexec_fn': setpgrp}
+    else:
+        process_group_kwargs = {'process_group': 0}
+
+    try:
+        child_process = await create_subprocess_exec(
+            *command,
+            # never connect SSH to the terminal
+            stdin=DEVNULL if data_stdin is None else PIPE,
+            stderr=stderr_fd_w,
+            stdout=PIPE,
+            **process_group_kwargs,
+        )
+    except BaseException:
+        close(stderr_fd_r)
+        raise
+    finally:
+        close(stderr_fd_w)
+
+    io._child_pids.append(child_process.pid)
+    loop.add_reader(stderr_fd_r, read_stderr)
+
+    async def feed_stdin():
+        if hasattr(data_stdin, 'read'):
+            chunks = iter(lambda: data_stdin.read(65536), b'')
+        else:
+            chunks = [data_stdin]
+        try:
+            for chunk in chunks:
+                child_process.stdin.write(chunk)
+                await child_process.stdin.drain()
+            child_process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # the child doesn't want any more input
+            pass
+
+    try:
+        if data_stdin is not None:
+            stdin_task = ensure_future(feed_stdin())
+        while True:
+            chunk = await child_process.stdout.read(65536)
+            if chunk == b'':
+                break
+            stdout_lb.write(chunk)
+        await child_process.wait()
+        if data_stdin is not None:
+            await stdin_task
+        # everything the child itself wrote to stderr is in the pipe
+        # by now, don't wait for EOF
+        while read_stderr():
+            pass
+    finally:
+        io._child_pids.remove(child_process.pid)
+        loop.remove_reader(stderr_fd_r)
+        close(stderr_fd_r)
+        stderr_lb.close()
+        stdout_lb.close()
+
+    io.debug("command with ID {} finished with return code {}".format(
+        cmd_id,
+        child_process.returncode,
+    ))
+
+    result = RunResult()
+    result.duration = datetime.utcnow() - start
+    result.stdout = b"" if stdout_file else stdout_lb.record
+    result.stderr = stderr_lb.record
     result.return_code = child_process.returncode
     return result
 
 
+class SessionLimiter:
+    """
+    Limits the number of concurrent SSH sessions to a host or to all
+    hosts behind the same jump host. Allows max_sessions at first,
+    halves the limit when connections fail and raises it again one
+    session at a time as long as sessions don't get slower.
+
+    Sessions kept open by idle persistent shells count against the
+    limit as well. When no session is available, evict(limiter) is
+    asked for one of them to close.
+    """
+    def __init__(self, key, max_sessions, evict=None):
+        self.key = key
+        self.max_sessions = max_sessions
+        self.limit = max_sessions
+        self.active = 0
+        self.idle = 0
+        self.waiting = 0
+        self.average_duration = None
+        self.last_backoff = 0
+        self.condition = Condition()
+        self.evict = evict
+        # (loop, future) for each coroutine waiting in acquire_async()
+        self._async_waiters = []
+
+        self.sessions = 0
+        self.backoffs = 0
+        self.queued = 0
+        self.wait_max = 0.0
+        self.wait_total = 0.0
+
+    def _try_acquire(self, evicted):
+        """
+        Must be called with self.condition held. Idle sessions taken
+        away from their owners to make room are appended to evicted.
+        """
+        while self.active + self.idle >= self.limit:
+            session = self.evict(self) if self.evict and self.idle else None
+            if session is None:
+                return False
+            self.idle -= 1
+            evicted.append(session)
+        self.active += 1
+        return True
+
+    def _acquired(self, started, evicted):
+        for session in evicted:
+            session.close()
+        waited = monotonic() - started
+        with self.condition:
+            self.sessions += 1
+            if waited > 0.01:
+                self.queued += 1
+                self.wait_max = max(self.wait_max, waited)
+                self.wait_total += waited
+
+    def _notify(self):
+        """
+        Must be called with self.condition held.
+        """
+        self.condition.notify_all()
+        for loop, woken in self._async_waiters:
+            # loop might be closed already
+            with suppress(RuntimeError):
+                loop.call_soon_threadsafe(_set_future_done, woken)
+        self._async_waiters.clear()
+
+    def acquire(self):
+        started = monotonic()
+        evicted = []
+        with self.condition:
+            self.waiting += 1
+            try:
+                while not self._try_acquire(evicted):
+                    self.condition.wait()
+            finally:
+                self.waiting -= 1
+        self._acquired(started, evicted)
+
+    async def acquire_async(self):
+        started = monotonic()
+        evicted = []
+        loop = get_running_loop()
+        while True:
+            with self.condition:
+                if self._try_acquire(evicted):
+                    break
+                # must not block the event loop while waiting
+                woken = loop.create_future()
+                self._async_waiters.append((loop, woken))
+                self.waiting += 1
+            try:
+                await woken
+            finally:
+                with self.condition:
+                    self.waiting -= 1
+        self._acquired(started, evicted)
+
+    def release(self, duration=None, failed=False, idle=False):
+        """
+        duration is None if the session didn't get to talk to the
+        other side, which means we learned nothing about its load.
+
+        idle means the session is kept open by an idle persistent
+        shell and still counts against the limit.
+        """
+        with self.condition:
+            self.active -= 1
+            if idle:
+                self.idle += 1
+            if failed:
+                # many sessions tend to fail at the same time, don't
+                # overreact to all of them
+                if monotonic() - self.last_backoff > 1:
+                    self.last_backoff = monotonic()
+                    self.backoffs += 1
+                    self.limit = max(1, self.limit // 2)
+                    io.debug(_("reducing SSH session limit for {key} to {limit}").format(
+                        key=self.key,
+                        limit=self.limit,
+                    ))
+            elif duration is not None:
+                if self.average_duration is None:
+                    self.average_duration = duration
+                elif duration <= self.average_duration * 2 and self.limit < self.max_sessions:
+                    self.limit += 1
+                self.average_duration = self.average_duration * 0.8 + duration * 0.2
+            self._notify()
+
+    def reuse_idle(self):
+        """
+        Turns an idle session back into an active one.
+        """
+        with self.condition:
+            self.idle -= 1
+            self.active += 1
+            self.sessions += 1
+
+    def close_idle(self):
+        """
+        Records that an idle session has been closed.
+        """
+        with self.condition:
+            self.idle -= 1
+            self._notify()
+
+
+def _set_future_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _session_limiter_key(hostname, add_host_keys=False, username=None):
+    """
+    Returns the jump host used to connect to the given host or the
+    host itself.
+    """
+    ssh_command = _ssh_command(hostname, add_host_keys=add_host_keys, username=username)
+    try:
+        # only evaluates the config, doesn't connect
+        output = check_output(ssh_command[:1] + ["-G"] + ssh_command[1:], stderr=DEVNULL)
+    except (CalledProcessError, OSError):
+        return hostname
+    for line in force_text(output).splitlines():
+        option, value = (line.split(" ", 1) + [""])[:2]
+        if option in ("proxyjump", "proxycommand") and value and value != "none":
+            return value.split(",")[0]
+    return hostname
+
+
+def get_session_limiter(hostname, add_host_keys=False, username=None):
+    """
+    Returns the SessionLimiter for the given host or None if sessions
+    are not limited.
+    """
+    if not SSH_MAX_SESSIONS:
+        return None
+    with SESSION_LIMITERS_LOCK:
+        key = SESSION_LIMITER_KEYS.get((hostname, username))
+    if key is None:
+        # runs `ssh -G`, don't make other hosts wait for it
+        key = _session_limiter_key(hostname, add_host_keys=add_host_keys, username=username)
+    with SESSION_LIMITERS_LOCK:
+        key = SESSION_LIMITER_KEYS.setdefault((hostname, username), key)
+        try:
+            return SESSION_LIMITERS[key]
+        except KeyError:
+            limiter = SessionLimiter(key, SSH_MAX_SESSIONS, evict=_evict_idle_shell)
+            SESSION_LIMITERS[key] = limiter
+            return limiter
+
+
+def log_session_stats():
+    with SESSION_LIMITERS_LOCK:
+        for key, limiter in sorted(SESSION_LIMITERS.items()):
+            io.debug(_(
+                "SSH sessions for {key}: {sessions} total, "
+                "{queued} queued for {wait_total:.1f}s (longest wait {wait_max:.1f}s), "
+                "{backoffs} backoffs, final limit {limit}/{max_sessions}"
+            ).format(
+                backoffs=limiter.backoffs,
+                key=key,
+                limit=limiter.limit,
+                max_sessions=limiter.max_sessions,
+                queued=limiter.queued,
+                sessions=limiter.sessions,
+                wait_max=limiter.wait_max,
+                wait_total=limiter.wait_total,
+            ))
+
+
+def run_persistent(command, shell_command, limiter=None):
+    """
+    Runs shell_command in a PersistentShell started with command,
+    reusing an idle one if possible.
+
+    If limiter is given, the shell's session counts against it while
+    running shell_command as well as while idle afterwards.
+    """
+    key = tuple(command)
+    with limiter.condition if limiter else nullcontext():
+        with PERSISTENT_SHELLS_LOCK:
+            idle_shells = PERSISTENT_SHELLS.get(key)
+            shell = idle_shells.pop() if idle_shells else None
+        if shell and limiter:
+            limiter.reuse_idle()
+    if shell is None and limiter:
+        limiter.acquire()
+
+    try:
+        if shell and not shell.alive:
+            # connection was lost while idle, replace it
+            shell.close()
+            shell = None
+        if shell is None:
+            shell = PersistentShell(command, limiter=limiter)
+        result = shell.run(shell_command)
+    except BaseException:
+        # we don't know what state this shell is in now
+        if shell:
+            shell.close()
+        if limiter:
+            limiter.release()
+        raise
+
+    with limiter.condition if limiter else nullcontext():
+        # don't keep a session open for later if others are waiting
+        # for one right now
+        keep = not (limiter and limiter.waiting)
+        if keep:
+            with PERSISTENT_SHELLS_LOCK:
+                PERSISTENT_SHELLS.setdefault(key, []).append(shell)
+            if limiter:
+                _release_session(limiter, result, idle=True)
+    if not keep:
+        shell.close()
+        _release_session(limiter, result)
+    return result
+
+
+def _evict_idle_shell(limiter):
+    """
+    Takes an idle PersistentShell counting against the given
+    SessionLimiter out of PERSISTENT_SHELLS and returns it (or None if
+    there is none). Must be called with limiter.condition held.
+    """
+    with PERSISTENT_SHELLS_LOCK:
+        for idle_shells in PERSISTENT_SHELLS.values():
+            for shell in idle_shells:
+                if shell.limiter is limiter:
+                    idle_shells.remove(shell)
+                    return shell
+    return None
+
+
+@at_exit
+def close_persistent_shells():
+    with PERSISTENT_SHELLS_LOCK:
+        shells = [shell for idle_shells in PERSISTENT_SHELLS.values() for shell in idle_shells]
+        PERSISTENT_SHELLS.clear()
+    for shell in shells:
+        shell.close()
+        if shell.limiter:
+            shell.limiter.close_idle()
+
+
 def run(
     hostname,
     command,
@@ -299,6 +1015,7 @@ def run(
         127,  # command not found
     ),
     log_function=None,
+    stdout_file=None,
     username=None,  # SSH auth
     wrapper_inner="{}",
     wrapper_outer="{}",
@@ -308,7 +1025,189 @@ def run(
     Runs a command on a remote system.
     """
     shell_command = wrapper_outer.format(quote(wrapper_inner.format(command)), user)
+    ssh_command = _ssh_command(hostname, add_host_keys=add_host_keys, username=username)
+
+    limiter = get_session_limiter(hostname, add_host_keys=add_host_keys, username=username)
+    if (
+        PERSISTENT_SSH and
+        data_stdin is None and
+        log_function is None and
+        stdout_file is None
+    ):
+        # persistent shells keep their session while idle, so they
+        # take care of the limiter themselves
+        result = run_persistent(ssh_command + ["exec sh"], shell_command, limiter=limiter)
+    else:
+        ssh_command.append(shell_command)
+        if limiter:
+            limiter.acquire()
+        result = None
+        try:
+            result = run_local(
+                ssh_command,
+                data_stdin=data_stdin,
+                log_function=log_function,
+                stdout_file=stdout_file,
+            )
+        finally:
+            if limiter:
+                _release_session(limiter, result)
+
+    _check_result(
+        hostname,
+        command,
+        result,
+        ignore_failure=ignore_failure,
+        raise_for_return_codes=raise_for_return_codes,
+    )
+    return result
+
 
+async def run_async(
+    hostname,
+    command,
+    add_host_keys=False,
+    data_stdin=None,
+    ignore_failure=False,
+    raise_for_return_codes=(
+        126,  # command not executable
+        127,  # command not found
+    ),
+    log_function=None,
+    username=None,  # SSH auth
+    wrapper_inner="{}",
+    wrapper_outer="{}",
+    user="root",  # remote user running the command
+):
+    """
+    Like run(), but waits for the command on an asyncio event loop
+    instead of blocking a thread. Never uses persistent shells.
+    """
+    shell_command = wrapper_outer.format(quote(wrapper_inner.format(command)), user)
+    ssh_command = _ssh_command(hostname, add_host_keys=add_host_keys, username=username)
+    ssh_command.append(shell_command)
+
+    if SSH_MAX_SESSIONS:
+        # might run `ssh -G`, don't block the event loop
+        limiter = await get_running_loop().run_in_executor(None, partial(
+            get_session_limiter,
+            hostname,
+            add_host_keys=add_host_keys,
+            username=username,
+        ))
+    else:
+        limiter = None
+    if limiter:
+        await limiter.acquire_async()
+    result = None
+    try:
+        result = await run_local_async(
+            ssh_command,
+            data_stdin=data_stdin,
+            log_function=log_function,
+        )
+    finally:
+        if limiter:
+            _release_session(limiter, result)
+
+    _check_result(
+        hostname,
+        command,
+        result,
+        ignore_failure=ignore_failure,
+        raise_for_return_codes=raise_for_return_codes,
+    )
+    return result
+
+
+def run_many(
+    hostname,
+    commands,
+    add_host_keys=False,
+    ignore_failure=False,
+    raise_for_return_codes=(
+        126,  # command not executable
+        127,  # command not found
+    ),
+    username=None,  # SSH auth
+    wrapper_inner="{}",
+    wrapper_outer="{}",
+    user="root",  # remote user running the commands
+):
+    """
+    Runs several commands on a remote system using a single SSH session
+    and returns a list of RunResults, one for each command.
+
+    The commands are run one after another by the same shell, each
+    followed by a random marker (and its return code) on stdout and
+    stderr so we can split the output afterwards. The commands don't
+    get any input and should not depend on each other.
+    """
+    if not commands:
+        return []
+
+    marker = randstr()
+    script = "".join(
+        f"sh -c {quote(wrapper_inner.format(command))} </dev/null; "
+        f"printf '\\n%s %d\\n' {marker} $?; "
+        f"printf '\\n%s\\n' {marker} >&2\n"
+        for command in commands
+    )
+    combined_result = run(
+        hostname,
+        script,
+        add_host_keys=add_host_keys,
+        username=username,
+        wrapper_outer=wrapper_outer,
+        user=user,
+    )
+
+    marker = marker.encode('utf-8')
+    stdout_parts = re_split(
+        b"\n" + marker + b" (\\d+)\n",
+        combined_result.stdout,
+    )
+    stderr_parts = combined_result.stderr.split(b"\n" + marker + b"\n")
+    if len(stdout_parts) != len(commands) * 2 + 1 or len(stderr_parts) != len(commands) + 1:
+        error_msg = _(
+            "unable to parse output of {count} commands run on '{host}'"
+        ).format(
+            count=len(commands),
+            host=hostname,
+        )
+        io.debug(error_msg)
+        raise RemoteException(error_msg)
+
+    results = []
+    for index, command in enumerate(commands):
+        result = RunResult()
+        result.duration = combined_result.duration
+        result.stdout = stdout_parts[index * 2]
+        result.stderr = stderr_parts[index]
+        result.return_code = int(stdout_parts[index * 2 + 1])
+        _check_return_code(
+            hostname,
+            command,
+            result,
+            ignore_failure=ignore_failure,
+            raise_for_return_codes=raise_for_return_codes,
+        )
+        results.append(result)
+    return results
+
+
+def _release_session(limiter, result, idle=False):
+    if result is None:
+        limiter.release(idle=idle)
+    else:
+        limiter.release(
+            duration=result.duration.total_seconds(),
+            failed=result.return_code == 255,
+            idle=idle,
+        )
+
+
+def _ssh_command(hostname, add_host_keys=False, username=None):
     ssh_command = [
         "ssh",
         "-o", "BatchMode=yes",
@@ -322,14 +1221,10 @@ def run(
     if extra_args:
         ssh_command.extend(split(extra_args))
     ssh_command.append(hostname)
-    ssh_command.append(shell_command)
+    return ssh_command
 
-    result = run_local(
-        ssh_command,
-        data_stdin=data_stdin,
-        log_function=log_function,
-    )
 
+def _check_result(hostname, command, result, ignore_failure, raise_for_return_codes):
     if result.return_code < 0:
         error_msg = _(
             "SSH process running '{command}' on '{host}': Terminated by signal {rcode}"
@@ -350,7 +1245,17 @@ def run(
         )
         io.debug(error_msg)
         raise TransportException(error_msg)
-    elif result.return_code != 0:
+    _check_return_code(
+        hostname,
+        command,
+        result,
+        ignore_failure=ignore_failure,
+        raise_for_return_codes=raise_for_return_codes,
+    )
+
+
+def _check_return_code(hostname, command, result, ignore_failure, raise_for_return_codes):
+    if result.return_code != 0:
         error_msg = _(
             "Non-zero return code ({rcode}) running '{command}' "
             "on '{host}':\n\n{result}\n\n"
@@ -364,7 +1269,6 @@ def run(
 
         if not ignore_failure or result.return_code in raise_for_return_codes:
             raise RemoteException(error_msg)
-    return result
 
 
 def run_ipmitool(hostname, username, password, command, interface=None, log_function=None):
@@ -444,6 +1348,34 @@ def run_routeros(hostname, username, password, *args):
     return run_result
 
 
+def _upload_temp_path(remote_path):
+    # same directory as the target so the final mv is atomic
+    return join(dirname(remote_path), ".bundlewrap_tmp_" + randstr())
+
+
+def _install_commands(local_path, temp_path, remote_path, mode, owner, group):
+    """
+    Returns the commands needed to move an uploaded file from its
+    temporary location into place.
+    """
+    if mode is None:
+        # this is what scp would have done
+        mode = "{:04o}".format(S_IMODE(stat(local_path).st_mode))
+
+    commands = []
+    if owner or group:
+        if group:
+            group = ":" + quote(group)
+        commands.append("chown {}{} {}".format(
+            quote(owner),
+            group,
+            quote(temp_path),
+        ))
+    commands.append("chmod {} {}".format(mode, quote(temp_path)))
+    commands.append("mv -f {} {}".format(quote(temp_path), quote(remote_path)))
+    return commands
+
+
 def upload(
     hostname,
     local_path,
@@ -462,30 +1394,27 @@ def upload(
     """
     io.debug(_("uploading {path} -> {host}:{target}").format(
         host=hostname, path=local_path, target=remote_path))
-    temp_filename = ".bundlewrap_tmp_" + randstr()
+    temp_path = _upload_temp_path(remote_path)
+    # nobody else gets to see the file until it has the proper mode
+    commands = ["umask 077", "cat > {}".format(quote(temp_path))]
+    commands += _install_commands(local_path, temp_path, remote_path, mode, owner, group)
 
-    scp_hostname = hostname
-    if ':' in hostname:
-        scp_hostname = f"[{hostname}]"
-
-    scp_command = [
-        "scp",
-        "-o", "BatchMode=yes",
-        "-o",
-        "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
-    ]
-    extra_args = environ.get("BW_SCP_ARGS", '').strip()
-    if extra_args:
-        scp_command.extend(split(extra_args))
-    scp_command.append(local_path)
-    if username:
-        scp_command.append(f"{username}@{scp_hostname}:{temp_filename}")
-    else:
-        scp_command.append(f"{scp_hostname}:{temp_filename}")
-
-    scp_process = run_local(scp_command)
+    with open(local_path, 'rb') as f:
+        result = run(
+            hostname,
+            "{} || {{ rm -f {}; exit 1; }}".format(
+                " && ".join(commands),
+                quote(temp_path),
+            ),
+            add_host_keys=add_host_keys,
+            data_stdin=f,
+            ignore_failure=True,
+            username=username,
+            wrapper_inner=wrapper_inner,
+            wrapper_outer=wrapper_outer,
+        )
 
-    if scp_process.return_code != 0:
+    if result.return_code != 0:
         if ignore_failure:
             return False
         raise RemoteException(_(
@@ -493,54 +1422,117 @@ def upload(
         ).format(
             failed=remote_path,
             host=hostname,
-            result=force_text(scp_process.stdout) + force_text(scp_process.stderr),
+            result=force_text(result.stdout) + force_text(result.stderr),
         ))
+    return True
 
-    if owner or group:
-        if group:
-            group = ":" + quote(group)
-        result = run(
+
+def upload_many(
+    hostname,
+    files,
+    add_host_keys=False,
+    username=None,
+    wrapper_inner="{}",
+    wrapper_outer="{}",
+):
+    """
+    Uploads several files using a single tar archive per
+    UPLOAD_BATCH_SIZE files instead of one command per file.
+
+    files is a list of (local_path, remote_path, mode, owner, group)
+    tuples with absolute remote paths. Returns a dict mapping remote
+    paths that could not be moved into place to the error output of
+    the failed command. Raises RemoteException if the archive could
+    not be extracted.
+    """
+    failed = {}
+    for i in range(0, len(files), UPLOAD_BATCH_SIZE):
+        failed.update(_upload_batch(
             hostname,
-            "chown {}{} {}".format(
-                quote(owner),
-                group,
-                quote(temp_filename),
-            ),
+            files[i:i + UPLOAD_BATCH_SIZE],
             add_host_keys=add_host_keys,
-            ignore_failure=ignore_failure,
             username=username,
             wrapper_inner=wrapper_inner,
             wrapper_outer=wrapper_outer,
+        ))
+    return failed
+
+
+def _upload_batch(
+    hostname,
+    files,
+    add_host_keys=False,
+    username=None,
+    wrapper_inner="{}",
+    wrapper_outer="{}",
+):
+    io.debug(_("uploading {count} files to {host}").format(
+        count=len(files),
+        host=hostname,
+    ))
+    remote_paths = [remote_path for local_path, remote_path, mode, owner, group in files]
+    temp_paths = [_upload_temp_path(remote_path) for remote_path in remote_paths]
+    # failed files are reported on stdout as their index and error
+    # output, enclosed by a random marker so we can tell them apart
+    # from anything else that might end up on stdout
+    marker = randstr()
+
+    commands = [
+        "mkdir -p -- {} && umask 077 && tar -xf - -C / || {{ rm -f {}; exit 1; }}".format(
+            " ".join(quote(path) for path in sorted({dirname(path) for path in remote_paths})),
+            " ".join(quote(temp_path) for temp_path in temp_paths),
+        ),
+    ]
+    for index, (temp_path, (local_path, remote_path, mode, owner, group)) in \
+            enumerate(zip(temp_paths, files)):
+        commands.append(
+            "e=$({{ {}; }} 2>&1) || "
+            "{{ rm -f {}; printf '\\n%s %d\\n%s\\n%s\\n' {} {} \"$e\" {}; }}".format(
+                " && ".join(_install_commands(local_path, temp_path, remote_path, mode, owner, group)),
+                quote(temp_path),
+                marker,
+                index,
+                marker,
+            )
         )
-        if result.return_code != 0:
-            return False
 
-    if mode:
+    with TemporaryFile() as archive_file:
+        with tar_open(fileobj=archive_file, mode='w') as archive:
+            for temp_path, (local_path, remote_path, mode, owner, group) in \
+                    zip(temp_paths, files):
+                with open(local_path, 'rb') as f:
+                    tarinfo = archive.gettarinfo(arcname=temp_path.lstrip("/"), fileobj=f)
+                    # actual ownership and mode are set after extraction
+                    tarinfo.mode = 0o600
+                    tarinfo.uid = tarinfo.gid = 0
+                    tarinfo.uname = tarinfo.gname = ""
+                    archive.addfile(tarinfo, f)
+        archive_file.seek(0)
         result = run(
             hostname,
-            "chmod {} {}".format(
-                mode,
-                quote(temp_filename),
-            ),
+            "\n".join(commands),
             add_host_keys=add_host_keys,
-            ignore_failure=ignore_failure,
+            data_stdin=archive_file,
+            ignore_failure=True,
             username=username,
             wrapper_inner=wrapper_inner,
             wrapper_outer=wrapper_outer,
         )
-        if result.return_code != 0:
-            return False
 
-    result = run(
-        hostname,
-        "mv -f {} {}".format(
-            quote(temp_filename),
-            quote(remote_path),
-        ),
-        add_host_keys=add_host_keys,
-        ignore_failure=ignore_failure,
-        username=username,
-        wrapper_inner=wrapper_inner,
-        wrapper_outer=wrapper_outer,
-    )
-    return result.return_code == 0
+    if result.return_code != 0:
+        raise RemoteException(_(
+            "Upload of {count} files to {host} failed:\n\n{result}\n\n"
+        ).format(
+            count=len(files),
+            host=hostname,
+            result=force_text(result.stdout) + force_text(result.stderr),
+        ))
+    marker = marker.encode('ascii')
+    return {
+        remote_paths[int(match.group(1))]: force_text(match.group(2))
+        for match in finditer(
+            b"\n" + marker + b" (\\d+)\n(.*?)\n" + marker + b"\n",
+            result.stdout,
+            DOTALL,
+        )
+    }
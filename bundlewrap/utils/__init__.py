@@ -295,7 +295,11 @@ def hash_local_file(path):
     """
     Retuns the sha256 hash of a file on the local machine.
     """
-    return sha256(get_file_contents(path))
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 
 def list_starts_with(list_a, list_b):
@@ -0,0 +1,148 @@
+from hashlib import sha256
+from inspect import unwrap
+from os import close, makedirs, remove, replace
+from os.path import exists, join
+from pickle import dumps, loads, PicklingError, UnpicklingError
+from tempfile import mkstemp
+
+from .. import VERSION_STRING
+from . import Fault, get_file_contents
+
+
+def _canonical(obj):
+    """
+    Returns a representation of the given metadata value that is stable
+    across runs of bw, retaining type information that would be lost
+    when converting to JSON (e.g. sets vs. lists, atomic() wrappers).
+    """
+    if isinstance(obj, dict):
+        return (
+            type(obj).__name__,
+            tuple(sorted((key, _canonical(value)) for key, value in obj.items())),
+        )
+    elif isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, tuple(_canonical(value) for value in obj))
+    elif isinstance(obj, set):
+        return (type(obj).__name__, tuple(sorted(repr(_canonical(value)) for value in obj)))
+    elif isinstance(obj, Fault):
+        # Faults can't be resolved here, so their IDs will have to do.
+        # Some of these IDs include Python's randomized hash() values,
+        # so we might end up with a cache miss, but never a false hit.
+        return ('Fault', repr(obj.id_list))
+    else:
+        return (type(obj).__name__, repr(obj))
+
+
+def _contains_fault(obj):
+    if isinstance(obj, Fault):
+        return True
+    elif isinstance(obj, dict):
+        return any(_contains_fault(value) for value in obj.values())
+    elif isinstance(obj, (list, set, tuple)):
+        return any(_contains_fault(value) for value in obj)
+    else:
+        return False
+
+
+def hash_for_cache(obj):
+    """
+    Returns a sha256 hash describing the given metadata value.
+    """
+    return sha256(repr(_canonical(obj)).encode('utf-8')).hexdigest()
+
+
+class ReactorCache:
+    """
+    Stores the results of metadata reactors in a directory so they can
+    be reused by subsequent invocations of bw.
+
+    Each entry records the metadata paths the reactor requested along
+    with hashes of their values at the time. A cached result is only
+    considered valid as long as all of those values as well as the
+    source of the metadata.py file defining the reactor are unchanged.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._source_hashes = {}
+
+    def _entry_path(self, node_name, reactor_name):
+        return join(
+            self.path,
+            sha256(f"{node_name}\0{reactor_name}".encode('utf-8')).hexdigest(),
+        )
+
+    def _source_hash(self, reactor):
+        try:
+            source_file = unwrap(reactor).__code__.co_filename
+        except AttributeError:
+            return None
+        if source_file not in self._source_hashes:
+            try:
+                self._source_hashes[source_file] = \
+                    sha256(get_file_contents(source_file)).hexdigest()
+            except OSError:
+                self._source_hashes[source_file] = None
+        return self._source_hashes[source_file]
+
+    def get(self, node_name, reactor_name, reactor):
+        """
+        Returns a dict with the keys 'inputs' (mapping requested paths
+        to value hashes) and 'layer' (the metadata returned by the
+        reactor) or None if there is no usable entry.
+        """
+        source_hash = self._source_hash(reactor)
+        if source_hash is None:
+            return None
+
+        key = (node_name, reactor_name)
+        if key not in self._entries:
+            entry_path = self._entry_path(node_name, reactor_name)
+            try:
+                self._entries[key] = loads(get_file_contents(entry_path))
+            except (OSError, EOFError, UnpicklingError, AttributeError, ImportError):
+                self._entries[key] = None
+
+        entry = self._entries[key]
+        if (
+            entry is None or
+            entry['version'] != VERSION_STRING or
+            entry['source_hash'] != source_hash
+        ):
+            return None
+        return entry
+
+    def set(self, node_name, reactor_name, reactor, inputs, layer):
+        if _contains_fault(layer):
+            # Faults often carry secrets (possibly already resolved),
+            # which must not end up on disk
+            return
+
+        source_hash = self._source_hash(reactor)
+        if source_hash is None:
+            return
+
+        entry = {
+            'inputs': inputs,
+            'layer': layer,
+            'source_hash': source_hash,
+            'version': VERSION_STRING,
+        }
+        try:
+            content = dumps(entry)
+        except (AttributeError, PicklingError, TypeError):
+            # something unpicklable other than a Fault
+            return
+
+        if not exists(self.path):
+            makedirs(self.path)
+        handle, tmp_path = mkstemp(dir=self.path, prefix=".tmp")
+        close(handle)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            replace(tmp_path, self._entry_path(node_name, reactor_name))
+        except OSError:
+            remove(tmp_path)
+            raise
+        self._entries[(node_name, reactor_name)] = entry
@@ -1,9 +1,27 @@
 from ..exceptions import MetadataUnavailable
-from ..metadata import METADATA_TYPES, deepcopy_metadata, validate_metadata, value_at_key_path
-from .dicts import ATOMIC_TYPES, map_dict_keys, merge_dict
+from ..metadata import (
+    METADATA_TYPES,
+    deepcopy_metadata,
+    freeze_metadata,
+    validate_metadata,
+    value_at_key_path,
+)
+from .dicts import _Atomic, map_dict_keys, merge_dict
 
 
-UNMERGEABLE = tuple(METADATA_TYPES) + tuple(ATOMIC_TYPES.values())
+UNMERGEABLE = tuple(METADATA_TYPES) + (_Atomic,)
+
+
+class _MISSING: pass
+
+
+def _contains_atomic_dict(value):
+    if not isinstance(value, dict):
+        return False
+    elif isinstance(value, _Atomic):
+        return True
+    else:
+        return any(_contains_atomic_dict(child) for child in value.values())
 
 
 class Metastack:
@@ -13,9 +31,20 @@ class Metastack:
     from one particular source of metadata: a bundle default, a group,
     the node itself, or a metadata reactor. Metadata reactors are unique
     in their ability to revise their own layer each time they are run.
+
+    With materialized=True, merged values are kept per top-level key
+    and only recomputed for the keys touched by set_layer() and
+    pop_layer(). get() is then a simple lookup in the merged tree.
+    Lookups below an atomic() dict and lookups of paths missing from
+    the merged tree fall back to merging the layers at the requested
+    path, since some layers might still provide it there.
+
+    With frozen=True, get() returns read-only values instead of deep
+    copies. Combined with materialized=True, merged values are frozen
+    only once and can then be handed out without copying.
     """
 
-    def __init__(self):
+    def __init__(self, materialized=False, frozen=False):
         self._partitions = (
             # We rely heavily on insertion order in these dicts.
             {},  # node/groups
@@ -23,11 +52,35 @@ class Metastack:
             {},  # defaults
         )
         self._cached_partitions = {}
+        self._materialized = materialized
+        self._copy = freeze_metadata if frozen else deepcopy_metadata
+        self._frozen = frozen
+        # maps top-level keys to their merged value (or _MISSING)
+        self._merged = {}
+        # top-level keys with atomic() dicts below them in any layer
+        self._atomic_keys = set()
 
     def get(self, path):
         """
         Get the value at the given path, merging all layers together.
         """
+        if self._materialized and path:
+            value = self._merged_value(path[0])
+            if value is _MISSING:
+                raise MetadataUnavailable(path)
+            if len(path) == 1 or (
+                isinstance(value, dict) and path[0] not in self._atomic_keys
+            ):
+                try:
+                    value = value_at_key_path(value, path[1:])
+                except MetadataUnavailable:
+                    pass
+                else:
+                    # frozen values have been frozen by _merged_value()
+                    return value if self._frozen else self._copy(value)
+        return self._copy(self._merge_path(path))
+
+    def _merge_path(self, path):
         result = None
         undef = True
 
@@ -44,7 +97,7 @@ class Metastack:
                         # First time we see anything. If we can't merge
                         # it anyway, then return early.
                         if isinstance(value, UNMERGEABLE):
-                            return deepcopy_metadata(value)
+                            return value
                         result = {'data': value}
                         undef = False
                     else:
@@ -53,7 +106,77 @@ class Metastack:
         if undef:
             raise MetadataUnavailable(path)
         else:
-            return deepcopy_metadata(result['data'])
+            return result['data']
+
+    def _merged_value(self, key):
+        try:
+            return self._merged[key]
+        except KeyError:
+            try:
+                value = self._merge_path((key,))
+            except MetadataUnavailable:
+                value = _MISSING
+            else:
+                if self._frozen:
+                    value = freeze_metadata(value)
+            if self._layer_values_contain_atomic_dict(key):
+                self._atomic_keys.add(key)
+            self._merged[key] = value
+            return value
+
+    def _layer_values_contain_atomic_dict(self, key):
+        for part_index, partition in enumerate(self._partitions):
+            partition = self._cached_partitions.get(part_index, partition)
+            for layer in partition.values():
+                if _contains_atomic_dict(layer.get(key)):
+                    return True
+        return False
+
+    def _static_value(self, key):
+        """
+        Returns the value for the given top-level key if it is defined
+        by exactly one layer and that layer doesn't belong to a reactor
+        (_MISSING otherwise). Since merging a single layer doesn't
+        change anything, this is the merged value as well.
+        """
+        value = _MISSING
+        for part_index, partition in enumerate(self._partitions):
+            for layer in partition.values():
+                if key in layer:
+                    if value is not _MISSING or part_index == 1:
+                        return _MISSING
+                    value = layer[key]
+        return value
+
+    def top_level_items(self):
+        """
+        Yields (key, value, static) tuples for all top-level keys of the
+        merged metadata, sorted by key. Values are not copied and must
+        not be modified. static is True if the value was taken as is
+        from a group, node or defaults layer, which means it might be
+        the very same object in the metadata of other nodes.
+        """
+        keys = set()
+        for partition in self._partitions:
+            for layer in partition.values():
+                keys.update(layer.keys())
+
+        for key in sorted(keys):
+            value = self._static_value(key)
+            if value is not _MISSING:
+                yield key, value, True
+            elif self._materialized:
+                value = self._merged_value(key)
+                if value is not _MISSING:
+                    yield key, value, False
+            else:
+                yield key, self._merge_path((key,)), False
+
+    def _invalidate(self, layer):
+        if self._materialized:
+            for key in layer:
+                self._merged.pop(key, None)
+                self._atomic_keys.discard(key)
 
     def as_dict(self, partitions=None):
         final_dict = {}
@@ -87,15 +210,46 @@ class Metastack:
 
     def pop_layer(self, partition_index, identifier):
         try:
-            return self._partitions[partition_index].pop(identifier)
+            old_layer = self._partitions[partition_index].pop(identifier)
         except (KeyError, IndexError):
             return {}
-
-    def set_layer(self, partition_index, identifier, new_layer):
-        validate_metadata(new_layer)
+        else:
+            self._invalidate(old_layer)
+            return old_layer
+
+    def set_layer(self, partition_index, identifier, new_layer, validate=True):
+        if validate:
+            validate_metadata(new_layer)
+        self._invalidate(self._partitions[partition_index].get(identifier, {}))
+        self._invalidate(new_layer)
         self._partitions[partition_index][identifier] = new_layer
 
-    def cache_partition(self, partition_index):
+    def cache_partition(self, partition_index, merged_prefix=None):
+        """
+        From now on, use all layers in the given partition merged into
+        one when looking up metadata.
+
+        merged_prefix may be the result of merging all but the last
+        layer of the partition, e.g. as_dict() called before adding the
+        last layer. It will be reused for all top-level keys the last
+        layer doesn't have, so stacks sharing all other layers can
+        share the work of merging them.
+        """
+        if merged_prefix is None:
+            merged = self.as_dict(partitions=[partition_index])
+        else:
+            layers = list(self._partitions[partition_index].values())
+            merged = merged_prefix.copy()
+            for key in (layers[-1] if layers else ()):
+                # merging isn't associative (think atomic()), so we
+                # need to merge this key the same way as_dict() would
+                final_dict = {}
+                for layer in reversed(layers):
+                    if key in layer:
+                        final_dict = merge_dict({key: layer[key]}, final_dict)
+                merged[key] = final_dict[key]
+
         self._cached_partitions[partition_index] = {
-            'merged layers': self.as_dict(partitions=[partition_index]),
+            'merged layers': merged,
         }
+        self._invalidate(self._cached_partitions[partition_index]['merged layers'])
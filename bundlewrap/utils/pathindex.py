@@ -0,0 +1,105 @@
+from os.path import normpath
+
+from .text import mark_for_translation as _
+
+
+def _path_components(path):
+    path = normpath(path)
+    if not path.startswith("/"):
+        raise ValueError(_("directory paths must be absolute"))
+    return [component for component in path.split("/") if component]
+
+
+class PathIndex:
+    """
+    Holds all items on a node and is passed to Item.get_auto_attrs().
+
+    Iterating over it yields all items, just like the set of items it
+    was created from. In addition, it allows looking up items by type
+    and name as well as by the paths returned from their
+    get_indexed_paths() without looking at every single item.
+
+    Paths are stored in a trie: each node is a dict mapping path
+    components to child nodes, with the items managing the path itself
+    stored under the key None.
+    """
+    def __init__(self, items):
+        self._items = items
+        self._by_type = {}
+        self._by_type_and_name = {}
+        self._root = {}
+        for item in items:
+            self._by_type.setdefault(item.ITEM_TYPE_NAME, []).append(item)
+            self._by_type_and_name[(item.ITEM_TYPE_NAME, item.name)] = item
+            for path in item.get_indexed_paths():
+                trie_node = self._root
+                for component in _path_components(path):
+                    trie_node = trie_node.setdefault(component, {})
+                trie_node.setdefault(None, []).append(item)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, item_type, name):
+        """
+        Returns the item with the given type and name or None.
+        """
+        return self._by_type_and_name.get((item_type, name))
+
+    def items_of_type(self, item_type):
+        return tuple(self._by_type.get(item_type, ()))
+
+    def items_above(self, path):
+        """
+        Returns all items with an indexed path that is a parent
+        directory of the given path (see is_subdirectory()).
+        """
+        result = []
+        trie_node = self._root
+        for component in _path_components(path):
+            result.extend(trie_node.get(None, ()))
+            try:
+                trie_node = trie_node[component]
+            except KeyError:
+                break
+        return result
+
+    def items_at(self, path):
+        """
+        Returns all items with an indexed path equal to the given path.
+        """
+        trie_node = self._root
+        for component in _path_components(path):
+            try:
+                trie_node = trie_node[component]
+            except KeyError:
+                return []
+        return list(trie_node.get(None, ()))
+
+    def items_below(self, path):
+        """
+        Returns all items with an indexed path inside the given
+        directory (see is_subdirectory()).
+        """
+        trie_node = self._root
+        for component in _path_components(path):
+            try:
+                trie_node = trie_node[component]
+            except KeyError:
+                return []
+        result = []
+        trie_nodes = [child for key, child in trie_node.items() if key is not None]
+        while trie_nodes:
+            trie_node = trie_nodes.pop()
+            for key, child in trie_node.items():
+                if key is None:
+                    result.extend(child)
+                else:
+                    trie_nodes.append(child)
+        return result
@@ -1,5 +1,6 @@
 from ..exceptions import MetadataPersistentKeyError
 from . import names
+from .pathindex import PathIndex
 from .text import bold, mark_for_translation as _, yellow
 from .ui import io
 
@@ -78,8 +79,9 @@ def graph_for_items(
             bundles_seen.add(item.bundle.name)
 
     # Define dependencies between items
+    path_index = PathIndex(items)
     for item in sorted(items):
-        auto_attrs = item.get_auto_attrs(items)
+        auto_attrs = item.get_auto_attrs(path_index)
         if regular:
             for dep in sorted(item._deps_needs & items):
                 if dep.id in auto_attrs.get('needs', set()) and auto:
@@ -1,25 +1,57 @@
+from contextlib import suppress
 from shlex import quote
+from threading import Lock
 
 from . import cached_property
 from .text import force_text, mark_for_translation as _
 from .ui import io
 
 
-def stat(node, path):
+# number of paths to look at in a single command
+PREFETCH_BATCH_SIZE = 250
+
+# Prints stat output, sha256 output (regular files only) and readlink
+# output (symlinks only) for each path, all terminated by NUL bytes.
+# Fields that don't apply are left empty.
+PREFETCH_SCRIPT = (
+    "for p in {paths}; do "
+    "s=$({stat} -- \"$p\" 2>/dev/null) || s=; h=; t=; "
+    "case \"$s\" in "
+    "*':regular file'|*':regular empty file'|*':Regular File') "
+    "h=$({sha256} -- \"$p\" 2>/dev/null) ;; "
+    "*':symbolic link'|*':Symbolic Link') "
+    "t=$(readlink -- \"$p\" 2>/dev/null) ;; "
+    "esac; "
+    "printf '%s\\0%s\\0%s\\0' \"$s\" \"$h\" \"$t\"; "
+    "done"
+)
+
+
+def sha256_command(node):
+    if node.os == 'macos':
+        return "shasum -a 256"
+    elif node.os in node.OS_FAMILY_BSD:
+        return "sha256 -q"
+    else:
+        return "sha256sum"
+
+
+def _stat_command(node):
     if node.os in node.OS_FAMILY_BSD:
-        result = node.run(
-            "stat -f '%Su:%Sg:%u:%g:%p:%z:%HT' -- {}".format(quote(path)),
-            may_fail=True,
-        )
+        return "stat -f '%Su:%Sg:%u:%g:%p:%z:%HT'"
     else:
-        result = node.run(
-            "stat -c '%U:%G:%u:%g:%a:%s:%F' -- {}".format(quote(path)),
-            may_fail=True,
-        )
-    if result.return_code != 0:
-        return {}
+        return "stat -c '%U:%G:%u:%g:%a:%s:%F'"
+
+
+def _parse_sha256(output):
+    # sha256sum adds a leading backslash to hashes of files whose name
+    # contains backslash-escaped characters – we must lstrip() that
+    return force_text(output).strip().lstrip("\\").split()[0]
+
+
+def _parse_stat(output):
     owner, group, owner_id, group_id, mode, size, ftype = \
-        force_text(result.stdout).strip().split(":", 7)
+        force_text(output).strip().split(":", 7)
     mode = mode[-4:].zfill(4)  # cut off BSD file type
     file_stat = {
         'owner': owner,
@@ -30,6 +62,17 @@ def stat(node, path):
         'size': int(size),
         'type': ftype.lower(),
     }
+    return file_stat
+
+
+def stat(node, path):
+    result = node.run(
+        "{} -- {}".format(_stat_command(node), quote(path)),
+        may_fail=True,
+    )
+    if result.return_code != 0:
+        return {}
+    file_stat = _parse_stat(result.stdout)
     io.debug(_("stat for '{path}' on {node}: {result}".format(
         node=node.name,
         path=path,
@@ -38,6 +81,104 @@ def stat(node, path):
     return file_stat
 
 
+def prefetch_path_info(node, paths):
+    """
+    Looks up stat results, hashes of regular files and targets of
+    symlinks for all given paths using as few commands as possible.
+    PathInfo objects for these paths will use the results instead of
+    running commands of their own until forget_remote_state() is called.
+    """
+    paths = sorted(set(paths))
+    results = {}
+    with node._remote_state.lock:
+        generation = node._remote_state.generation
+    for i in range(0, len(paths), PREFETCH_BATCH_SIZE):
+        batch = paths[i:i + PREFETCH_BATCH_SIZE]
+        result = node.run(PREFETCH_SCRIPT.format(
+            paths=" ".join(quote(path) for path in batch),
+            sha256=sha256_command(node),
+            stat=_stat_command(node),
+        ))
+        fields = result.stdout.split(b"\0")
+        if len(fields) != len(batch) * 3 + 1:
+            io.debug(_("unexpected output while prefetching path info on {node}").format(
+                node=node.name,
+            ))
+            return
+        for index, path in enumerate(batch):
+            path_stat, sha256, symlink_target = fields[index * 3:index * 3 + 3]
+            results[path] = (
+                _parse_stat(path_stat) if path_stat else {},
+                _parse_sha256(sha256) if sha256 else None,
+                force_text(symlink_target.strip()) if symlink_target else None,
+            )
+    with node._remote_state.lock:
+        # don't install results that might predate a change made while
+        # we were busy looking
+        if node._remote_state.generation != generation:
+            io.debug(_("discarding prefetched path info for {node}").format(
+                node=node.name,
+            ))
+            return
+        node._prefetched_path_info = results
+    io.debug(_("prefetched path info for {count} paths on {node}").format(
+        count=len(results),
+        node=node.name,
+    ))
+
+
+class RemoteStateCache:
+    """
+    Holds results of cached_remote_state() for a single node.
+    """
+    def __init__(self):
+        self.generation = 0
+        self.lock = Lock()
+        self.key_locks = {}
+        self.results = {}
+
+
+def cached_remote_state(node, key, fetch):
+    """
+    Returns fetch(node), which should look up some state on the node
+    as a whole (e.g. the states of all services). The result is reused
+    for the same key until forget_remote_state() is called.
+
+    fetch() is only called once per node and key, even if several items
+    ask at the same time.
+    """
+    cache = node._remote_state
+    with cache.lock:
+        with suppress(KeyError):
+            return cache.results[key]
+        key_lock = cache.key_locks.setdefault(key, Lock())
+    with key_lock:
+        with cache.lock:
+            with suppress(KeyError):
+                return cache.results[key]
+            generation = cache.generation
+        result = fetch(node)
+        with cache.lock:
+            # don't keep results that might predate a change made while
+            # we were busy looking
+            if cache.generation == generation:
+                cache.results[key] = result
+        return result
+
+
+def forget_remote_state(node):
+    """
+    Makes sure PathInfo objects created from now on and
+    cached_remote_state() will look at the actual node again, not at
+    results from prefetch_path_info() or earlier lookups. Must be
+    called whenever something on the node might have been changed.
+    """
+    with node._remote_state.lock:
+        node._prefetched_path_info = {}
+        node._remote_state.generation += 1
+        node._remote_state.results = {}
+
+
 class PathInfo:
     """
     Serves as a proxy to get_path_type.
@@ -46,7 +187,16 @@ class PathInfo:
     def __init__(self, node, path):
         self.node = node
         self.path = path
-        self.stat = stat(node, path)
+        try:
+            self.stat, sha256, symlink_target = node._prefetched_path_info[path]
+        except KeyError:
+            self.stat = stat(node, path)
+        else:
+            self._cache = {}
+            if sha256 is not None:
+                self._cache['sha256'] = sha256
+            if symlink_target is not None:
+                self._symlink_target = symlink_target
 
     def __repr__(self):
         return "<PathInfo for {}:{}>".format(self.node.name, quote(self.path))
@@ -109,15 +259,9 @@ class PathInfo:
 
     @cached_property
     def sha256(self):
-        if self.node.os == 'macos':
-            result = self.node.run("shasum -a 256 -- {}".format(quote(self.path)))
-        elif self.node.os in self.node.OS_FAMILY_BSD:
-            result = self.node.run("sha256 -q -- {}".format(quote(self.path)))
-        else:
-            result = self.node.run("sha256sum -- {}".format(quote(self.path)))
-        # sha256sum adds a leading backslash to hashes of files whose name
-        # contains backslash-escaped characters – we must lstrip() that
-        return force_text(result.stdout).strip().lstrip("\\").split()[0]
+        return _parse_sha256(self.node.run(
+            "{} -- {}".format(sha256_command(self.node), quote(self.path))
+        ).stdout)
 
     @property
     def size(self):
@@ -128,6 +272,9 @@ class PathInfo:
         if not self.is_symlink:
             raise ValueError("{} is not a symlink".format(quote(self.path)))
 
+        with suppress(AttributeError):
+            return self._symlink_target
+
         return force_text(self.node.run(
             "readlink -- {}".format(quote(self.path)), may_fail=True,
         ).stdout.strip())
@@ -195,10 +195,10 @@ def wrap_question(title, body, question, prefix=""):
 
 
 class LineBuffer:
-    def __init__(self, target):
+    def __init__(self, target, record=None):
         self.buffer = b""
-        self.record = BytesIO()
-        self.target = target if target else lambda s: None
+        self.record = BytesIO() if record is None else record
+        self.target = target
 
     def close(self):
         self.flush()
@@ -213,8 +213,12 @@ class LineBuffer:
             self.target(chunk + b"\n")
 
     def write(self, msg):
-        self.buffer += msg
-        self.flush()
+        if self.target is None:
+            # nobody wants to see individual lines
+            self.record.write(msg)
+        else:
+            self.buffer += msg
+            self.flush()
 
 
 def format_duration(duration, msec=False):
@@ -332,3 +332,48 @@ def test_file_group_gid(tmpdir):
     assert rcode == 0
 
     assert stat(join(str(tmpdir), "foo")).st_gid == 32002
+
+
+def test_multiple_files(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={
+            "test": {
+                'items': {
+                    'files': {
+                        join(str(tmpdir), "foo"): {
+                            'content': "foo",
+                            'mode': "0600",
+                        },
+                        join(str(tmpdir), "bar"): {
+                            'content': "bar",
+                        },
+                        join(str(tmpdir), "baz", "qux"): {
+                            'content': "qux",
+                            'mode': "0640",
+                        },
+                    },
+                },
+            },
+        },
+        nodes={
+            "localhost": {
+                'bundles': ["test"],
+                'os': host_os(),
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bar"), 'wb') as f:
+        f.write(b"old content")
+
+    stdout, stderr, rcode = run("bw apply localhost", path=str(tmpdir))
+    assert rcode == 0
+
+    for path, content, mode in (
+        ("foo", b"foo", 0o600),
+        ("bar", b"bar", 0o644),
+        (join("baz", "qux"), b"qux", 0o640),
+    ):
+        with open(join(str(tmpdir), path), 'rb') as f:
+            assert f.read() == content
+        assert stat(join(str(tmpdir), path)).st_mode & 0o777 == mode
@@ -726,3 +726,141 @@ def foo(metadata):
     assert rcode == 1
     assert b"node1" in stderr
     assert b"test.foo" in stderr
+
+
+def test_reactor_cache(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+                'metadata': {"foo": "bar"},
+            },
+        },
+    )
+    reactor_log = join(str(tmpdir), "reactor.log")
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write(
+f"""@metadata_reactor
+def foo(metadata):
+    with open({reactor_log!r}, 'a') as f:
+        f.write("ran\\n")
+    return {{
+        "baz": metadata.get("foo") + "baz",
+    }}
+""")
+    cache_dir = join(str(tmpdir), "cache")
+    for i in range(2):
+        stdout, stderr, rcode = run(f"BW_METADATA_CACHE={cache_dir} bw metadata node1", path=str(tmpdir))
+        assert rcode == 0
+        assert loads(stdout.decode()) == {"foo": "bar", "baz": "barbaz"}
+    with open(reactor_log) as f:
+        assert f.read() == "ran\n"
+
+    with open(join(str(tmpdir), "nodes.py"), 'w') as f:
+        f.write("nodes = {'node1': {'bundles': ['test'], 'metadata': {'foo': 'frob'}}}")
+    stdout, stderr, rcode = run(f"BW_METADATA_CACHE={cache_dir} bw metadata node1", path=str(tmpdir))
+    assert rcode == 0
+    assert loads(stdout.decode()) == {"foo": "frob", "baz": "frobbaz"}
+    with open(reactor_log) as f:
+        assert f.read() == "ran\nran\n"
+
+
+def test_reactor_profile(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+                'metadata': {"foo": "bar"},
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write(
+"""@metadata_reactor
+def foo(metadata):
+    return {
+        "baz": metadata.get("foo") + "baz",
+    }
+""")
+    stdout, stderr, rcode = run(
+        "bw metadata node1 --reactor-profile --reactor-profile-json --reactor-profile-sort runs",
+        path=str(tmpdir),
+    )
+    assert rcode == 0
+    profile = loads(stdout.decode())
+    assert len(profile) == 1
+    assert profile[0]['node'] == "node1"
+    assert profile[0]['reactor'] == "metadata_reactor:test.foo"
+    assert profile[0]['runs'] >= 1
+    assert profile[0]['changes'] == 1
+    assert profile[0]['unavailable'] == 0
+    assert profile[0]['bytes'] == len('{"baz": "barbaz"}')
+
+
+def test_reactor_profile_sort_ties(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+                'metadata': {"foo": "bar"},
+            },
+            "node2": {
+                'bundles': ["test"],
+                'metadata': {"foo": "barbarbar"},
+            },
+            "node3": {
+                'bundles': ["test"],
+                'metadata': {"foo": "bar"},
+            },
+        },
+    )
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write(
+"""@metadata_reactor
+def foo(metadata):
+    return {
+        "baz": metadata.get("foo") + "baz",
+    }
+""")
+    stdout, stderr, rcode = run(
+        "bw metadata node3 node2 node1 --reactor-profile --reactor-profile-json --reactor-profile-sort bytes",
+        path=str(tmpdir),
+    )
+    assert rcode == 0
+    profile = loads(stdout.decode())
+    assert [entry['node'] for entry in profile] == ["node2", "node1", "node3"]
+
+
+def test_reactor_not_rerun_for_new_path(tmpdir):
+    make_repo(
+        tmpdir,
+        bundles={"test": {}},
+        nodes={
+            "node1": {
+                'bundles': ["test"],
+                'metadata': {"foo": "bar"},
+            },
+        },
+    )
+    reactor_log = join(str(tmpdir), "reactor.log")
+    with open(join(str(tmpdir), "bundles", "test", "metadata.py"), 'w') as f:
+        f.write(
+f"""@metadata_reactor
+def foo(metadata):
+    with open({reactor_log!r}, 'a') as f:
+        f.write("ran\\n")
+    return {{
+        "baz": metadata.get("foo") + "baz",
+    }}
+""")
+    stdout, stderr, rcode = run("bw metadata node1 -k baz foo", path=str(tmpdir))
+    assert rcode == 0
+    assert loads(stdout.decode()) == {"foo": "bar", "baz": "barbaz"}
+    with open(reactor_log) as f:
+        assert f.read() == "ran\n"
@@ -18,6 +18,14 @@ def test_single(tmpdir):
     assert stderr == b""
     assert rcode == 0
 
+def test_scp_args_deprecated(tmpdir):
+    make_repo(tmpdir, nodes={"node1": {}})
+    stdout, stderr, rcode = run("BW_SCP_ARGS=-C bw nodes", path=str(tmpdir))
+    assert stdout == b"node1\n"
+    assert b"BW_SCP_ARGS is no longer used" in stderr
+    assert rcode == 0
+
+
 def test_nonexistent(tmpdir):
     make_repo(tmpdir, nodes={"node1": {}})
     stdout, stderr, rcode = run("bw nodes node2", path=str(tmpdir))
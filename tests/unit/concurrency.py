@@ -0,0 +1,43 @@
+from asyncio import sleep as async_sleep
+from threading import active_count
+from time import sleep
+
+from bundlewrap.concurrency import AsyncWorkerPool
+
+
+def test_async_worker_pool():
+    pending = list(range(100))
+    results = {}
+    max_threads = []
+
+    async def async_task(number):
+        max_threads.append(active_count())
+        await async_sleep(0.2)
+        return number * 2
+
+    def sync_task(number):
+        sleep(0.2)
+        return number * 2
+
+    def next_task():
+        number = pending.pop()
+        return {
+            'target': sync_task if number == 0 else async_task,
+            'task_id': str(number),
+            'args': (number,),
+        }
+
+    def handle_result(task_id, return_value, duration):
+        results[int(task_id)] = return_value
+
+    worker_pool = AsyncWorkerPool(
+        lambda: bool(pending),
+        next_task,
+        handle_result=handle_result,
+        workers=100,
+    )
+    worker_pool.run()
+
+    assert results == {number: number * 2 for number in range(100)}
+    # main thread, event loop and a single worker for the sync task
+    assert max(max_threads) <= 3
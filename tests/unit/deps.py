@@ -0,0 +1,116 @@
+from bundlewrap.deps import find_item, ItemIndex, prepare_dependencies, resolve_selector
+from bundlewrap.exceptions import NoSuchItem
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import make_repo
+from pytest import raises
+
+
+class FakeBundle:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeItem:
+    def __init__(self, item_type, name, bundle, tags=()):
+        self.ITEM_TYPE_NAME = item_type
+        self.bundle = FakeBundle(bundle)
+        self.id = f"{item_type}:{name}"
+        self.tags = set(tags)
+
+    def __repr__(self):
+        return self.id
+
+
+ITEMS = {
+    FakeItem("file", "/foo", "b1", tags={"t1"}),
+    FakeItem("file", "/bar", "b1"),
+    FakeItem("directory", "/baz", "b2", tags={"t1", "t2"}),
+    FakeItem("action", "qux", "b2"),
+}
+
+SELECTORS = (
+    "bundle:b1",
+    "!bundle:b1",
+    "tag:t1",
+    "!tag:t1",
+    "tag:",
+    "!tag:",
+    "file:",
+    "!file:",
+    "file:/foo",
+    "!file:/foo",
+    "bundle:nope",
+    "tag:nope",
+)
+
+
+def _ids(items):
+    return sorted(item.id for item in items)
+
+
+def test_resolve_selector_index():
+    index = ItemIndex(ITEMS)
+    for selector in SELECTORS:
+        for originating_item_id in (None, "file:/foo"):
+            assert _ids(resolve_selector(
+                selector,
+                index,
+                originating_item_id=originating_item_id,
+            )) == _ids(resolve_selector(
+                selector,
+                ITEMS,
+                originating_item_id=originating_item_id,
+            )), selector
+
+
+def test_find_item_index():
+    index = ItemIndex(ITEMS)
+    assert find_item("action:qux", index).id == "action:qux"
+    assert find_item("action:qux", ITEMS).id == "action:qux"
+    with raises(NoSuchItem):
+        find_item("action:nope", index)
+    with raises(NoSuchItem):
+        find_item("action:nope", ITEMS)
+
+
+def test_resolve_selector_index_many_items():
+    items = {
+        FakeItem(
+            "file" if i % 3 else "action",
+            str(i),
+            f"bundle{i % 100}",
+            tags={f"tag{i % 50}"},
+        )
+        for i in range(10000)
+    }
+    selectors = [f"action:{i}" for i in range(0, 3000, 30)] + \
+        [f"bundle:bundle{i}" for i in range(100)] + \
+        [f"tag:tag{i}" for i in range(50)] + \
+        ["file:", "action:"]
+
+    def workload(items):
+        return [_ids(resolve_selector(selector, items)) for selector in selectors]
+
+    assert workload(ItemIndex(items)) == workload(items)
+
+
+def test_prepare_dependencies_many_items(tmpdir):
+    actions = {}
+    for i in range(10000):
+        actions[f"action{i}"] = {
+            'command': "true",
+            'needs': [f"action:action{i - 1}"] if i % 100 else [],
+            'tags': [f"tag{i % 100}"],
+        }
+        if i % 100 == 99:
+            actions[f"action{i}"]['needs'].append(f"tag:tag{i % 100 - 1}")
+    make_repo(
+        tmpdir,
+        bundles={"bundle1": {'items': {'actions': actions}}},
+        nodes={"node1": {'bundles': ["bundle1"]}},
+    )
+    node = Repository(str(tmpdir)).get_node("node1")
+    items = prepare_dependencies(node)
+    flattened_deps = find_item("action:action9999", items)._flattened_deps
+    assert "action:action9900" in flattened_deps
+    assert "action:action9898" in flattened_deps
@@ -0,0 +1,143 @@
+from datetime import timedelta
+
+from bundlewrap.exceptions import MetadataUnavailable
+from bundlewrap.itemqueue import ItemQueue, ItemTestQueue
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import make_repo
+from pytest import raises
+
+
+def _node(tmpdir, items):
+    make_repo(
+        tmpdir,
+        bundles={"bundle1": {'items': items}},
+        nodes={"node1": {'bundles': ["bundle1"], 'os': "debian"}},
+    )
+    return Repository(str(tmpdir)).get_node("node1")
+
+
+def _ids(items):
+    return sorted(item.id for item in items)
+
+
+def test_dependencies(tmpdir):
+    queue = ItemQueue(_node(tmpdir, {'actions': {
+        "a": {'command': "true"},
+        "b": {'command': "true", 'needs': ["action:a"]},
+        "c": {'command': "true", 'after': ["action:a", "action:b"]},
+    }}))
+    assert _ids(queue.items_without_deps) == ["action:a"]
+    item = queue.pop()
+    assert item.id == "action:a"
+    with raises(MetadataUnavailable):
+        queue.pop()
+    assert not queue.has_runnable_items()
+
+    queue.item_ok(item)
+    assert _ids(queue.items_without_deps) == ["action:b"]
+    queue.item_fixed(queue.pop())
+    assert queue.pop().id == "action:c"
+    assert not queue.items_with_deps
+    assert not queue.items_without_deps
+
+
+def test_cascade_skip(tmpdir):
+    queue = ItemQueue(_node(tmpdir, {'actions': {
+        "a": {'command': "true"},
+        "b": {'command': "true", 'needs': ["action:a"]},
+        "c": {'command': "true", 'needs': ["action:b"]},
+        "d": {'command': "true", 'after': ["action:a"]},
+        "e": {'command': "true", 'needs': ["action:d"], 'cascade_skip': False},
+        "f": {'command': "true", 'needs': ["action:e"]},
+    }}))
+    skipped_items = list(queue.item_failed(queue.pop()))
+    assert _ids(skipped_items) == ["action:b", "action:c"]
+    assert _ids(queue.items_without_deps) == ["action:d"]
+
+    skipped_items = list(queue.item_skipped(queue.pop()))
+    assert _ids(skipped_items) == ["action:e"]
+    assert _ids(queue.items_without_deps) == ["action:f"]
+    assert not queue.items_with_deps
+
+
+def test_block_concurrent(tmpdir):
+    queue = ItemQueue(_node(tmpdir, {
+        'actions': {"a": {'command': "true"}},
+        'pkg_apt': {"foo": {}, "bar": {}},
+    }))
+    assert queue.has_runnable_items()
+    assert queue.pop_all_of_type("action")[0].id == "action:a"
+    pkg = queue.pop()
+    assert pkg.ITEM_TYPE_NAME == "pkg_apt"
+    assert not queue.has_runnable_items()
+    assert queue.pop_all_of_type("pkg_apt") == []
+    with raises(MetadataUnavailable):
+        queue.pop()
+
+    queue.item_ok(pkg)
+    assert queue.pop().ITEM_TYPE_NAME == "pkg_apt"
+
+
+def test_test_queue(tmpdir):
+    queue = ItemTestQueue(_node(tmpdir, {'actions': {
+        "a": {'command': "true"},
+        "b": {'command': "true", 'needs': ["action:a"]},
+        "c": {'command': "true", 'needs': ["action:d"]},
+        "d": {'command': "true", 'needs': ["action:c"]},
+    }}))
+    assert queue.pop().id == "action:a"
+    assert queue.pop().id == "action:b"
+    with raises(KeyError):
+        queue.pop()
+    assert _ids(queue.items_with_deps) == ["action:c", "action:d"]
+
+
+def test_queue_many_items(tmpdir):
+    actions = {}
+    for i in range(10000):
+        actions[f"action{i}"] = {
+            'command': "true",
+            'needs': [f"action:action{i - 1}"] if i % 100 else [],
+        }
+    queue = ItemQueue(_node(tmpdir, {'actions': actions}))
+
+    processed = 0
+    while queue.has_runnable_items():
+        queue.item_ok(queue.pop())
+        processed += 1
+    assert processed == 10000
+    assert not queue.items_with_deps
+
+
+def _chain_and_leaves(tmpdir):
+    actions = {f"leaf{i}": {'command': "true"} for i in range(5)}
+    actions["chain0"] = {'command': "true"}
+    actions["chain1"] = {'command': "true", 'needs': ["action:chain0"]}
+    actions["chain2"] = {'command': "true", 'needs': ["action:chain1"]}
+    actions["configure_foo"] = {'command': "true", 'needs': ["pkg_apt:foo"]}
+    return _node(tmpdir, {'actions': actions, 'pkg_apt': {"foo": {}}})
+
+
+def test_item_order_depth(tmpdir):
+    queue = ItemQueue(_chain_and_leaves(tmpdir), item_order="depth")
+    assert queue.pop().id == "action:chain0"
+    assert queue.pop().id == "pkg_apt:foo"
+    assert queue.pop().id == "action:leaf0"
+
+
+def test_item_order_cost(tmpdir, monkeypatch):
+    monkeypatch.setattr(ItemQueue, '_item_type_durations', {})
+    node = _chain_and_leaves(tmpdir)
+    queue = ItemQueue(node, item_order="cost")
+    ItemQueue.record_duration(queue.item_index.by_id["action:leaf0"], timedelta(seconds=1))
+    ItemQueue.record_duration(queue.item_index.by_id["pkg_apt:foo"], timedelta(seconds=20))
+
+    queue = ItemQueue(node, item_order="cost")
+    # 20s for pkg_apt:foo + 1s for action:configure_foo
+    assert queue.pop().id == "pkg_apt:foo"
+    assert queue.pop().id == "action:chain0"
+
+
+def test_item_order_invalid(tmpdir):
+    with raises(ValueError):
+        ItemQueue(_node(tmpdir, {'actions': {"a": {'command': "true"}}}), item_order="foo")
@@ -0,0 +1,49 @@
+from os import listdir
+
+from bundlewrap.metadata import atomic
+from bundlewrap.utils import Fault
+from bundlewrap.utils.metacache import hash_for_cache, ReactorCache
+
+
+def reactor(metadata):
+    return {}
+
+
+def secret():
+    return "secret"
+
+
+def test_hash_stable():
+    assert hash_for_cache({'a': {1, 2}, 'b': [1]}) == hash_for_cache({'b': [1], 'a': {2, 1}})
+
+
+def test_hash_types():
+    assert hash_for_cache({'a': [1, 2]}) != hash_for_cache({'a': (1, 2)})
+    assert hash_for_cache({'a': [1, 2]}) != hash_for_cache({'a': atomic([1, 2])})
+    assert hash_for_cache({'a': "1"}) != hash_for_cache({'a': 1})
+
+
+def test_cache_roundtrip(tmpdir):
+    cache = ReactorCache(str(tmpdir))
+    cache.set("node1", "reactor1", reactor, {('node1', 'foo'): "abc"}, {'bar': {1}})
+
+    cache = ReactorCache(str(tmpdir))
+    entry = cache.get("node1", "reactor1", reactor)
+    assert entry['inputs'] == {('node1', 'foo'): "abc"}
+    assert entry['layer'] == {'bar': {1}}
+    assert cache.get("node2", "reactor1", reactor) is None
+
+
+def test_cache_unpicklable(tmpdir):
+    cache = ReactorCache(str(tmpdir))
+    cache.set("node1", "reactor1", reactor, {}, {'bar': lambda: None})
+    assert cache.get("node1", "reactor1", reactor) is None
+
+
+def test_cache_fault(tmpdir):
+    fault = Fault("secret", secret)
+    fault.value
+    cache = ReactorCache(str(tmpdir))
+    cache.set("node1", "reactor1", reactor, {}, {'bar': [{'baz': fault}]})
+    assert cache.get("node1", "reactor1", reactor) is None
+    assert listdir(str(tmpdir)) == []
@@ -1,5 +1,14 @@
-from bundlewrap.utils.dicts import merge_dict
-from bundlewrap.metadata import atomic
+from bundlewrap.utils.dicts import _Atomic, merge_dict
+from bundlewrap.metadata import (
+    atomic,
+    deepcopy_metadata,
+    freeze_metadata,
+    FrozenDict,
+    metadata_items_to_json,
+    metadata_to_json,
+)
+from bundlewrap.utils import Fault
+from pytest import raises
 
 
 def test_atomic_no_merge_base():
@@ -14,3 +23,57 @@ def test_atomic_no_merge_update():
         {1: [5]},
         {1: atomic([6, 7])},
     ) == {1: [6, 7]}
+
+
+def test_deepcopy_thaws_frozen():
+    frozen = freeze_metadata({'foo': {'bar': [1], 'baz': {2}}, 'atomic': atomic([3])})
+    copied = deepcopy_metadata(frozen)
+    copied['foo']['bar'].append(2)
+    copied['foo']['baz'].add(3)
+    copied['atomic'].append(4)
+    assert copied == {'foo': {'bar': [1, 2], 'baz': {2, 3}}, 'atomic': [3, 4]}
+    assert frozen == {'foo': {'bar': [1], 'baz': {2}}, 'atomic': [3]}
+
+
+def test_freeze_atomic():
+    frozen = freeze_metadata({'atomic': atomic({'foo': [1]})})
+    assert isinstance(frozen['atomic'], _Atomic)
+    with raises(TypeError):
+        frozen['atomic']['bar'] = 2
+    with raises(TypeError):
+        frozen['atomic']['foo'].append(2)
+    copied = frozen['atomic'].copy()
+    copied['bar'] = 2
+    assert isinstance(copied, _Atomic)
+    assert merge_dict({'atomic': {'baz': 3}}, frozen) == {'atomic': {'foo': [1]}}
+
+
+def test_freeze_foreign_frozen():
+    foreign = FrozenDict({'foo': {'bar': [1]}})
+    frozen = freeze_metadata(foreign)
+    with raises(TypeError):
+        frozen['foo']['bar'].append(2)
+    assert foreign['foo']['bar'] == [1]
+
+
+def test_freeze_frozen_is_noop():
+    frozen = freeze_metadata({'foo': {'bar': [1], 'baz': ({2},)}, 'atomic': atomic([3])})
+    assert freeze_metadata(frozen) is frozen
+
+
+def test_metadata_items_to_json():
+    metadata = {
+        'empty': {},
+        'fault': Fault('test', lambda: "secret"),
+        'nested': {'list': [1, {'two': None}], 'set': {'b', 'a'}},
+        'tuple': (True, "\n"),
+        'ünicode': "ü",
+    }
+    fragment_cache = {}
+    for i in range(2):
+        assert metadata_items_to_json(
+            [(key, value, True) for key, value in sorted(metadata.items())],
+            fragment_cache,
+        ) == metadata_to_json(metadata)
+    assert len(fragment_cache) == 3
+    assert metadata_items_to_json([], {}) == metadata_to_json({})
@@ -0,0 +1,192 @@
+from random import Random
+from threading import Thread
+
+from bundlewrap.metagen import _topological_ranks, PathSet
+from bundlewrap.repo import Repository
+from bundlewrap.utils import list_starts_with
+from bundlewrap.utils.testing import make_repo
+
+
+def test_ranks_chain():
+    ranks = _topological_ranks({
+        'c': set(),
+        'b': {'c'},
+        'a': {'b'},
+    })
+    assert ranks['a'] < ranks['b'] < ranks['c']
+
+
+def test_ranks_cycle():
+    ranks = _topological_ranks({
+        'a': {'b'},
+        'b': {'c'},
+        'c': {'b', 'd'},
+        'd': set(),
+        'e': {'a'},
+    })
+    assert ranks['b'] == ranks['c']
+    assert ranks['e'] < ranks['a'] < ranks['b'] < ranks['d']
+
+
+def test_ranks_unknown_successor():
+    ranks = _topological_ranks({'a': {'b'}})
+    assert ranks['a'] < ranks['b']
+
+
+def test_pathset_add():
+    s = PathSet()
+    assert s.add(("foo", "bar"))
+    assert s.add(("foo", "baz", "frob"))
+    assert not s.add(("foo", "bar", "baz"))
+    assert set(s) == {("foo", "bar"), ("foo", "baz", "frob")}
+    assert s.add(("foo",))
+    assert set(s) == {("foo",)}
+    assert len(s) == 1
+
+
+def test_pathset_covers():
+    s = PathSet([("foo", "bar"), ("baz",)])
+    assert s.covers(("foo", "bar"))
+    assert s.covers(("foo", "bar", "baz"))
+    assert s.covers(("baz", "foo"))
+    assert not s.covers(("foo",))
+    assert not s.covers(("foo", "baz"))
+    assert not s.covers(())
+
+
+def test_pathset_empty_path():
+    s = PathSet([("foo", "bar")])
+    assert s.add(())
+    assert set(s) == {()}
+    assert s.covers(("anything",))
+    assert not s.add(("foo",))
+
+
+class _ListPathSet:
+    """
+    The previous implementation of PathSet, kept for comparison.
+    """
+    def __init__(self):
+        self._covers_cache = {}
+        self._paths = set()
+
+    def add(self, new_path):
+        if self.covers(new_path):
+            return False
+        for existing_path in self._paths.copy():
+            if list_starts_with(existing_path, new_path):
+                self._paths.remove(existing_path)
+        self._covers_cache = {}
+        self._paths.add(new_path)
+        return True
+
+    def covers(self, candidate_path):
+        try:
+            return self._covers_cache[candidate_path]
+        except KeyError:
+            result = False
+            for existing_path in self._paths:
+                if list_starts_with(candidate_path, existing_path):
+                    result = True
+                    break
+            self._covers_cache[candidate_path] = result
+            return result
+
+
+def test_pathset_random():
+    rng = Random(4711)
+    paths = [
+        ("node{}".format(rng.randrange(300)),) + tuple(
+            "key{}".format(rng.randrange(50))
+            for i in range(rng.randrange(1, 6))
+        )
+        for i in range(3000)
+    ]
+
+    def workload(pathset):
+        results = []
+        for path in paths:
+            results.append(pathset.add(path))
+            results.append(pathset.covers(path[:-1]))
+        return results, set(pathset._paths)
+
+    assert workload(PathSet()) == workload(_ListPathSet())
+
+
+def test_completed_paths_not_read_while_revising(tmpdir):
+    make_repo(tmpdir, bundles={"bundle1": {}}, nodes={"node1": {
+        'bundles': ["bundle1"],
+        'metadata': {'foo': 1},
+    }})
+    with open(tmpdir.join("bundles", "bundle1", "metadata.py"), 'w') as f:
+        f.write("""
+@metadata_reactor
+def bar(metadata):
+    return {'bar': metadata.get('foo') + 1}
+""")
+    repo = Repository(str(tmpdir))
+    proxy = repo.get_node("node1").metadata
+    assert proxy.get('bar') == 2
+    assert not proxy._revising
+
+    results = []
+    reader = Thread(target=lambda: results.append(proxy.get('bar')))
+    with repo._node_metadata_lock:
+        proxy._revising = True
+        reader.start()
+        reader.join(0.1)
+        assert reader.is_alive()
+        proxy._revising = False
+    reader.join()
+    assert results == [2]
+
+
+def test_independent_nodes_run_concurrently(tmpdir):
+    make_repo(tmpdir, bundles={"bundle1": {}}, nodes={
+        "node1": {'bundles': ["bundle1"], 'metadata': {'foo': 1}},
+        "node2": {'bundles': ["bundle1"], 'metadata': {'foo': 2}},
+    })
+    with open(tmpdir.join("libs", "sync.py"), 'w') as f:
+        f.write("""
+from threading import Barrier
+barrier = Barrier(2, timeout=10)
+""")
+    with open(tmpdir.join("bundles", "bundle1", "metadata.py"), 'w') as f:
+        f.write("""
+@metadata_reactor
+def bar(metadata):
+    foo = metadata.get('foo')
+    # only passes if both nodes' reactors run at the same time
+    repo.libs.sync.barrier.wait()
+    return {'bar': foo + 1}
+""")
+    repo = Repository(str(tmpdir))
+    repo._metadata_workers = 2
+    repo._build_metadata_for_nodes(repo.nodes)
+    assert repo.get_node("node1").metadata.get('bar') == 2
+    assert repo.get_node("node2").metadata.get('bar') == 3
+
+
+def test_reactor_leaving_its_node_group(tmpdir):
+    make_repo(tmpdir, bundles={"bundle1": {}, "bundle2": {}}, nodes={
+        "node1": {'bundles': ["bundle1"], 'metadata': {'foo': 1}},
+        "node2": {'bundles': ["bundle2"], 'metadata': {'foo': 2}},
+    })
+    with open(tmpdir.join("bundles", "bundle1", "metadata.py"), 'w') as f:
+        f.write("""
+@metadata_reactor
+def bar(metadata):
+    return {'bar': metadata.get('foo') + repo.get_node("node2").metadata.get('bar')}
+""")
+    with open(tmpdir.join("bundles", "bundle2", "metadata.py"), 'w') as f:
+        f.write("""
+@metadata_reactor
+def bar(metadata):
+    return {'bar': metadata.get('foo') * 10}
+""")
+    repo = Repository(str(tmpdir))
+    repo._metadata_workers = 2
+    repo._build_metadata_for_nodes(repo.nodes)
+    assert repo.get_node("node1").metadata.get('bar') == 21
+    assert repo.get_node("node2").metadata.get('bar') == 20
+    assert repo._node_groups
@@ -237,3 +237,148 @@ def test_as_blame():
         ('something', 'a_value'): ['base'],
         ('something', 'another_value'): ['unrelated'],
     }
+
+
+def test_materialized_get():
+    stack = Metastack(materialized=True)
+    stack.set_layer(0, 'base', {'something': {'a_list': [1, 2], 'a_value': 5}})
+    stack.set_layer(0, 'overlay', {'something': {'a_list': [3]}})
+    assert sorted(stack.get(('something', 'a_list'))) == [1, 2, 3]
+    assert stack.get(('something', 'a_value')) == 5
+    with raises(MetadataUnavailable):
+        stack.get(('something', 'a_value', 'deeper'))
+    with raises(MetadataUnavailable):
+        stack.get(('nothing',))
+
+
+def test_materialized_set_layer():
+    stack = Metastack(materialized=True)
+    stack.set_layer(0, 'base', {'foo': {'bar': 1}, 'baz': 2})
+    stack.cache_partition(0)
+    stack.set_layer(1, 'reactor', {'foo': {'frob': 3}})
+    assert stack.get(('foo',)) == {'bar': 1, 'frob': 3}
+    stack.set_layer(1, 'reactor', {'foo': {'frob': 4}})
+    assert stack.get(('foo',)) == {'bar': 1, 'frob': 4}
+    stack.set_layer(1, 'reactor', {'new': 5})
+    assert stack.get(('foo',)) == {'bar': 1}
+    assert stack.get(('new',)) == 5
+    assert stack.pop_layer(1, 'reactor') == {'new': 5}
+    with raises(MetadataUnavailable):
+        stack.get(('new',))
+    assert stack.get(()) == {'foo': {'bar': 1}, 'baz': 2}
+
+
+def test_materialized_atomic():
+    for materialized in (False, True):
+        stack = Metastack(materialized=materialized)
+        stack.set_layer(0, 'overlay', {'foo': atomic({'bar': 1})})
+        stack.set_layer(1, 'reactor', {'foo': {'baz': 2}})
+        assert stack.get(('foo',)) == {'bar': 1}
+        assert stack.get(('foo', 'bar')) == 1
+        assert stack.get(('foo', 'baz')) == 2
+
+
+def test_materialized_atomic_partial_path():
+    for materialized, frozen in ((False, False), (True, False), (True, True)):
+        stack = Metastack(materialized=materialized, frozen=frozen)
+        stack.set_layer(0, 'b', {'x': atomic({'z': 2})})
+        stack.set_layer(2, 'a', {'x': {'y': 1, 'nested': {'p': 1}}})
+        assert stack.get(('x',)) == {'z': 2}
+        assert stack.get(('x', 'y')) == 1
+        assert stack.get(('x', 'z')) == 2
+        assert stack.get(('x', 'nested', 'p')) == 1
+        with raises(MetadataUnavailable):
+            stack.get(('x', 'nope'))
+
+        stack = Metastack(materialized=materialized, frozen=frozen)
+        stack.set_layer(0, 'b', {'x': {'y': atomic({'q': 2})}})
+        stack.set_layer(2, 'a', {'x': {'y': {'p': 1}}})
+        assert stack.get(('x', 'y')) == {'q': 2}
+        assert stack.get(('x', 'y', 'p')) == 1
+
+        stack = Metastack(materialized=materialized, frozen=frozen)
+        stack.set_layer(0, 'b', {'x': 5})
+        stack.set_layer(2, 'a', {'x': {'y': 1}})
+        assert stack.get(('x',)) == 5
+        assert stack.get(('x', 'y')) == 1
+
+
+def test_materialized_deepcopy():
+    stack = Metastack(materialized=True)
+    stack.set_layer(0, 'base', {'foo': {'bar': {1, 2, 3}}})
+    foo = stack.get(('foo',))
+    foo['bar'].add(4)
+    assert stack.get(('foo', 'bar')) == {1, 2, 3}
+
+
+def test_frozen():
+    stack = Metastack(materialized=True, frozen=True)
+    stack.set_layer(0, 'base', {'foo': {'bar': {1, 2, 3}, 'baz': [1]}})
+    foo = stack.get(('foo',))
+    with raises(TypeError):
+        foo['bar'].add(4)
+    with raises(TypeError):
+        foo['baz'].append(2)
+    with raises(TypeError):
+        del foo['bar']
+    assert stack.get(('foo',)) is foo
+    assert stack.get(('foo', 'bar')) == {1, 2, 3}
+
+
+def test_frozen_copy():
+    stack = Metastack(frozen=True)
+    stack.set_layer(0, 'base', {'foo': {'bar': {1, 2, 3}}})
+    foo = stack.get(('foo',)).copy()
+    foo['baz'] = 4
+    bar = foo['bar'].copy()
+    bar.add(4)
+    assert stack.get(('foo',)) == {'bar': {1, 2, 3}}
+
+
+def test_frozen_merge():
+    stack = Metastack(materialized=True, frozen=True)
+    stack.set_layer(0, 'base', {'foo': {'bar': {1, 2}}})
+    stack.set_layer(1, 'reactor', {'foo': stack.get(('foo',))})
+    stack.set_layer(2, 'defaults', {'foo': {'bar': {3}, 'baz': [1]}})
+    assert stack.get(('foo',)) == {'bar': {1, 2, 3}, 'baz': [1]}
+
+
+def test_top_level_items():
+    group = {'shared': {'a': 1}}
+    stack = Metastack(materialized=True)
+    stack.set_layer(0, 'group', group)
+    stack.set_layer(0, 'node', {'merged': {'b': 2}})
+    stack.set_layer(1, 'reactor', {'merged': {'c': 3}, 'reactor': 4})
+    stack.set_layer(2, 'defaults', {'default': 5})
+    items = list(stack.top_level_items())
+    assert items == [
+        ('default', 5, True),
+        ('merged', {'b': 2, 'c': 3}, False),
+        ('reactor', 4, False),
+        ('shared', {'a': 1}, True),
+    ]
+    assert items[3][1] is group['shared']
+
+
+def test_cache_partition_merged_prefix():
+    groups = [
+        {'list': [1], 'clash': [1], 'dict': {'a': 1}, 'groups_only': {'b': [2]}},
+        {'list': atomic([2]), 'clash': "two", 'dict': {'a': 2}, 'groups_only': {'b': [3]}},
+    ]
+    node = {'list': [3], 'clash': [3], 'dict': atomic({'c': 3})}
+
+    expected_stack = Metastack()
+    for index, group in enumerate(groups):
+        expected_stack.set_layer(0, f"group{index}", group)
+    merged_prefix = expected_stack.as_dict(partitions=[0])
+    expected_stack.set_layer(0, 'node', node)
+    expected_stack.cache_partition(0)
+
+    stack = Metastack()
+    for index, group in enumerate(groups):
+        stack.set_layer(0, f"group{index}", group)
+    stack.set_layer(0, 'node', node)
+    stack.cache_partition(0, merged_prefix=merged_prefix)
+
+    assert stack.as_dict() == expected_stack.as_dict()
+    assert stack.get(('groups_only', 'b')) == [2, 3]
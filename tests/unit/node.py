@@ -0,0 +1,33 @@
+from asyncio import ensure_future, run as asyncio_run, sleep as asyncio_sleep
+from threading import Thread
+
+from bundlewrap import operations
+from bundlewrap.repo import Repository
+from bundlewrap.utils.testing import make_repo
+
+
+def test_run_async_waits_for_first_connection(tmpdir, monkeypatch):
+    make_repo(tmpdir, nodes={"node1": {'os': "linux"}})
+    node = Repository(str(tmpdir)).get_node("node1")
+    commands = []
+
+    async def run_async(hostname, command, **kwargs):
+        commands.append(command)
+
+    monkeypatch.setattr(operations, 'run_async', run_async)
+
+    async def wait():
+        node._ssh_first_conn_lock.acquire()
+        waiter = ensure_future(node.run_async("foo"))
+        await asyncio_sleep(0.1)
+        assert not waiter.done()
+        assert commands == []
+        node._ssh_conn_established = True
+        releaser = Thread(target=node._release_ssh_first_conn_lock)
+        releaser.start()
+        await waiter
+        releaser.join()
+
+    asyncio_run(wait())
+    assert commands == ["foo"]
+    assert node._ssh_first_conn_waiters == []
@@ -0,0 +1,322 @@
+from asyncio import ensure_future, run as asyncio_run, sleep as asyncio_sleep
+from io import BytesIO
+from os import listdir, stat
+from os.path import exists, join
+from stat import S_IMODE
+from threading import Thread
+from time import sleep
+
+from bundlewrap import operations
+from bundlewrap.exceptions import RemoteException, TransportException
+from bundlewrap.operations import (
+    download,
+    close_persistent_shells,
+    PersistentShell,
+    PERSISTENT_SHELLS,
+    run_local,
+    run_local_async,
+    run_many,
+    run_persistent,
+    SessionLimiter,
+    upload,
+    upload_many,
+)
+from pytest import raises
+
+
+def test_persistent_shell():
+    shell = PersistentShell(["sh"])
+    try:
+        result = shell.run("echo out; echo err >&2; printf 'no newline'; exit 3")
+        assert result.return_code == 3
+        assert result.stdout == b"out\nno newline"
+        assert result.stderr == b"err\n"
+
+        result = shell.run("cd /; cat; echo \"it's\"")
+        assert result.return_code == 0
+        assert result.stdout == b"it's\n"
+        assert result.stderr == b""
+
+        result = shell.run("head -c 300000 /dev/zero")
+        assert result.stdout == b"\0" * 300000
+    finally:
+        shell.close()
+
+
+def test_persistent_shell_terminated():
+    shell = PersistentShell(["sh"])
+    try:
+        with raises(TransportException):
+            shell.run("kill -9 $PPID")
+    finally:
+        shell.close()
+
+
+def test_run_persistent_reuses_shell():
+    command = ["sh", "-s"]
+    first = run_persistent(command, "echo $PPID")
+    second = run_persistent(command, "echo $PPID")
+    assert first.stdout == second.stdout
+    assert len(PERSISTENT_SHELLS[tuple(command)]) == 1
+
+
+def test_run_persistent_idle_sessions(monkeypatch):
+    monkeypatch.setattr(operations, 'PERSISTENT_SHELLS', {})
+    limiter = SessionLimiter("example.com", 1, evict=operations._evict_idle_shell)
+    try:
+        first = run_persistent(["sh", "-s"], "echo $PPID", limiter=limiter)
+        assert (limiter.active, limiter.idle) == (0, 1)
+        second = run_persistent(["sh", "-s"], "echo $PPID", limiter=limiter)
+        assert first.stdout == second.stdout
+        assert (limiter.active, limiter.idle) == (0, 1)
+
+        # another host behind the same jump host needs the session
+        run_persistent(["sh"], "true", limiter=limiter)
+        assert (limiter.active, limiter.idle) == (0, 1)
+        assert operations.PERSISTENT_SHELLS[("sh", "-s")] == []
+        assert len(operations.PERSISTENT_SHELLS[("sh",)]) == 1
+    finally:
+        close_persistent_shells()
+    assert limiter.idle == 0
+
+
+def test_run_local_stdin_file(tmpdir):
+    source = join(str(tmpdir), "source")
+    with open(source, 'wb') as f:
+        f.write(b"x" * 300000)
+    with open(source, 'rb') as f:
+        result = run_local(["wc", "-c"], data_stdin=f)
+    assert result.stdout.strip() == b"300000"
+
+
+def _run_locally(hostname, command, **kwargs):
+    return run_local(["sh", "-c", command], data_stdin=kwargs['data_stdin'])
+
+
+def test_upload(tmpdir, monkeypatch):
+    monkeypatch.setattr(operations, 'run', _run_locally)
+    source = join(str(tmpdir), "source")
+    target = join(str(tmpdir), "target")
+    with open(source, 'wb') as f:
+        f.write(b"content")
+    assert upload("localhost", source, target, mode="0640")
+    with open(target, 'rb') as f:
+        assert f.read() == b"content"
+    assert S_IMODE(stat(target).st_mode) == 0o640
+    assert sorted(listdir(str(tmpdir))) == ["source", "target"]
+
+
+def test_upload_failure(tmpdir, monkeypatch):
+    monkeypatch.setattr(operations, 'run', _run_locally)
+    source = join(str(tmpdir), "source")
+    target = join(str(tmpdir), "target")
+    with open(source, 'wb') as f:
+        f.write(b"content")
+    with raises(RemoteException):
+        upload("localhost", source, target, mode="not_a_mode")
+    assert not upload("localhost", source, target, mode="not_a_mode", ignore_failure=True)
+    assert listdir(str(tmpdir)) == ["source"]
+
+
+def test_upload_many(tmpdir, monkeypatch):
+    monkeypatch.setattr(operations, 'run', _run_locally)
+    files = []
+    for name, mode in (("foo", "0600"), ("bar", "0640"), ("baz/qux", "0644")):
+        source = join(str(tmpdir), "source_" + name.replace("/", "_"))
+        with open(source, 'wb') as f:
+            f.write(name.encode())
+        files.append((source, join(str(tmpdir), "target", name), mode, "", ""))
+    files.append((source, join(str(tmpdir), "target", "bad"), "not_a_mode", "", ""))
+
+    failed = upload_many("localhost", files)
+    assert list(failed) == [join(str(tmpdir), "target", "bad")]
+    assert "not_a_mode" in failed[join(str(tmpdir), "target", "bad")]
+
+    for source, target, mode, owner, group in files[:-1]:
+        with open(target, 'rb') as f:
+            assert f.read() == target.split("/target/")[1].encode()
+        assert S_IMODE(stat(target).st_mode) == int(mode, 8)
+    assert sorted(listdir(join(str(tmpdir), "target"))) == ["bar", "baz", "foo"]
+    assert listdir(join(str(tmpdir), "target", "baz")) == ["qux"]
+
+
+def test_upload_many_noisy_stdout(tmpdir, monkeypatch):
+    def run_noisily(hostname, command, **kwargs):
+        return _run_locally(hostname, "echo 0 1 banner\n" + command + "\necho 2", **kwargs)
+
+    monkeypatch.setattr(operations, 'run', run_noisily)
+    source = join(str(tmpdir), "source")
+    with open(source, 'wb') as f:
+        f.write(b"content")
+    files = [
+        (source, join(str(tmpdir), "target", "foo"), "0644", "", ""),
+        (source, join(str(tmpdir), "target", "bad"), "not_a_mode", "", ""),
+    ]
+    assert list(upload_many("localhost", files)) == [join(str(tmpdir), "target", "bad")]
+
+
+def test_run_local_async():
+    result = asyncio_run(run_local_async(
+        ["sh", "-c", "cat; echo err >&2; exit 3"],
+        data_stdin=b"in",
+    ))
+    assert result.return_code == 3
+    assert result.stdout == b"in"
+    assert result.stderr == b"err\n"
+
+
+def test_run_local_async_stdin_file(tmpdir):
+    source = join(str(tmpdir), "source")
+    with open(source, 'wb') as f:
+        f.write(b"x" * 300000)
+    with open(source, 'rb') as f:
+        result = asyncio_run(run_local_async(["wc", "-c"], data_stdin=f))
+    assert result.stdout.strip() == b"300000"
+
+
+def test_run_local_async_stderr_inherited():
+    # like an SSH ControlMaster process forked into the background
+    result = asyncio_run(run_local_async(
+        ["sh", "-c", "echo err >&2; sleep 5 >/dev/null & echo out"],
+    ))
+    assert result.duration.total_seconds() < 4
+    assert result.stdout == b"out\n"
+    assert result.stderr == b"err\n"
+
+
+def test_session_limiter():
+    limiter = SessionLimiter("example.com", 4)
+    for i in range(4):
+        limiter.acquire()
+    assert limiter.active == 4
+
+    limiter.release(duration=1.0, failed=True)
+    assert limiter.limit == 2
+    limiter.release(duration=1.0, failed=True)
+    assert limiter.limit == 2  # not again right away
+    assert limiter.backoffs == 1
+
+    limiter.release(duration=1.0)
+    assert limiter.limit == 2
+    limiter.release(duration=5.0)
+    assert limiter.limit == 2  # too slow to ramp up
+    assert limiter.active == 0
+
+    limiter.acquire()
+    limiter.release(duration=1.0)
+    assert limiter.limit == 3
+    assert limiter.sessions == 5
+
+
+def test_session_limiter_waits():
+    limiter = SessionLimiter("example.com", 1)
+    limiter.acquire()
+    waiter = Thread(target=limiter.acquire)
+    waiter.start()
+    sleep(0.1)
+    assert limiter.active == 1
+    limiter.release()
+    waiter.join()
+    assert limiter.active == 1
+    assert limiter.queued == 1
+    assert limiter.wait_total >= 0.1
+
+
+def test_session_limiter_waits_async():
+    limiter = SessionLimiter("example.com", 1)
+    limiter.acquire()
+
+    async def wait():
+        waiter = ensure_future(limiter.acquire_async())
+        await asyncio_sleep(0.1)
+        assert not waiter.done()
+        Thread(target=limiter.release).start()
+        await waiter
+
+    asyncio_run(wait())
+    assert limiter.active == 1
+    assert limiter.queued == 1
+    assert limiter.waiting == 0
+
+
+def test_run_local_stdout_file(tmpdir):
+    target = join(str(tmpdir), "target")
+    with open(target, 'wb') as f:
+        result = run_local(["sh", "-c", "head -c 300000 /dev/zero; echo err >&2"], stdout_file=f)
+    assert result.stdout == b""
+    assert result.stderr == b"err\n"
+    assert stat(target).st_size == 300000
+
+
+def test_run_local_output_spooled(monkeypatch):
+    monkeypatch.setattr(operations, 'OUTPUT_MEMORY_LIMIT', 1000)
+    result = run_local(["head", "-c", "300000", "/dev/zero"])
+    spool = result._stdout
+    assert spool._rolled
+    assert result.stdout == b"\0" * 300000
+    assert spool.closed
+    assert result.stdout == b"\0" * 300000
+
+
+def test_run_result_close(monkeypatch):
+    monkeypatch.setattr(operations, 'OUTPUT_MEMORY_LIMIT', 1000)
+    result = run_local(["sh", "-c", "head -c 300000 /dev/zero; echo err >&2"])
+    stdout_spool = result._stdout
+    stderr_spool = result._stderr
+    result.close()
+    assert stdout_spool.closed
+    assert stderr_spool.closed
+    assert result.return_code == 0
+
+
+def test_download(tmpdir, monkeypatch):
+    def run_locally(hostname, command, **kwargs):
+        return run_local(["sh", "-c", command], stdout_file=kwargs['stdout_file'])
+
+    monkeypatch.setattr(operations, 'run', run_locally)
+    source = join(str(tmpdir), "source")
+    target = join(str(tmpdir), "target")
+    with open(source, 'wb') as f:
+        f.write(b"content")
+    download("localhost", source, target)
+    with open(target, 'rb') as f:
+        assert f.read() == b"content"
+
+    with raises(RemoteException):
+        download("localhost", join(str(tmpdir), "missing"), target)
+    assert not exists(target)
+
+
+def test_download_compressed(tmpdir, monkeypatch):
+    def run_locally(hostname, command, **kwargs):
+        return run_local(["sh", "-c", command], stdout_file=kwargs['stdout_file'])
+
+    monkeypatch.setattr(operations, 'run', run_locally)
+    source = join(str(tmpdir), "source")
+    with open(source, 'wb') as f:
+        f.write(b"content\n" * 100000)
+    target = BytesIO()
+    download("localhost", source, target, compress=True)
+    assert target.getvalue() == b"content\n" * 100000
+
+
+def test_run_many(monkeypatch):
+    commands = []
+
+    def run_locally(hostname, command, **kwargs):
+        commands.append(command)
+        return run_local(["sh", "-c", command])
+
+    monkeypatch.setattr(operations, 'run', run_locally)
+    results = run_many(
+        "localhost",
+        ["echo foo", "printf bar; echo baz >&2; exit 3", "true", "cat"],
+        ignore_failure=True,
+    )
+    assert len(commands) == 1
+    assert [result.return_code for result in results] == [0, 3, 0, 0]
+    assert [result.stdout for result in results] == [b"foo\n", b"bar", b"", b""]
+    assert [result.stderr for result in results] == [b"", b"baz\n", b"", b""]
+
+    with raises(RemoteException):
+        run_many("localhost", ["true", "false"])
@@ -0,0 +1,80 @@
+from bundlewrap.utils.pathindex import PathIndex
+from pytest import raises
+
+
+class FakeItem:
+    def __init__(self, item_type, name, paths=None):
+        self.ITEM_TYPE_NAME = item_type
+        self.name = name
+        self.paths = (name,) if paths is None else paths
+
+    def __repr__(self):
+        return f"{self.ITEM_TYPE_NAME}:{self.name}"
+
+    def get_indexed_paths(self):
+        return self.paths
+
+
+def _names(items):
+    return sorted(item.name for item in items)
+
+
+ITEMS = [
+    FakeItem("directory", "/"),
+    FakeItem("directory", "/etc"),
+    FakeItem("file", "/etc/foo.conf"),
+    FakeItem("directory", "/etc/foo.d"),
+    FakeItem("file", "/etc/foo.d/bar.conf"),
+    FakeItem("symlink", "/etc/foo.d/baz.conf"),
+    FakeItem("zfs_dataset", "tank/etc", paths=("/etc",)),
+    FakeItem("user", "jdoe", paths=()),
+    FakeItem("group", "jdoe", paths=()),
+]
+
+
+def test_iter():
+    index = PathIndex(ITEMS)
+    assert len(index) == len(ITEMS)
+    assert list(index) == ITEMS
+    assert ITEMS[0] in index
+
+
+def test_get():
+    index = PathIndex(ITEMS)
+    assert index.get("user", "jdoe") is ITEMS[7]
+    assert index.get("group", "jdoe") is ITEMS[8]
+    assert index.get("user", "root") is None
+    assert _names(index.items_of_type("directory")) == ["/", "/etc", "/etc/foo.d"]
+    assert index.items_of_type("pkg_apt") == ()
+
+
+def test_items_above():
+    index = PathIndex(ITEMS)
+    assert _names(index.items_above("/etc/foo.d/bar.conf")) == \
+        ["/", "/etc", "/etc/foo.d", "tank/etc"]
+    assert _names(index.items_above("/etc/")) == ["/"]
+    assert _names(index.items_above("/var/lib/foo")) == ["/"]
+    assert index.items_above("/") == []
+
+
+def test_items_at():
+    index = PathIndex(ITEMS)
+    assert _names(index.items_at("/etc")) == ["/etc", "tank/etc"]
+    assert _names(index.items_at("/etc/foo.d/")) == ["/etc/foo.d"]
+    assert index.items_at("/var") == []
+
+
+def test_items_below():
+    index = PathIndex(ITEMS)
+    assert _names(index.items_below("/etc/foo.d")) == \
+        ["/etc/foo.d/bar.conf", "/etc/foo.d/baz.conf"]
+    assert len(index.items_below("/")) == 6
+    assert index.items_below("/etc/foo.conf") == []
+    assert index.items_below("/var") == []
+
+
+def test_relative_path():
+    with raises(ValueError):
+        PathIndex([FakeItem("file", "etc/foo")])
+    with raises(ValueError):
+        PathIndex(ITEMS).items_above("etc/foo")
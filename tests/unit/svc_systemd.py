@@ -0,0 +1,68 @@
+from bundlewrap.items.svc_systemd import svc_all_states, svc_unit_name
+from bundlewrap.operations import RunResult
+
+
+class FakeNode:
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.commands = []
+
+    def run_many(self, commands, may_fail=False):
+        self.commands.append(commands)
+        results = []
+        for command in commands:
+            result = RunResult()
+            result.stdout, result.return_code = self.outputs[command.split()[1]]
+            result.stderr = b""
+            results.append(result)
+        return results
+
+
+def test_unit_name():
+    assert svc_unit_name("ssh") == "ssh.service"
+    assert svc_unit_name("php7.4-fpm") == "php7.4-fpm.service"
+    assert svc_unit_name("apt-daily.timer") == "apt-daily.timer"
+    assert svc_unit_name("getty@tty1.service") == "getty@tty1.service"
+
+
+def test_all_states():
+    node = FakeNode({
+        'list-unit-files': (
+            b"apt-daily.timer            enabled         enabled\n"
+            b"getty@.service             enabled         enabled\n"
+            b"ssh.service                enabled         enabled\n"
+            b"sshd.service               alias           -\n"
+            b"rsync.service              masked          enabled\n",
+            0,
+        ),
+        'list-units': (
+            b"apt-daily.timer loaded active waiting Daily apt download activities\n"
+            b"getty@tty1.service loaded active running Getty on tty1\n"
+            b"rsync.service masked inactive dead rsync.service\n"
+            b"ssh.service loaded active running OpenBSD Secure Shell server\n",
+            0,
+        ),
+    })
+    unit_file_states, active_states = svc_all_states(node)
+    assert len(node.commands) == 1
+    assert unit_file_states == {
+        'apt-daily.timer': "enabled",
+        'getty@.service': "enabled",
+        'rsync.service': "masked",
+        'ssh.service': "enabled",
+        'sshd.service': "alias",
+    }
+    assert active_states == {
+        'apt-daily.timer': "active",
+        'getty@tty1.service': "active",
+        'rsync.service': "inactive",
+        'ssh.service': "active",
+    }
+
+
+def test_all_states_unsupported():
+    node = FakeNode({
+        'list-unit-files': (b"", 127),
+        'list-units': (b"", 127),
+    })
+    assert svc_all_states(node) == ({}, {})
@@ -0,0 +1,73 @@
+from bundlewrap.items.users import _fetch_user_database, _groups_for_user
+from bundlewrap.node import Node
+from bundlewrap.operations import RunResult
+
+
+FILES = {
+    "/etc/group": (
+        b"root:x:0:\n"
+        b"adm:x:4:syslog,jdoe\n"
+        b"jdoe:x:1000:jdoe\n"
+        b"wheel:x:10:jdoe\n"
+        b"users:x:100:\n"
+    ),
+    "/etc/nsswitch.conf": (
+        b"passwd:         files systemd\n"
+        b"group:          files systemd  # local only\n"
+    ),
+    "/etc/passwd": (
+        b"root:x:0:0:root:/root:/bin/bash\n"
+        b"jdoe:x:1000:1000:John Doe,,,:/home/jdoe:/bin/zsh\n"
+    ),
+    "/etc/shadow": (
+        b"root:*:19000:0:99999:7:::\n"
+        b"jdoe:$6$foo:19000:0:99999:7:::\n"
+    ),
+}
+
+
+class FakeNode:
+    OS_FAMILY_BSD = Node.OS_FAMILY_BSD
+    name = "fakenode"
+    os = 'linux'
+
+    def __init__(self, files):
+        self.files = files
+        self.commands = []
+
+    def run_many(self, commands, may_fail=False):
+        self.commands.append(commands)
+        results = []
+        for command in commands:
+            result = RunResult()
+            path = command.split()[1]
+            result.return_code = 0 if path in self.files else 1
+            result.stdout = self.files.get(path, b"")
+            result.stderr = b""
+            results.append(result)
+        return results
+
+
+def test_fetch_user_database():
+    node = FakeNode(FILES)
+    user_database = _fetch_user_database(node)
+    assert len(node.commands) == 1
+    assert user_database['passwd']['jdoe'] == "jdoe:x:1000:1000:John Doe,,,:/home/jdoe:/bin/zsh"
+    assert user_database['shadow']['jdoe'].split(":")[1] == "$6$foo"
+    assert user_database['groups']['wheel'] == "wheel:x:10:jdoe"
+    assert user_database['group_names_by_gid']['100'] == "users"
+    assert user_database['local_groups_only']
+
+
+def test_groups_for_user():
+    user_database = _fetch_user_database(FakeNode(FILES))
+    assert sorted(_groups_for_user(user_database, "jdoe", "1000")) == ["adm", "wheel"]
+    assert _groups_for_user(user_database, "root", "0") == []
+
+
+def test_fetch_user_database_nss():
+    files = FILES.copy()
+    files["/etc/nsswitch.conf"] = b"group: files ldap\n"
+    assert not _fetch_user_database(FakeNode(files))['local_groups_only']
+    del files["/etc/nsswitch.conf"]
+    assert not _fetch_user_database(FakeNode(files))['local_groups_only']
@@ -0,0 +1,116 @@
+from os import mkdir, symlink
+from os.path import join
+
+from bundlewrap.exceptions import RemoteException
+from bundlewrap.node import Node
+from bundlewrap.operations import run_local
+from bundlewrap.utils.remote import (
+    cached_remote_state,
+    forget_remote_state,
+    PathInfo,
+    prefetch_path_info,
+    RemoteStateCache,
+)
+
+
+class LocalNode:
+    OS_FAMILY_BSD = Node.OS_FAMILY_BSD
+    name = "localnode"
+    os = 'linux'
+
+    def __init__(self):
+        self._prefetched_path_info = {}
+        self._remote_state = RemoteStateCache()
+        self.commands = []
+
+    def run(self, command, may_fail=False):
+        self.commands.append(command)
+        result = run_local(["sh", "-c", command])
+        if result.return_code != 0 and not may_fail:
+            raise RemoteException(result.stderr)
+        return result
+
+
+def _path_info_attrs(path_info):
+    attrs = {'stat': path_info.stat}
+    if not path_info.exists:
+        return attrs
+    if path_info.is_file:
+        attrs['sha256'] = path_info.sha256
+    if path_info.is_symlink:
+        attrs['symlink_target'] = path_info.symlink_target
+    return attrs
+
+
+def test_prefetch_path_info(tmpdir):
+    paths = [
+        join(str(tmpdir), "dir"),
+        join(str(tmpdir), "empty"),
+        join(str(tmpdir), "file with spaces\nand a newline"),
+        join(str(tmpdir), "link"),
+        join(str(tmpdir), "missing"),
+        join(str(tmpdir), "back\\slash"),
+    ]
+    mkdir(paths[0])
+    open(paths[1], 'w').close()
+    with open(paths[2], 'w') as f:
+        f.write("foo")
+    symlink("dir", paths[3])
+    with open(paths[5], 'w') as f:
+        f.write("bar")
+
+    node = LocalNode()
+    expected = {path: _path_info_attrs(PathInfo(node, path)) for path in paths}
+
+    node.commands = []
+    prefetch_path_info(node, paths)
+    assert len(node.commands) == 1
+    for path in paths:
+        assert _path_info_attrs(PathInfo(node, path)) == expected[path]
+    assert len(node.commands) == 1
+
+    forget_remote_state(node)
+    PathInfo(node, paths[0])
+    assert len(node.commands) == 2
+
+
+def test_cached_remote_state():
+    node = LocalNode()
+
+    def fetch(node):
+        return node.run("echo foo").stdout
+
+    assert cached_remote_state(node, "foo", fetch) == b"foo\n"
+    assert cached_remote_state(node, "foo", fetch) == b"foo\n"
+    assert len(node.commands) == 1
+
+    forget_remote_state(node)
+    assert cached_remote_state(node, "foo", fetch) == b"foo\n"
+    assert len(node.commands) == 2
+
+
+def test_cached_remote_state_forgotten_while_fetching():
+    node = LocalNode()
+
+    def fetch(node):
+        forget_remote_state(node)
+        return len(node.commands)
+
+    assert cached_remote_state(node, "foo", fetch) == 0
+    node.commands.append("bar")
+    assert cached_remote_state(node, "foo", fetch) == 1
+
+
+def test_prefetch_path_info_forgotten_while_fetching(tmpdir):
+    path = join(str(tmpdir), "file")
+    open(path, 'w').close()
+
+    class ForgetfulNode(LocalNode):
+        def run(self, command, may_fail=False):
+            result = super().run(command, may_fail=may_fail)
+            forget_remote_state(self)
+            return result
+
+    node = ForgetfulNode()
+    prefetch_path_info(node, [path])
+    assert node._prefetched_path_info == {}